@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Time-partitioned archive databases for the history tables
+
+Rows of inventory_history and warehouse_inventory_history_v2 older than a
+configurable horizon are moved out of inventory.db into monthly or quarterly
+archive files (inventory_archive_2025Q1.db, inventory_archive_2025-01.db).
+A catalogue table in the hot DB (history_archives) records every archive with
+its date range, so readers ATTACH only the archives a requested window
+overlaps and query them through a TEMP union view.
+
+Archiving a period is idempotent. Rows are copied into the archive with
+INSERT OR REPLACE (a re-run refreshes a stale copy), then one IMMEDIATE
+transaction on the hot DB deletes the rows that have an identical archived
+copy, checks that none of the period is left, and updates the catalogue. A
+row inserted or updated after the copy fails that check: the transaction
+rolls back and the period is copied again (ARCHIVE_ROUNDS times at most).
+"""
+
+import os
+import sys
+import sqlite3
+import logging
+import argparse
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from database_safety import get_database_manager, run_with_busy_retry
+from day_keys import DAY_KEY_COLUMN, DAY_KEY_TABLES, day_key_ready, day_key_sql, has_day_key
+
+DEV_MODE = os.getenv('DEV_MODE', 'false').lower() == 'true'
+DB_PATH = './BourbonDatabase/inventory.db' if DEV_MODE else '/opt/BourbonDatabase/inventory.db'
+DEFAULT_HORIZON_DAYS = 400
+DEFAULT_GRANULARITY = 'quarterly'
+
+CATALOGUE_TABLE = 'history_archives'
+ARCHIVE_ROUNDS = 3  # copy + move attempts per period while rows in it keep changing
+
+# date column drives partitioning and is indexed in each archive, as are the key columns
+ARCHIVE_TABLES = {
+    'warehouse_inventory_history_v2': {'date_column': 'check_date', 'index_columns': ('nc_code', 'check_date')},
+    'inventory_history': {'date_column': 'check_time', 'index_columns': ('plu', 'check_time')},
+}
+
+logger = logging.getLogger('archive_history')
+
+CATALOGUE_SQL = f"""
+CREATE TABLE IF NOT EXISTS {CATALOGUE_TABLE} (
+  table_name TEXT NOT NULL,
+  period TEXT NOT NULL,
+  archive_file TEXT NOT NULL,
+  from_date TEXT NOT NULL,
+  to_date TEXT NOT NULL,
+  row_count INTEGER NOT NULL,
+  archived_at TEXT NOT NULL,
+  PRIMARY KEY (table_name, period)
+);
+"""
+
+
+# ------------------ Periods ------------------
+def period_for(d: date, granularity: str):
+    """(label, first_day, first_day_of_next_period)"""
+    if granularity == 'monthly':
+        start = date(d.year, d.month, 1)
+        label = f"{d.year}-{d.month:02d}"
+        months = 1
+    else:
+        q = (d.month - 1) // 3
+        start = date(d.year, q * 3 + 1, 1)
+        label = f"{d.year}Q{q + 1}"
+        months = 3
+    m = start.month - 1 + months
+    nxt = date(start.year + m // 12, m % 12 + 1, 1)
+    return label, start, nxt
+
+
+def archive_filename(label: str) -> str:
+    return f"inventory_archive_{label}.db"
+
+
+# ------------------ Reader side ------------------
+def list_archives(conn, table: str, start_date: str, end_date: str):
+    """Catalogue entries for `table` whose range overlaps [start_date, end_date]"""
+    try:
+        return conn.execute(
+            f"SELECT period, archive_file FROM {CATALOGUE_TABLE} "
+            f"WHERE table_name = ? AND from_date <= ? AND to_date >= ? ORDER BY from_date",
+            [table, end_date[:10], start_date[:10]]).fetchall()
+    except sqlite3.OperationalError:
+        return []
+
+
+def window_view_name(table: str) -> str:
+    return f"{table}_with_archives"
+
+
+def _archive_column(name, have, table, day_keys_ready=True):
+    """
+    Select expression for a hot-table column in an archive written before the
+    column existed; day_key is computed while the archive's backfill is unfinished
+    """
+    if name in have and (name != DAY_KEY_COLUMN or day_keys_ready):
+        return f'"{name}"'
+    if name == DAY_KEY_COLUMN and ARCHIVE_TABLES.get(table, {}).get('date_column') in have:
+        return f"{day_key_sql(ARCHIVE_TABLES[table]['date_column'])} AS {DAY_KEY_COLUMN}"
+    return f'NULL AS "{name}"'
+
+
+def attach_archives(conn, db_path, table: str, archives):
+    """
+    ATTACH the given archives read-only and create a TEMP view that unions the
+    hot table with them. Returns the name to query in place of `table`.
+    The connection must have been opened with uri=True.
+    """
+    if not archives:
+        return table
+    limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) if hasattr(conn, 'getlimit') else 10
+    if len(archives) > limit:
+        raise RuntimeError(f"Window overlaps {len(archives)} archives but SQLite allows {limit} attachments; "
+                           f"use a coarser archive granularity")
+    names = [r[1] for r in conn.execute(f'PRAGMA main.table_info("{table}")')]
+    base_dir = Path(db_path).resolve().parent
+    cols = ', '.join(f'"{c}"' for c in names)
+    selects = [f"SELECT {cols} FROM main.{table}"]
+    for i, (_, archive_file) in enumerate(archives):
+        alias = f"arch_{i}"
+        uri = f"{(base_dir / archive_file).resolve().as_uri()}?mode=ro"
+        conn.execute("ATTACH DATABASE ? AS " + alias, [uri])
+        have = {r[1] for r in conn.execute(f'PRAGMA {alias}.table_info("{table}")')}
+        ready = table in DAY_KEY_TABLES and day_key_ready(conn, table, alias)
+        selects.append(f"SELECT {', '.join(_archive_column(c, have, table, ready) for c in names)} "
+                       f"FROM {alias}.{table}")
+    view = window_view_name(table)
+    conn.execute(f"DROP VIEW IF EXISTS temp.{view}")
+    conn.execute(f"CREATE TEMP VIEW {view} AS " + "\nUNION ALL\n".join(selects))
+    return view
+
+
+def open_history_connection(db_path, table: str, start_date: str, end_date: str, timeout=30):
+    """Convenience for Python readers: (connection, name to query) for a date window"""
+    conn = sqlite3.connect(db_path, timeout=timeout, uri=True)
+    archives = list_archives(conn, table, start_date, end_date)
+    return conn, attach_archives(conn, db_path, table, archives)
+
+
+# ------------------ Archiver ------------------
+def _archive_period(manager, db_path, table, spec, label, start, nxt):
+    date_col = spec['date_column']
+    lo, hi = start.isoformat(), nxt.isoformat()
+    in_range = f'"{date_col}" >= ? AND "{date_col}" < ?'
+    archive_file = archive_filename(label)
+    archive_path = Path(db_path).resolve().parent / archive_file
+
+    with manager.get_connection() as conn:
+        hot_count = conn.execute(f'SELECT COUNT(*) FROM {table} WHERE {in_range}', [lo, hi]).fetchone()[0]
+        if hot_count == 0:
+            return 0
+        conn.commit()
+        conn.execute("ATTACH DATABASE ? AS arch", [str(archive_path)])
+        try:
+            # Constraint-free copy of the columns (FKs to stores etc. do not exist in archives)
+            conn.execute(f"CREATE TABLE IF NOT EXISTS arch.{table} AS SELECT * FROM main.{table} WHERE 0")
+            conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS arch.ux_{table}_history_id ON {table}(history_id)")
+            idx_cols = ', '.join(f'"{c}"' for c in spec['index_columns'])
+            conn.execute(f"CREATE INDEX IF NOT EXISTS arch.idx_{table}_key_date ON {table}({idx_cols})")
+            conn.execute(f'CREATE INDEX IF NOT EXISTS arch.idx_{table}_date ON {table}("{date_col}")')
+            if has_day_key(conn, table, 'arch'):
+                for name, cols in DAY_KEY_TABLES[table]['indexes'].items():
+                    conn.execute(f"CREATE INDEX IF NOT EXISTS arch.{name} ON {table}({', '.join(cols)})")
+            # by name: an archive created before a column was added to the hot table just lacks it
+            have = {r[1] for r in conn.execute(f'PRAGMA arch.table_info("{table}")')}
+            shared = [r[1] for r in conn.execute(f'PRAGMA main.table_info("{table}")') if r[1] in have]
+            cols = ', '.join(f'"{c}"' for c in shared)
+            same = ' AND '.join(f'a."{c}" IS h."{c}"' for c in shared)
+
+            def move():
+                """Delete what is archived unchanged; commit only if the whole period went"""
+                run_with_busy_retry(conn.execute, 'BEGIN IMMEDIATE')
+                try:
+                    deleted = conn.execute(
+                        f'DELETE FROM main.{table} AS h WHERE {in_range} AND EXISTS '
+                        f'(SELECT 1 FROM arch.{table} a WHERE a.history_id = h.history_id AND {same})',
+                        [lo, hi]).rowcount
+                    left = conn.execute(f'SELECT COUNT(*) FROM main.{table} WHERE {in_range}',
+                                        [lo, hi]).fetchone()[0]
+                    if left:
+                        conn.rollback()
+                        return None, left
+                    arch_count = conn.execute(f'SELECT COUNT(*) FROM arch.{table} WHERE {in_range}',
+                                              [lo, hi]).fetchone()[0]
+                    conn.execute(
+                        f"INSERT OR REPLACE INTO {CATALOGUE_TABLE} "
+                        f"(table_name, period, archive_file, from_date, to_date, row_count, archived_at) "
+                        f"VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        [table, label, archive_file, lo, (nxt - timedelta(days=1)).isoformat(), arch_count,
+                         datetime.now().strftime('%Y-%m-%d %H:%M:%S')])
+                    conn.commit()
+                    return deleted, 0
+                except BaseException:
+                    if conn.in_transaction:
+                        conn.rollback()
+                    raise
+
+            for _ in range(ARCHIVE_ROUNDS):
+                conn.execute(f'INSERT OR REPLACE INTO arch.{table} ({cols}) SELECT {cols} FROM main.{table} '
+                             f'WHERE {in_range}', [lo, hi])
+                conn.commit()
+                deleted, left = move()
+                if deleted is not None:
+                    break
+                logger.info(f"{left} {table} rows for {label} changed after they were copied; copying again")
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.execute("DETACH DATABASE arch")
+
+    if deleted is None:
+        raise RuntimeError(f"{table} {label} still changing after {ARCHIVE_ROUNDS} copies "
+                           f"({left} rows differ from {archive_file}); hot rows kept")
+    logger.info(f"Archived {deleted} {table} rows for {label} into {archive_file}")
+    return deleted
+
+
+def archive(db_path=DB_PATH, horizon_days=DEFAULT_HORIZON_DAYS, granularity=DEFAULT_GRANULARITY,
+            tables=None, dry_run=False):
+    """Move complete periods that end before today - horizon_days into archive files"""
+    manager = get_database_manager(db_path)
+    with manager.get_connection() as conn:
+        conn.executescript(CATALOGUE_SQL)
+    horizon = date.today() - timedelta(days=horizon_days)
+    summary = {}
+    for table in tables or ARCHIVE_TABLES:
+        spec = ARCHIVE_TABLES[table]
+        with manager.get_connection() as conn:
+            try:
+                oldest = conn.execute(f'SELECT MIN("{spec["date_column"]}") FROM {table}').fetchone()[0]
+            except sqlite3.OperationalError as e:
+                logger.warning(f"Skipping {table}: {e}")
+                continue
+        moved = 0
+        if oldest:
+            d = datetime.strptime(str(oldest)[:10], '%Y-%m-%d').date()
+            while True:
+                label, start, nxt = period_for(d, granularity)
+                if nxt > horizon:
+                    break  # only whole periods entirely older than the horizon
+                if dry_run:
+                    logger.info(f"[dry-run] would archive {table} {label} ({start}..{nxt - timedelta(days=1)})")
+                else:
+                    moved += _archive_period(manager, db_path, table, spec, label, start, nxt)
+                d = nxt
+        summary[table] = moved
+    return summary
+
+
+def catalogue(db_path=DB_PATH):
+    manager = get_database_manager(db_path, read_only=True)
+    with manager.get_connection() as conn:
+        try:
+            rows = conn.execute(f"SELECT table_name, period, archive_file, from_date, to_date, row_count "
+                                f"FROM {CATALOGUE_TABLE} ORDER BY table_name, from_date").fetchall()
+        except sqlite3.OperationalError:
+            rows = []
+    return [dict(zip(('table_name', 'period', 'archive_file', 'from_date', 'to_date', 'row_count'), r))
+            for r in rows]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Archive old history rows into time-partitioned databases")
+    parser.add_argument("--db", default=DB_PATH, help=f"Inventory database (default: {DB_PATH})")
+    parser.add_argument("--horizon-days", type=int, default=DEFAULT_HORIZON_DAYS,
+                        help=f"Keep this many days hot (default: {DEFAULT_HORIZON_DAYS})")
+    parser.add_argument("--granularity", choices=["monthly", "quarterly"], default=DEFAULT_GRANULARITY,
+                        help=f"Archive file period (default: {DEFAULT_GRANULARITY})")
+    parser.add_argument("--table", action="append", choices=sorted(ARCHIVE_TABLES),
+                        help="Limit to a table (repeatable)")
+    parser.add_argument("--dry-run", action="store_true", help="Only log which periods would move")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM the hot DB afterwards to release space")
+    parser.add_argument("--list", action="store_true", help="Print the archive catalogue and exit")
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s',
+                        stream=sys.stdout)
+    args = parse_args()
+    if args.list:
+        for entry in catalogue(args.db):
+            print(f"{entry['table_name']:32} {entry['period']:8} {entry['from_date']}..{entry['to_date']} "
+                  f"{entry['row_count']:>10,} rows  {entry['archive_file']}")
+        return
+    summary = archive(args.db, args.horizon_days, args.granularity, args.table, args.dry_run)
+    logger.info(f"Done: {summary}")
+    if args.vacuum and not args.dry_run:
+        manager = get_database_manager(args.db)
+        with manager.get_connection() as conn:
+            conn.execute("VACUUM")
+        logger.info("Vacuumed hot database")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,7 @@
 // backend/controllers/inventoryController.js
 import { inventoryDb } from '../config/db.js';
+import { lookupMonthlyShipment } from './warehouseReportController.js';
+import { productSource } from '../utils/productDim.js';
 
 // Test database connection and basic data
 export async function testDatabase(req, res) {
@@ -69,10 +71,13 @@ export async function getTodaysArrivals(req, res) {
   try {
     // Get date from query parameter or default to today
     const requestedDate = req.query.date || new Date().toLocaleDateString('en-CA');
+    const prevDay = await historyDayFilter();
+    const ihDay = await historyDayFilter('ih');
+    const productTable = await productSource();
     
     const query = `
       SELECT 
-        COALESCE(b.name, a.brand_name) as bourbon_name,
+        p.display_name as bourbon_name,
         ih.plu,
         s.store_number,
         s.store_id,
@@ -80,15 +85,14 @@ export async function getTodaysArrivals(req, res) {
         s.nickname,
         ih.quantity as new_quantity,
         COALESCE(prev.prev_quantity, 0) as previous_quantity,
-        a.retail_price,
-        a.Listing_Type,
+        p.retail_price,
+        p.listing_type as Listing_Type,
         ih.check_time,
         ih.change_type,
         ih.delta
       FROM inventory_history ih
       JOIN stores s ON ih.store_id = s.store_id
-      LEFT JOIN bourbons b ON ih.plu = b.plu
-      LEFT JOIN alcohol a ON ih.plu = a.nc_code
+      LEFT JOIN ${productTable} p ON p.product_code = ih.plu
       LEFT JOIN (
         -- Get the previous quantity before this change
         SELECT 
@@ -97,17 +101,17 @@ export async function getTodaysArrivals(req, res) {
           quantity as prev_quantity,
           ROW_NUMBER() OVER (PARTITION BY store_id, plu ORDER BY check_time DESC) as rn
         FROM inventory_history 
-        WHERE DATE(check_time) < ?
+        WHERE ${prevDay.day} < ?
       ) prev ON ih.store_id = prev.store_id 
         AND ih.plu = prev.plu 
         AND prev.rn = 1
-      WHERE DATE(ih.check_time) = ?
+      WHERE ${ihDay.day} = ?
         AND ih.change_type IN ('up', 'first')
         AND ih.quantity > 0
       ORDER BY bourbon_name, s.store_number;
     `;
 
-    const results = await inventoryDb.raw(query, [requestedDate, requestedDate]);
+    const results = await inventoryDb.raw(query, [prevDay.param(requestedDate), ihDay.param(requestedDate)]);
 
     const arrivals = results.map(row => ({
       bourbon_name: row.bourbon_name,
@@ -152,31 +156,32 @@ export async function getAvailableDates(req, res) {
     }
 
     let query, params;
+    const day = await historyDayFilter();
     
     if (direction === 'previous') {
       // Get previous date with data
       query = `
         SELECT DISTINCT DATE(check_time) as available_date
         FROM inventory_history 
-        WHERE DATE(check_time) < ?
+        WHERE ${day.day} < ?
           AND change_type IN ('up', 'first')
           AND quantity > 0
         ORDER BY available_date DESC
         LIMIT 1
       `;
-      params = [currentDate];
+      params = [day.param(currentDate)];
     } else {
       // Get next date with data
       query = `
         SELECT DISTINCT DATE(check_time) as available_date
         FROM inventory_history 
-        WHERE DATE(check_time) > ?
+        WHERE ${day.day} > ?
           AND change_type IN ('up', 'first')
           AND quantity > 0
         ORDER BY available_date ASC
         LIMIT 1
       `;
-      params = [currentDate];
+      params = [day.param(currentDate)];
     }
 
     const results = await inventoryDb.raw(query, params);
@@ -260,28 +265,24 @@ export async function getCurrentAllocatedInventory(req, res) {
   try {
     const query = `
       SELECT 
-        COALESCE(b.bourbon_id, a.alcohol_id) as product_id,
-        COALESCE(b.name, a.brand_name) as product_name,
-        COALESCE(b.plu, a.nc_code) as plu,
-        a.retail_price,
-        a.size_ml,
-        a.bottles_per_case,
-        a.image_path,
-        a.Listing_Type,
+        COALESCE(p.bourbon_id, p.alcohol_id) as product_id,
+        p.display_name as product_name,
+        p.product_code as plu,
+        p.retail_price,
+        p.size_ml,
+        p.bottles_per_case,
+        p.image_path,
+        p.listing_type as Listing_Type,
         COALESCE(SUM(ci.quantity), 0) as total_bottles,
         COUNT(CASE WHEN ci.quantity > 0 THEN 1 END) as stores_with_stock
-      FROM alcohol a
-      LEFT JOIN bourbons b ON a.nc_code = b.plu
-      LEFT JOIN current_inventory ci ON COALESCE(b.plu, a.nc_code) = ci.plu
-      GROUP BY 
-        COALESCE(b.bourbon_id, a.alcohol_id),
-        COALESCE(b.name, a.brand_name),
-        COALESCE(b.plu, a.nc_code),
-        a.retail_price, a.size_ml, a.bottles_per_case, a.image_path, a.Listing_Type
+      FROM ${await productSource()} p
+      LEFT JOIN current_inventory ci ON ci.plu = p.product_code
+      WHERE p.alcohol_id IS NOT NULL
+      GROUP BY p.product_code
       HAVING total_bottles > 0
       ORDER BY 
         -- Sort by listing type priority, then by name
-        CASE a.Listing_Type 
+        CASE p.listing_type 
           WHEN 'Allocation' THEN 1
           WHEN 'Limited' THEN 2  
           WHEN 'Barrel' THEN 3
@@ -356,23 +357,24 @@ export async function debugDataSync(req, res) {
       WHERE check_time LIKE ?
     `;
     const historyResult = await inventoryDb.raw(historyQuery, [`${today}%`]);
+    const productTable = await productSource();
     
     // Check if any today's arrivals are missing from current_inventory
     const missingQuery = `
       SELECT 
         ih.plu,
-        a.brand_name,
-        a.Listing_Type,
+        p.brand_name,
+        p.listing_type as Listing_Type,
         SUM(ih.quantity) as history_quantity,
         COALESCE(SUM(ci.quantity), 0) as current_quantity
       FROM inventory_history ih
-      JOIN alcohol a ON ih.plu = a.nc_code
+      JOIN ${productTable} p ON p.product_code = ih.plu AND p.alcohol_id IS NOT NULL
       LEFT JOIN current_inventory ci ON ih.plu = ci.plu
       WHERE ih.check_time LIKE ?
         AND ih.quantity > 0
-      GROUP BY ih.plu, a.brand_name, a.Listing_Type
+      GROUP BY ih.plu, p.brand_name, p.listing_type
       HAVING history_quantity > current_quantity
-      ORDER BY a.brand_name
+      ORDER BY p.brand_name
       LIMIT 10
     `;
     const missingResult = await inventoryDb.raw(missingQuery, [`${today}%`]);
@@ -380,15 +382,15 @@ export async function debugDataSync(req, res) {
     // Check listing types in today's arrivals
     const listingTypesQuery = `
       SELECT 
-        a.Listing_Type,
+        p.listing_type as Listing_Type,
         COUNT(*) as count,
         COUNT(CASE WHEN ci.quantity > 0 THEN 1 END) as in_current_inventory
       FROM inventory_history ih
-      JOIN alcohol a ON ih.plu = a.nc_code
+      JOIN ${productTable} p ON p.product_code = ih.plu AND p.alcohol_id IS NOT NULL
       LEFT JOIN current_inventory ci ON ih.plu = ci.plu
       WHERE ih.check_time LIKE ?
         AND ih.quantity > 0
-      GROUP BY a.Listing_Type
+      GROUP BY p.listing_type
       ORDER BY count DESC
     `;
     const listingTypesResult = await inventoryDb.raw(listingTypesQuery, [`${today}%`]);
@@ -446,32 +448,31 @@ export async function getStoreInventoryForProduct(req, res) {
 export async function searchAllocatedProducts(req, res) {
   try {
     const { term } = req.params;
+    const productTable = await productSource();
     let query, params;
     
     if (/^\d+$/.test(term)) {
       // PLU search
       query = `
         SELECT DISTINCT 
-          COALESCE(b.name, a.brand_name) as name,
-          COALESCE(b.plu, a.nc_code) as plu,
-          a.retail_price,
-          a.Listing_Type
-        FROM alcohol a
-        LEFT JOIN bourbons b ON a.nc_code = b.plu
-        WHERE COALESCE(b.plu, a.nc_code) = ?
+          p.display_name as name,
+          p.product_code as plu,
+          p.retail_price,
+          p.listing_type as Listing_Type
+        FROM ${productTable} p
+        WHERE p.product_code = ? AND p.alcohol_id IS NOT NULL
       `;
       params = [parseInt(term)];
     } else {
       // Name search
       query = `
         SELECT DISTINCT 
-          COALESCE(b.name, a.brand_name) as name,
-          COALESCE(b.plu, a.nc_code) as plu,
-          a.retail_price,
-          a.Listing_Type
-        FROM alcohol a
-        LEFT JOIN bourbons b ON a.nc_code = b.plu
-        WHERE COALESCE(b.name, a.brand_name) LIKE ? COLLATE NOCASE
+          p.display_name as name,
+          p.product_code as plu,
+          p.retail_price,
+          p.listing_type as Listing_Type
+        FROM ${productTable} p
+        WHERE p.alcohol_id IS NOT NULL AND p.display_name LIKE ? COLLATE NOCASE
         ORDER BY name
         LIMIT 10
       `;
@@ -494,18 +495,20 @@ export async function generateDeliveryAnalysis(req, res) {
     // Calculate date ranges
     const { startDate, endDate } = getWeekRange(weeksBack);
     const { monthStart, monthEnd } = getCurrentMonthRange();
+    const ihDay = await historyDayFilter('ih');
+    const dayRange = [ihDay.param(startDate), ihDay.param(endDate)];
+    const productTable = await productSource();
     
     // Get product info
     const productQuery = `
       SELECT 
-        COALESCE(b.name, a.brand_name) as name,
-        CAST(a.nc_code AS INTEGER) as plu,
-        a.bottles_per_case,
-        a.retail_price,
-        a.size_ml
-      FROM alcohol a
-      LEFT JOIN bourbons b ON a.nc_code = b.plu
-      WHERE a.nc_code = ?
+        p.display_name as name,
+        p.product_code as plu,
+        p.bottles_per_case,
+        p.retail_price,
+        p.size_ml
+      FROM ${productTable} p
+      WHERE p.product_code = ? AND p.alcohol_id IS NOT NULL
     `;
     const productResults = await inventoryDb.raw(productQuery, [plu]);
     const product = productResults[0];
@@ -545,24 +548,30 @@ export async function generateDeliveryAnalysis(req, res) {
     JOIN stores s ON ih.store_id = s.store_id
     WHERE ih.plu = ?
       AND ih.change_type IN ('first', 'up')
-      AND DATE(ih.check_time) BETWEEN ? AND ?
+      AND ${ihDay.day} BETWEEN ? AND ?
       AND ih.quantity > 0
     ORDER BY ih.check_time, s.nickname
     `;
-    const deliveries = await inventoryDb.raw(deliveryQuery, [plu, startDate, endDate]);
+    const deliveries = await inventoryDb.raw(deliveryQuery, [plu, ...dayRange]);
     
     // FIXED: Get monthly shipments from state warehouse - ONLY the latest correction
-    const shipmentQuery = `
-      SELECT num_units as total_bottles
-      FROM shipments_history 
-      WHERE nc_code = ?
-        AND board_id = 155
-        AND DATE(ship_date) BETWEEN ? AND ?
-      ORDER BY shipment_id DESC
-      LIMIT 1
-    `;
-    const shipmentResults = await inventoryDb.raw(shipmentQuery, [plu.toString(), monthStart, monthEnd]);
-    const totalShippedBottles = shipmentResults[0]?.total_bottles || 0;
+    // Prebuilt by the report generator (warehouse_shipments.json); the query is the fallback
+    const today = new Date();
+    const month = `${today.getFullYear()}-${String(today.getMonth() + 1).padStart(2, '0')}`;
+    let totalShippedBottles = await lookupMonthlyShipment(plu, 155, month);
+    if (totalShippedBottles === null) {
+      const shipmentQuery = `
+        SELECT num_units as total_bottles
+        FROM shipments_history 
+        WHERE nc_code = ?
+          AND board_id = 155
+          AND DATE(ship_date) BETWEEN ? AND ?
+        ORDER BY shipment_id DESC
+        LIMIT 1
+      `;
+      const shipmentResults = await inventoryDb.raw(shipmentQuery, [plu.toString(), monthStart, monthEnd]);
+      totalShippedBottles = shipmentResults[0]?.total_bottles || 0;
+    }
     
     // Get other drop products if requested
     let storesWithOtherDrops = [];
@@ -571,14 +580,14 @@ export async function generateDeliveryAnalysis(req, res) {
       const otherDropQuery = `
         SELECT DISTINCT ih.plu
         FROM inventory_history ih
-        JOIN alcohol a ON ih.plu = a.nc_code
+        JOIN ${productTable} p ON p.product_code = ih.plu
         WHERE ih.change_type IN ('first', 'up')
-          AND DATE(ih.check_time) BETWEEN ? AND ?
+          AND ${ihDay.day} BETWEEN ? AND ?
           AND ih.plu != ?
           AND ih.quantity > 0
-          AND a.Listing_Type IN ('Allocation', 'Limited', 'Barrel')
+          AND p.is_allocated = 1
       `;
-      const otherDropProducts = await inventoryDb.raw(otherDropQuery, [startDate, endDate, plu]);
+      const otherDropProducts = await inventoryDb.raw(otherDropQuery, [...dayRange, plu]);
       
       if (otherDropProducts.length > 0) {
         const deliveredStoreIds = deliveries.map(d => d.store_id);
@@ -604,14 +613,13 @@ export async function generateDeliveryAnalysis(req, res) {
             s.region,
             s.mixed_beverage,
             GROUP_CONCAT(DISTINCT ih.plu) as received_plus,
-            GROUP_CONCAT(DISTINCT COALESCE(b.name, a.brand_name)) as received_products,
+            GROUP_CONCAT(DISTINCT p.display_name) as received_products,
             COUNT(DISTINCT ih.plu) as product_count
           FROM inventory_history ih
           JOIN stores s ON ih.store_id = s.store_id
-          LEFT JOIN bourbons b ON ih.plu = b.plu
-          LEFT JOIN alcohol a ON ih.plu = a.nc_code
+          LEFT JOIN ${productTable} p ON p.product_code = ih.plu
           WHERE ih.change_type IN ('first', 'up')
-            AND DATE(ih.check_time) BETWEEN ? AND ?
+            AND ${ihDay.day} BETWEEN ? AND ?
             AND ih.plu IN (${placeholders})
             AND ih.quantity > 0
             ${excludePlaceholders}
@@ -620,7 +628,7 @@ export async function generateDeliveryAnalysis(req, res) {
           ORDER BY s.nickname
         `;
         
-        const params = [startDate, endDate, ...otherProductPlus, ...excludeParams];
+        const params = [...dayRange, ...otherProductPlus, ...excludeParams];
         storesWithOtherDrops = await inventoryDb.raw(otherDropStoreQuery, params);
       }
     }
@@ -751,21 +759,20 @@ export async function getWarehouseInventory(req, res) {
     let baseQuery = `
       SELECT DISTINCT
         wih.nc_code as plu,
-        COALESCE(b.name, a.brand_name, 'Unknown Product') as product_name,
-        a.retail_price,
-        COALESCE(a.Listing_Type, 'Unknown') as listing_type,
-        a.image_path,
+        COALESCE(p.display_name, 'Unknown Product') as product_name,
+        p.retail_price,
+        COALESCE(p.listing_type, 'Unknown') as listing_type,
+        p.image_path,
         wih.total_available as current_inventory,
         wih.check_date as current_date,
         CASE 
-          WHEN a.nc_code IS NOT NULL AND wih.nc_code IS NOT NULL THEN 'complete'
-          WHEN a.nc_code IS NOT NULL AND wih.nc_code IS NULL THEN 'alcohol_only'  
-          WHEN a.nc_code IS NULL AND wih.nc_code IS NOT NULL THEN 'warehouse_only'
+          WHEN p.alcohol_id IS NOT NULL AND wih.nc_code IS NOT NULL THEN 'complete'
+          WHEN p.alcohol_id IS NOT NULL AND wih.nc_code IS NULL THEN 'alcohol_only'  
+          WHEN p.alcohol_id IS NULL AND wih.nc_code IS NOT NULL THEN 'warehouse_only'
           ELSE 'missing'
         END as data_source
       FROM warehouse_inventory_history_v2 wih
-      LEFT JOIN alcohol a ON wih.nc_code = a.nc_code
-      LEFT JOIN bourbons b ON wih.nc_code = b.plu  
+      LEFT JOIN ${await productSource()} p ON p.product_code = wih.nc_code
       WHERE wih.check_date = (
         SELECT MAX(check_date) 
         FROM warehouse_inventory_history_v2 w2 
@@ -781,16 +788,16 @@ export async function getWarehouseInventory(req, res) {
       if (productTypes) {
         const typesArray = productTypes.split(',');
         const placeholders = typesArray.map(() => '?').join(',');
-        baseQuery += ` AND COALESCE(a.Listing_Type, 'Unknown') IN (${placeholders})`;
+        baseQuery += ` AND COALESCE(p.listing_type, 'Unknown') IN (${placeholders})`;
         queryParams.push(...typesArray);
       } else {
         // Default: exclude 'Listed' products
-        baseQuery += ` AND COALESCE(a.Listing_Type, 'Unknown') IN (?, ?, ?)`;
+        baseQuery += ` AND COALESCE(p.listing_type, 'Unknown') IN (?, ?, ?)`;
         queryParams.push('Allocation', 'Limited', 'Barrel');
       }
     }
 
-    baseQuery += ` ORDER BY COALESCE(b.name, a.brand_name) COLLATE NOCASE`;
+    baseQuery += ` ORDER BY p.display_name COLLATE NOCASE`;
 
     console.log('Executing base query...');
     const baseResults = await inventoryDb.raw(baseQuery, queryParams);
@@ -919,15 +926,14 @@ export async function getShipments(req, res) {
       SELECT 
         sh.shipment_id,
         sh.nc_code as plu,
-        COALESCE(b.name, a.brand_name) as product_name,
+        p.display_name as product_name,
         sh.ship_date,
         sh.num_units,
         b.board_name,
-        a.retail_price
+        p.retail_price
       FROM shipments_history sh
       LEFT JOIN boards b ON sh.board_id = b.board_id
-      LEFT JOIN alcohol a ON sh.nc_code = a.nc_code
-      LEFT JOIN bourbons bour ON sh.nc_code = bour.plu
+      LEFT JOIN ${await productSource()} p ON p.product_code = sh.nc_code
       WHERE 1=1
     `;
     
@@ -966,18 +972,17 @@ export async function getStoreInventory(req, res) {
     const query = `
       SELECT 
         ci.plu,
-        COALESCE(b.name, a.brand_name) as product_name,
+        p.display_name as product_name,
         ci.quantity,
         ci.last_updated,
-        a.retail_price,
-        a.size_ml,
-        a.Listing_Type,
+        p.retail_price,
+        p.size_ml,
+        p.listing_type as Listing_Type,
         s.store_number,
         s.nickname,
         s.address
       FROM current_inventory ci
-      LEFT JOIN bourbons b ON ci.plu = b.plu
-      LEFT JOIN alcohol a ON ci.plu = a.nc_code
+      LEFT JOIN ${await productSource()} p ON p.product_code = ci.plu
       JOIN stores s ON ci.store_id = s.store_id
       WHERE ci.store_id = ? AND ci.quantity > 0
       ORDER BY product_name COLLATE NOCASE
@@ -1073,6 +1078,36 @@ function getWeekRange(weeksBack = 0) {
   };
 }
 
+// inventory_history.day_key (days since 1970-01-01, maintained by day_keys.py triggers) lets
+// date filters range-scan an index instead of evaluating DATE(check_time) on every row.
+// day_keys.py builds these indexes only after the backfill, so they mark the column as complete;
+// until then (and after --down) the DATE() filters are used. Re-checked every minute.
+const DAY_KEY_INDEXES = ['idx_inventory_history_plu_day', 'idx_inventory_history_day'];
+let dayKeyCheck = null;
+function historyHasDayKey() {
+  if (!dayKeyCheck) {
+    dayKeyCheck = inventoryDb.raw(
+      `SELECT COUNT(*) AS n FROM sqlite_master WHERE type = 'index' AND name IN (${DAY_KEY_INDEXES.map(() => '?').join(', ')})`,
+      DAY_KEY_INDEXES)
+      .then(rows => rows[0].n === DAY_KEY_INDEXES.length)
+      .catch(() => false)
+      .finally(() => { setTimeout(() => { dayKeyCheck = null; }, 60000).unref(); });
+  }
+  return dayKeyCheck;
+}
+
+function toDayKey(ymd) {
+  return Math.floor(Date.parse(`${String(ymd).slice(0, 10)}T00:00:00Z`) / 86400000);
+}
+
+// SQL for "the day of <alias>.check_time" and a converter for its 'YYYY-MM-DD' parameters
+async function historyDayFilter(alias = '') {
+  const col = alias ? `${alias}.` : '';
+  return (await historyHasDayKey())
+    ? { day: `${col}day_key`, param: toDayKey }
+    : { day: `DATE(${col}check_time)`, param: (ymd) => ymd };
+}
+
 function getCurrentMonthRange() {
   const today = new Date();
   const firstDay = new Date(today.getFullYear(), today.getMonth(), 1);
@@ -1162,9 +1197,9 @@ const getSimpleWarehouseInventory = async () => {
   const query = `
     SELECT 
       wih.nc_code as plu,
-      COALESCE(b.name, a.brand_name, 'Unknown Product') as product_name,
-      a.retail_price,
-      COALESCE(a.Listing_Type, 'Unknown') as listing_type,
+      COALESCE(p.display_name, 'Unknown Product') as product_name,
+      p.retail_price,
+      COALESCE(p.listing_type, 'Unknown') as listing_type,
       wih.total_available as current_inventory,
       wih.total_available as peak_inventory,
       wih.total_available as low_inventory,
@@ -1175,16 +1210,15 @@ const getSimpleWarehouseInventory = async () => {
       null as image_url,
       0 as has_image
     FROM warehouse_inventory_history_v2 wih
-    LEFT JOIN alcohol a ON wih.nc_code = a.nc_code
-    LEFT JOIN bourbons b ON wih.nc_code = b.plu  
+    LEFT JOIN ${await productSource()} p ON p.product_code = wih.nc_code
     WHERE wih.check_date = (
       SELECT MAX(check_date) 
       FROM warehouse_inventory_history_v2 w2 
       WHERE w2.nc_code = wih.nc_code
     )
-    AND COALESCE(a.Listing_Type, 'Unknown') IN ('Allocation', 'Limited', 'Barrel')
+    AND p.is_allocated = 1
     AND wih.total_available > 0
-    ORDER BY COALESCE(b.name, a.brand_name) COLLATE NOCASE
+    ORDER BY p.display_name COLLATE NOCASE
     LIMIT 100
   `;
   
@@ -1,5 +1,6 @@
 // backend/controllers/storesController.js
 import { inventoryDb } from '../config/db.js';
+import { productSource } from '../utils/productDim.js';
 
 // Get all stores with basic information
 export async function getAllStores(req, res) {
@@ -353,23 +354,22 @@ export async function getStoreInventory(req, res) {
     const storeId = parseInt(id);
 
     // Query to get current inventory for the store with product details
-    // Join current_inventory -> bourbons for product names and then to alcohol for additional details if available
+    // Tracked bourbons only (product_dim rows with a bourbons entry), with alcohol details if available
     const query = `
       SELECT 
         ci.store_id,
         ci.plu,
         ci.quantity,
-        b.name as brand_name,
-        COALESCE(a.retail_price, 0) as retail_price,
-        COALESCE(a.Listing_Type, 'Allocation') as Listing_Type,
-        a.image_path,
-        a.nc_code
+        p.display_name as brand_name,
+        COALESCE(p.retail_price, 0) as retail_price,
+        COALESCE(p.listing_type, 'Allocation') as Listing_Type,
+        p.image_path,
+        CASE WHEN p.alcohol_id IS NOT NULL THEN p.product_code END as nc_code
       FROM current_inventory ci
-      INNER JOIN bourbons b ON ci.plu = b.plu
-      LEFT JOIN alcohol a ON b.plu = a.nc_code
+      JOIN ${await productSource()} p ON p.product_code = ci.plu AND p.bourbon_id IS NOT NULL
       WHERE ci.store_id = ? 
         AND ci.quantity > 0
-      ORDER BY b.name
+      ORDER BY p.display_name
     `;
 
     const inventory = await inventoryDb.raw(query, [storeId]);
@@ -1,8 +1,12 @@
 // backend/controllers/warehouseReportController.js - Static JSON File Server
 
-import { promises as fs } from 'fs';
+import { promises as fs, createReadStream } from 'fs';
+import readline from 'readline';
+import { createHash } from 'crypto';
+import http from 'http';
 import path from 'path';
 import { fileURLToPath } from 'url';
+import sqlite3 from 'sqlite3';
 
 const __filename = fileURLToPath(import.meta.url);
 const __dirname = path.dirname(__filename);
@@ -103,6 +107,458 @@ export async function getWarehouseInventoryReport(req, res) {
     }
 }
 
+// Sparkline sidecars (parsed once per file version)
+const MAX_SPARKLINE_CODES = 500;
+const sparklineCache = new Map(); // timePeriod -> { version, data }
+
+async function loadSparklines(timePeriod) {
+    const file = path.join(REPORTS_DIR, `warehouse_sparklines_${timePeriod}.json`);
+    const stats = await fs.stat(file);
+    const version = `${stats.mtime.getTime()}-${stats.size}`;
+    const cached = sparklineCache.get(timePeriod);
+    if (cached && cached.version === version) {
+        return cached;
+    }
+    const data = JSON.parse(await fs.readFile(file, 'utf8'));
+    const entry = { version, data, mtime: stats.mtime };
+    sparklineCache.set(timePeriod, entry);
+    return entry;
+}
+
+// Downsampled trend series for a page of products in one request.
+// ?timePeriod=last_30_days&nc_codes=123,456  (omit nc_codes for every product)
+// Series are delta-encoded: [[day deltas], [value deltas]], days counted from meta.start_date
+export async function getWarehouseSparklines(req, res) {
+    try {
+        const { timePeriod = 'current_month', nc_codes } = req.query;
+
+        if (!VALID_TIME_PERIODS.includes(timePeriod)) {
+            return res.status(400).json({
+                success: false,
+                error: `Invalid time period: ${timePeriod}. Valid options: ${VALID_TIME_PERIODS.join(', ')}`
+            });
+        }
+
+        const codes = nc_codes ? String(nc_codes).split(',').map(c => c.trim()).filter(Boolean) : null;
+        if (codes && codes.length > MAX_SPARKLINE_CODES) {
+            return res.status(400).json({
+                success: false,
+                error: `Too many nc_codes (max ${MAX_SPARKLINE_CODES})`
+            });
+        }
+
+        let entry;
+        try {
+            entry = await loadSparklines(timePeriod);
+        } catch (fileError) {
+            if (fileError.code === 'ENOENT') {
+                return res.status(404).json({
+                    success: false,
+                    error: `Sparklines not available for ${timePeriod}. Please wait for next report generation.`
+                });
+            }
+            throw fileError;
+        }
+
+        const codesKey = codes ? '-' + createHash('sha1').update(codes.join(',')).digest('hex').slice(0, 16) : '';
+        const etag = `"${entry.version}${codesKey}"`;
+        if (req.headers['if-none-match'] === etag) {
+            return res.status(304).end();
+        }
+        res.setHeader('Cache-Control', 'public, max-age=14400');
+        res.setHeader('ETag', etag);
+        res.setHeader('Last-Modified', entry.mtime.toUTCString());
+
+        let series = entry.data.series || {};
+        if (codes) {
+            series = {};
+            for (const code of codes) {
+                if (entry.data.series[code]) {
+                    series[code] = entry.data.series[code];
+                }
+            }
+        }
+
+        res.json({ success: true, meta: entry.data.meta, series });
+
+    } catch (error) {
+        console.error('Error serving warehouse sparklines:', error);
+        res.status(500).json({
+            success: false,
+            error: 'Failed to load warehouse sparklines',
+            details: DEV_MODE ? error.message : undefined
+        });
+    }
+}
+
+// Shipment sell-through artifact (warehouse_shipments.json, written by the generator after each run).
+// Keyed by nc_code, so a product's month is a property lookup instead of a shipments_history join.
+const SHIPMENTS_FILE = path.join(REPORTS_DIR, 'warehouse_shipments.json');
+let shipmentsCache = null; // { version, data, mtime }
+
+async function loadShipments() {
+    const stats = await fs.stat(SHIPMENTS_FILE);
+    const version = `${stats.mtime.getTime()}-${stats.size}`;
+    if (shipmentsCache && shipmentsCache.version === version) {
+        return shipmentsCache;
+    }
+    const data = JSON.parse(await fs.readFile(SHIPMENTS_FILE, 'utf8'));
+    shipmentsCache = { version, data, mtime: stats.mtime };
+    return shipmentsCache;
+}
+
+// Units a board shipped of one product in a month ('YYYY-MM'), latest correction only.
+// null when the artifact is missing or does not cover the month; callers then query the DB.
+export async function lookupMonthlyShipment(ncCode, boardId, month) {
+    let entry;
+    try {
+        entry = await loadShipments();
+    } catch (fileError) {
+        if (fileError.code === 'ENOENT') return null;
+        throw fileError;
+    }
+    if (!entry.data.meta.months.includes(month)) {
+        return null;
+    }
+    const product = entry.data.products[String(ncCode)];
+    return product?.months[month]?.boards[String(boardId)] ?? 0;
+}
+
+// ?month=2024-08&board=155&nc_code=123,456&listing_type=Allocation,Limited
+// -> one row per product for the month (shipped per board, warehouse flows, sell_through)
+export async function getWarehouseShipments(req, res) {
+    try {
+        let entry;
+        try {
+            entry = await loadShipments();
+        } catch (fileError) {
+            if (fileError.code === 'ENOENT') {
+                return res.status(404).json({
+                    success: false,
+                    error: 'Shipments report not available. Please wait for next report generation.'
+                });
+            }
+            throw fileError;
+        }
+        const { meta, board_totals: boardTotals, products } = entry.data;
+        const month = req.query.month || meta.months[0];
+        if (!meta.months.includes(month)) {
+            return res.status(400).json({
+                success: false,
+                error: `Month not covered: ${month}. Available: ${meta.months.join(', ')}`
+            });
+        }
+        const board = req.query.board ? String(req.query.board) : null;
+        const codes = req.query.nc_code ? String(req.query.nc_code).split(',').map(c => c.trim()).filter(Boolean) : null;
+        const listingTypes = req.query.listing_type
+            ? new Set(String(req.query.listing_type).split(',').map(t => t.trim().toLowerCase()))
+            : null;
+
+        const etag = `"shipments-${entry.version}-${createHash('sha1').update(JSON.stringify(req.query)).digest('hex').slice(0, 16)}"`;
+        if (req.headers['if-none-match'] === etag) {
+            return res.status(304).end();
+        }
+        res.setHeader('Cache-Control', 'no-cache');
+        res.setHeader('ETag', etag);
+        res.setHeader('Last-Modified', entry.mtime.toUTCString());
+
+        const rows = [];
+        for (const product of (codes ? codes.map(c => products[c]).filter(Boolean) : Object.values(products))) {
+            const m = product.months[month];
+            if (!m || (board && m.boards[board] === undefined)) continue;
+            if (listingTypes && !listingTypes.has(String(product.listing_type).toLowerCase())) continue;
+            const { months, ...info } = product;
+            rows.push({ ...info, ...m, board_units: board ? m.boards[board] : m.shipped });
+        }
+        rows.sort((a, b) => b.board_units - a.board_units);
+
+        res.json({
+            success: true,
+            month,
+            months: meta.months,
+            boards: meta.boards,
+            board_totals: board ? { [board]: boardTotals[month][board] } : boardTotals[month],
+            generated_at: meta.generated_at,
+            products: rows
+        });
+
+    } catch (error) {
+        console.error('Error serving warehouse shipments:', error);
+        res.status(500).json({
+            success: false,
+            error: 'Failed to load shipments report',
+            details: DEV_MODE ? error.message : undefined
+        });
+    }
+}
+
+// Prebuilt search index (warehouse_search.db, rebuilt by the generator after each run).
+// The generator replaces the file atomically, so a new mtime/inode means reopen.
+const SEARCH_DB_FILE = path.join(REPORTS_DIR, 'warehouse_search.db');
+const MAX_SEARCH_LIMIT = 100;
+const MIN_TRIGRAM = 3;
+const BM25_WEIGHTS = '10.0, 5.0, 1.0, 2.0'; // name, brand, supplier, codes
+let searchDb = null; // { version, db }
+
+// Same rules as search_index.normalize(): lowercase, no accents, punctuation -> space
+function normalizeSearchText(text) {
+    return String(text ?? '')
+        .normalize('NFKD')
+        .replace(/\p{M}/gu, '')
+        .toLowerCase()
+        .replace(/[^a-z0-9]+/g, ' ')
+        .trim();
+}
+
+async function openSearchDb() {
+    const stats = await fs.stat(SEARCH_DB_FILE);
+    const version = `${stats.mtime.getTime()}-${stats.ino}`;
+    if (searchDb && searchDb.version === version) {
+        return searchDb;
+    }
+    const db = await new Promise((resolve, reject) => {
+        const handle = new sqlite3.Database(SEARCH_DB_FILE, sqlite3.OPEN_READONLY, err => err ? reject(err) : resolve(handle));
+    });
+    if (searchDb) {
+        searchDb.db.close();
+    }
+    searchDb = { version, db, mtime: stats.mtime };
+    return searchDb;
+}
+
+function searchAll(db, sql, params) {
+    return new Promise((resolve, reject) => {
+        db.all(sql, params, (err, rows) => err ? reject(err) : resolve(rows));
+    });
+}
+
+// Ranked product lookup: exact nc_code/PLU, then name/brand prefix, then FTS5 trigram by bm25.
+// ?q=eagle rare&timePeriod=last_30_days&limit=20  (timePeriod optional: only products in that window)
+export async function searchWarehouseProducts(req, res) {
+    try {
+        const { q = '', timePeriod } = req.query;
+        const limit = Math.min(Math.max(parseInt(req.query.limit, 10) || 20, 1), MAX_SEARCH_LIMIT);
+
+        if (timePeriod && !VALID_TIME_PERIODS.includes(timePeriod)) {
+            return res.status(400).json({
+                success: false,
+                error: `Invalid time period: ${timePeriod}. Valid options: ${VALID_TIME_PERIODS.join(', ')}`
+            });
+        }
+
+        const term = normalizeSearchText(q);
+        if (!term) {
+            return res.json({ success: true, results: [] });
+        }
+
+        let entry;
+        try {
+            entry = await openSearchDb();
+        } catch (fileError) {
+            if (fileError.code === 'ENOENT') {
+                return res.status(404).json({
+                    success: false,
+                    error: 'Search index not available. Please wait for next report generation.'
+                });
+            }
+            throw fileError;
+        }
+
+        const words = term.split(' ');
+        const longWords = words.filter(w => w.length >= MIN_TRIGRAM);
+        const params = { $t: term, $prefix: `${term}%`, $limit: limit };
+        let sql = `SELECT p.nc_code, p.plu, p.product_name, p.brand_name, p.supplier, p.listing_type, p.periods,
+                          (p.nc_code = $t OR p.plu = $t) AS exact,
+                          (p.name_norm LIKE $prefix OR p.brand_norm LIKE $prefix) AS prefix, `;
+        if (longWords.length) {
+            sql += `bm25(product_fts, ${BM25_WEIGHTS}) AS score
+                    FROM product_fts JOIN products p ON p.id = product_fts.rowid
+                    WHERE product_fts MATCH $match`;
+            params.$match = longWords.map(w => `"${w}"`).join(' AND ');
+        } else {
+            sql += '0.0 AS score FROM products p WHERE 1';
+        }
+        // Too short for a trigram: word-start match on name or brand
+        words.filter(w => w.length < MIN_TRIGRAM).forEach((w, i) => {
+            sql += ` AND (p.name_norm LIKE $s${i} OR p.brand_norm LIKE $s${i} OR p.name_norm LIKE $w${i} OR p.brand_norm LIKE $w${i})`;
+            params[`$s${i}`] = `${w}%`;
+            params[`$w${i}`] = `% ${w}%`;
+        });
+        if (timePeriod) {
+            sql += ` AND (',' || p.periods || ',') LIKE $period`;
+            params.$period = `%,${timePeriod},%`;
+        }
+        sql += ' ORDER BY exact DESC, prefix DESC, score, p.product_name LIMIT $limit';
+
+        const rows = await searchAll(entry.db, sql, params);
+        res.setHeader('Cache-Control', 'private, max-age=300');
+        res.setHeader('Last-Modified', entry.mtime.toUTCString());
+        res.json({
+            success: true,
+            results: rows.map(({ exact, prefix, score, periods, ...product }) => ({
+                ...product,
+                periods: periods ? periods.split(',') : []
+            }))
+        });
+
+    } catch (error) {
+        console.error('Error searching warehouse products:', error);
+        res.status(500).json({
+            success: false,
+            error: 'Failed to search warehouse products',
+            details: DEV_MODE ? error.message : undefined
+        });
+    }
+}
+
+// Change-event feed (warehouse_events.ndjson, appended by the generator after each run).
+// Poll with ?since=<last seq seen>; the state file's batch offsets let us seek
+// straight to the first unseen event instead of reading the whole feed.
+const EVENTS_FILE = path.join(REPORTS_DIR, 'warehouse_events.ndjson');
+const EVENTS_STATE_FILE = path.join(REPORTS_DIR, 'warehouse_events_state.json');
+const MAX_EVENTS_LIMIT = 1000;
+
+async function readEventsAfter(state, since, limit) {
+    const batch = state.batches.find(b => b.last_seq > since);
+    if (!batch || state.size <= batch.offset) {
+        return [];
+    }
+    // Stop at the committed size: bytes past it belong to an append still in progress
+    const stream = createReadStream(EVENTS_FILE, { start: batch.offset, end: state.size - 1 });
+    const lines = readline.createInterface({ input: stream, crlfDelay: Infinity });
+    const events = [];
+    try {
+        for await (const line of lines) {
+            if (!line) continue;
+            const event = JSON.parse(line);
+            if (event.seq > since) {
+                events.push(event);
+                if (events.length >= limit) break;
+            }
+        }
+    } finally {
+        lines.close();
+        stream.destroy();
+    }
+    return events;
+}
+
+// ?since=0&limit=500&type=sold_out,restocked  ->  { events, cursor, has_more }
+// Pass the returned cursor as the next since.
+export async function getWarehouseEvents(req, res) {
+    try {
+        const since = Math.max(parseInt(req.query.since, 10) || 0, 0);
+        const limit = Math.min(Math.max(parseInt(req.query.limit, 10) || 500, 1), MAX_EVENTS_LIMIT);
+        const types = req.query.type ? new Set(String(req.query.type).split(',').map(t => t.trim())) : null;
+
+        let state;
+        try {
+            state = JSON.parse(await fs.readFile(EVENTS_STATE_FILE, 'utf8'));
+        } catch (fileError) {
+            if (fileError.code === 'ENOENT') {
+                return res.status(404).json({
+                    success: false,
+                    error: 'Event feed not available. Please wait for next report generation.'
+                });
+            }
+            throw fileError;
+        }
+
+        const etag = `"events-${state.last_seq}-${since}-${limit}-${req.query.type || ''}"`;
+        if (req.headers['if-none-match'] === etag) {
+            return res.status(304).end();
+        }
+        res.setHeader('Cache-Control', 'no-cache');
+        res.setHeader('ETag', etag);
+
+        const page = since >= state.last_seq ? [] : await readEventsAfter(state, since, limit);
+        const cursor = page.length ? page[page.length - 1].seq : Math.max(since, 0);
+        res.json({
+            success: true,
+            events: types ? page.filter(e => types.has(e.type)) : page,
+            cursor,
+            has_more: cursor < state.last_seq,
+            through_check_date: state.through_check_date
+        });
+
+    } catch (error) {
+        console.error('Error serving warehouse events:', error);
+        res.status(500).json({
+            success: false,
+            error: 'Failed to load warehouse events',
+            details: DEV_MODE ? error.message : undefined
+        });
+    }
+}
+
+// Ad-hoc windows (custom start/end, listing_type, text filter) are answered by the resident
+// report service (report_service.py), which keeps the history in memory. We only proxy to it.
+const REPORT_SERVICE_SOCKET = process.env.REPORT_SERVICE_SOCKET;
+const REPORT_SERVICE_PORT = parseInt(process.env.REPORT_SERVICE_PORT || '8765', 10);
+const REPORT_SERVICE_TIMEOUT_MS = 15000;
+const CUSTOM_REPORT_PARAMS = ['start', 'end', 'listing_type', 'q', 'limit', 'offset'];
+
+// ?start=2024-01-01&end=2024-02-15&listing_type=Limited&q=eagle  (or ?timePeriod=last_30_days)
+export async function getCustomWarehouseReport(req, res) {
+    const params = new URLSearchParams();
+    for (const name of CUSTOM_REPORT_PARAMS) {
+        if (req.query[name] !== undefined) params.set(name, String(req.query[name]));
+    }
+    if (req.query.timePeriod) params.set('period', String(req.query.timePeriod));
+
+    const upstream = http.request({
+        ...(REPORT_SERVICE_SOCKET ? { socketPath: REPORT_SERVICE_SOCKET } : { host: '127.0.0.1', port: REPORT_SERVICE_PORT }),
+        path: `/report?${params}`,
+        method: 'GET',
+        timeout: REPORT_SERVICE_TIMEOUT_MS
+    }, (serviceRes) => {
+        res.status(serviceRes.statusCode);
+        res.setHeader('Content-Type', 'application/json');
+        res.setHeader('Cache-Control', 'no-cache');
+        serviceRes.pipe(res);
+    });
+    upstream.on('timeout', () => upstream.destroy(new Error('Report service timed out')));
+    upstream.on('error', (error) => {
+        if (res.headersSent) {
+            res.end();
+            return;
+        }
+        const unavailable = ['ECONNREFUSED', 'ENOENT'].includes(error.code);
+        if (!unavailable) console.error('Error proxying custom report:', error);
+        res.status(unavailable ? 503 : 502).json({
+            success: false,
+            error: unavailable ? 'Custom reports are not available (report service not running)' : 'Report service error',
+            details: DEV_MODE ? error.message : undefined
+        });
+    });
+    upstream.end();
+}
+
+// Generator run state (generation_status.json, written by the generator's run coordinator)
+export async function getGenerationStatus(req, res) {
+    try {
+        const statusFile = path.join(REPORTS_DIR, 'generation_status.json');
+        let status;
+        try {
+            status = JSON.parse(await fs.readFile(statusFile, 'utf8'));
+        } catch (fileError) {
+            if (fileError.code === 'ENOENT') {
+                return res.json({ success: true, state: 'idle', last_run: null, pending: null });
+            }
+            throw fileError;
+        }
+        res.setHeader('Cache-Control', 'no-cache');
+        res.json({ success: true, ...status, server_time: new Date().toISOString() });
+    } catch (error) {
+        console.error('Error reading generation status:', error);
+        res.status(500).json({
+            success: false,
+            error: 'Failed to read generation status',
+            details: DEV_MODE ? error.message : undefined
+        });
+    }
+}
+
 // Get report status and metadata
 export async function getReportStatus(req, res) {
     try {
@@ -177,51 +633,35 @@ export async function triggerReportGeneration(req, res) {
             }
         }
 
-        // Execute Python script
+        // Start the generator detached and answer right away. The generator's own run lock
+        // makes overlapping triggers merge into one follow-up run; progress is in the status file.
         const { spawn } = await import('child_process');
         const pythonScript = DEV_MODE 
             ? path.join(__dirname, '../../warehouse_inventory_generator.py')
             : '/opt/bourbon-scripts/warehouse_inventory_generator.py';
 
         const args = reportTypes && reportTypes.length > 0 ? reportTypes : [];
-        
-        const pythonProcess = spawn('python3', [pythonScript, ...args], {
+
+        const pythonProcess = spawn('python3', [pythonScript, ...args, '--requested-by', requestedBy], {
             cwd: DEV_MODE ? path.join(__dirname, '../..') : '/opt',
             env: { 
                 ...process.env, 
                 DEV_MODE: DEV_MODE ? 'true' : 'false' 
-            }
-        });
-
-        let output = '';
-        let errorOutput = '';
-
-        pythonProcess.stdout.on('data', (data) => {
-            output += data.toString();
+            },
+            detached: true,
+            stdio: 'ignore'
         });
-
-        pythonProcess.stderr.on('data', (data) => {
-            errorOutput += data.toString();
+        pythonProcess.on('error', (error) => {
+            console.error('Failed to start report generation:', error);
         });
+        pythonProcess.unref();
 
-        pythonProcess.on('close', (code) => {
-            if (code === 0) {
-                console.log('Python report generation completed successfully');
-                res.json({
-                    success: true,
-                    message: 'Report generation completed successfully',
-                    output: output.trim(),
-                    requested_by: requestedBy
-                });
-            } else {
-                console.error('Python report generation failed with code:', code);
-                console.error('Error output:', errorOutput);
-                res.status(500).json({
-                    success: false,
-                    error: `Report generation failed with exit code: ${code}`,
-                    output: errorOutput.trim()
-                });
-            }
+        res.status(202).json({
+            success: true,
+            message: 'Report generation requested',
+            report_types: args.length > 0 ? args : 'all',
+            requested_by: requestedBy,
+            status_url: '/api/reports/generation-status'
         });
 
     } catch (error) {
@@ -2,7 +2,13 @@
 import express from 'express';
 import { 
   getWarehouseInventoryReport,
+  getWarehouseSparklines,
+  getWarehouseShipments,
+  searchWarehouseProducts,
+  getWarehouseEvents,
+  getCustomWarehouseReport,
   getReportStatus,
+  getGenerationStatus,
   triggerReportGeneration
 } from '../controllers/warehouseReportController.js';
 
@@ -10,9 +16,15 @@ const router = express.Router();
 
 // Public route (authenticated users): Get warehouse inventory reports from pre-generated JSON
 router.get('/warehouse-inventory', getWarehouseInventoryReport);
+router.get('/warehouse-inventory/sparklines', getWarehouseSparklines);
+router.get('/shipments', getWarehouseShipments);
+router.get('/warehouse-inventory/search', searchWarehouseProducts);
+router.get('/warehouse-inventory/events', getWarehouseEvents);
+router.get('/warehouse-inventory/custom', getCustomWarehouseReport);
 
 // Admin routes: Report management and monitoring
 router.get('/status', getReportStatus);
+router.get('/generation-status', getGenerationStatus);
 router.post('/generate', triggerReportGeneration);
 
 export default router;
\ No newline at end of file
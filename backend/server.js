@@ -41,9 +41,10 @@ const __dirname = dirname(__filename);
 
 const isProduction = process.env.NODE_ENV === 'production';
 
-// Trust proxy in production (nginx reverse proxy)
-if (isProduction) {
-  app.set('trust proxy', 'loopback');
+// Trust proxy in production (nginx reverse proxy); TRUST_PROXY sets it elsewhere too,
+// e.g. load_test.py sends one X-Forwarded-For per simulated client so rate limits apply per client
+if (isProduction || process.env.TRUST_PROXY) {
+  app.set('trust proxy', process.env.TRUST_PROXY || 'loopback');
 }
 
 // Enhanced Security Headers
@@ -0,0 +1,52 @@
+// backend/utils/productDim.js
+// Product metadata for controllers: one row per integer product code (alcohol.nc_code / bourbons.plu).
+//
+// product_dim is maintained by product_dim.py (its own scheduled step, and after seeding):
+//   product_code (INTEGER PRIMARY KEY), alcohol_id, bourbon_id, display_name (bourbons.name, else
+//   brand_name), brand_name, listing_type, retail_price, supplier, broker, size_ml, bottles_per_case,
+//   has_image, image_path, image_url, is_allocated
+// Join it as `LEFT JOIN ${await productSource()} p ON p.product_code = x.plu`: a rowid lookup instead
+// of joining alcohol and bourbons per query. `p.alcohol_id IS NOT NULL` / `p.bourbon_id IS NOT NULL`
+// keep the old inner-join semantics.
+//
+// Triggers on alcohol/bourbons bump product_dim_state.source_version and each refresh records the
+// version it was built from. While they differ the table is older than its sources, and the
+// fallback subquery (the same columns computed from alcohol/bourbons) is used instead.
+import { inventoryDb } from '../config/db.js';
+
+const NO_IMAGE = `(a.image_path IS NULL OR a.image_path = '' OR a.image_path = 'no image available')`;
+
+// Same columns computed on the fly, for a database whose product_dim is missing or stale
+const FALLBACK_SQL = `(
+  SELECT a.nc_code AS product_code, a.alcohol_id, b.bourbon_id,
+         COALESCE(b.name, a.brand_name) AS display_name, a.brand_name, NULL AS product_name,
+         a.Listing_Type AS listing_type, a.retail_price, a.supplier, a.broker_name AS broker, NULL AS plu,
+         a.size_ml, a.bottles_per_case,
+         CASE WHEN ${NO_IMAGE} THEN 0 ELSE 1 END AS has_image,
+         CASE WHEN ${NO_IMAGE} THEN NULL ELSE a.image_path END AS image_path,
+         NULL AS image_url,
+         CASE WHEN a.Listing_Type IN ('Allocation', 'Limited', 'Barrel') THEN 1 ELSE 0 END AS is_allocated
+  FROM alcohol a
+  LEFT JOIN bourbons b ON b.plu = a.nc_code
+  UNION ALL
+  SELECT b.plu, NULL, b.bourbon_id, b.name, NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL,
+         0, NULL, NULL, 0
+  FROM bourbons b
+  WHERE NOT EXISTS (SELECT 1 FROM alcohol a WHERE a.nc_code = b.plu)
+)`;
+
+const CURRENT_SQL = `SELECT 1 AS ok FROM product_dim_state WHERE id = 1 AND built_version = source_version`;
+const RECHECK_MS = 10000;
+
+let dimCheck = null;
+
+// 'product_dim' while it is current, else the fallback subquery (re-checked every RECHECK_MS)
+export function productSource() {
+  if (!dimCheck) {
+    dimCheck = inventoryDb.raw(CURRENT_SQL)
+      .then(rows => (rows.length ? 'product_dim' : FALLBACK_SQL))
+      .catch(() => FALLBACK_SQL) // no product_dim_state before the first refresh
+      .finally(() => { setTimeout(() => { dimCheck = null; }, RECHECK_MS).unref(); });
+  }
+  return dimCheck;
+}
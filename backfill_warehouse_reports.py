@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+As-of backfill for the warehouse reports
+
+Answers "what did the <window> report look like on each day of a range" in one
+sweep over warehouse_inventory_history_v2 instead of one generator run per day.
+Each product's rows are read once in (nc_code, check_date) order while the
+as-of dates advance; sliding-window state is kept in two monotonic deques:
+
+- max deque (values strictly decreasing): front = last occurrence of the
+  window maximum, i.e. the report's peak
+- min deque (values strictly increasing): suffix minima; the first entry at or
+  after the peak date is the last occurrence of the minimum after the peak
+
+Both deques are amortised O(1) per row because the window start and the peak
+date only move forward. Semantics match warehouse_inventory_generator.py with
+the current value taken as of each date instead of the latest in the DB.
+
+Output (under <OUTPUT_DIR>/backfill/):
+- --format stats    {window}_{from}_{to}.ndjson, one compact record per (as_of, product)
+- --format reports  a full report per as-of date, {window}_asof_{date}.json
+"""
+
+import sys
+import sqlite3
+import logging
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from itertools import groupby
+from operator import itemgetter
+
+import warehouse_inventory_generator as gen_mod
+from warehouse_inventory_generator import WarehouseInventoryGenerator, HISTORY_TABLE, TIME_PERIODS
+from report_writer import ReportMetaAccumulator, StreamingReportWriter, dumps
+
+logger = logging.getLogger('warehouse_inventory_generator')
+
+
+# ------------------ Sweep ------------------
+def sweep_product(code, rows, as_of_dates, starts):
+    """
+    rows: (nc_code, check_date, total_available) for one product in date order.
+    Yields (as_of_index, code, current, peak, peak_date, low, low_date, last_updated)
+    for every as-of date whose window [starts[i], as_of_dates[i]] has rows.
+    """
+    maxq, minq = deque(), deque()
+    it = iter(rows)
+    pending = next(it, None)
+    current = last_date = None
+    for i, as_of in enumerate(as_of_dates):
+        while pending is not None and pending[1] <= as_of:
+            d, v = pending[1], pending[2] or 0
+            while maxq and maxq[-1][1] <= v:
+                maxq.pop()
+            maxq.append((d, v))
+            while minq and minq[-1][1] >= v:
+                minq.pop()
+            minq.append((d, v))
+            current, last_date = v, d
+            pending = next(it, None)
+        start = starts[i]
+        while maxq and maxq[0][0] < start:
+            maxq.popleft()
+        if not maxq:
+            continue
+        peak_date, peak = maxq[0]
+        while minq[0][0] < peak_date:
+            minq.popleft()
+        low_date, low = minq[0]
+        yield (i, code, current, peak, peak_date, low, low_date, last_date)
+
+
+def sweep(rows, as_of_dates, starts):
+    """rows ordered by nc_code, check_date"""
+    for code, group in groupby(rows, key=itemgetter(0)):
+        yield from sweep_product(code, group, as_of_dates, starts)
+
+
+def _sweep_range(db_path, archives, lo, hi, lower_date, upper_date, as_of_dates, starts):
+    """Worker: sweep the products with lo <= nc_code <= hi"""
+    conn = sqlite3.connect(db_path, timeout=30, uri=True)
+    try:
+        table = gen_mod.attach_archives(conn, db_path, HISTORY_TABLE, archives) if archives else HISTORY_TABLE
+        rows = conn.execute(
+            f"SELECT nc_code, check_date, total_available FROM {table} "
+            f"WHERE nc_code >= ? AND nc_code <= ? AND check_date >= ? AND check_date <= ? "
+            f"ORDER BY nc_code, check_date", [lo, hi, lower_date, upper_date])
+        return list(sweep(rows, as_of_dates, starts))
+    finally:
+        conn.close()
+
+
+# ------------------ Driver ------------------
+def as_of_range(date_from, date_to, step=1):
+    out = []
+    d = date_from
+    while d <= date_to:
+        out.append(d)
+        d += timedelta(days=step)
+    return out
+
+
+def backfill(window, as_of_days, workers=1, output_format='stats'):
+    gen = WarehouseInventoryGenerator()
+    ranges = [gen._get_time_periods(as_of=d)[window] for d in as_of_days]
+    as_of_dates = [r['end'].strftime('%Y-%m-%d') for r in ranges]
+    starts = [r['start'].strftime('%Y-%m-%d') for r in ranges]
+    lower, upper = min(starts), as_of_dates[-1]
+
+    gen._use_archives_for(lower, upper)
+    try:
+        conn = gen._connect()
+        try:
+            codes = [r[0] for r in conn.execute(
+                f"SELECT DISTINCT nc_code FROM {gen.history_table} WHERE check_date >= ? AND check_date <= ? "
+                f"ORDER BY nc_code", [lower, upper])]
+        finally:
+            conn.close()
+        logger.info(f"Backfilling {window} for {len(as_of_dates)} as-of dates "
+                    f"({as_of_dates[0]}..{upper}), {len(codes)} products, {workers} worker(s)")
+
+        # Contiguous nc_code ranges keep each worker on the (nc_code, check_date) index
+        n_chunks = max(1, min(len(codes), workers * 4)) if workers > 1 else 1
+        size = -(-len(codes) // n_chunks) if codes else 0
+        tasks = [(gen.db_path, gen._archives, codes[i], codes[min(i + size, len(codes)) - 1],
+                  lower, upper, as_of_dates, starts) for i in range(0, len(codes), size or 1)]
+        results = []
+        if workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for part in pool.map(_sweep_range, *zip(*tasks)):
+                    results.extend(part)
+        else:
+            for t in tasks:
+                results.extend(_sweep_range(*t))
+    finally:
+        gen._reset_history_source()
+
+    metadata = gen._get_product_metadata(codes)
+    by_date = [[] for _ in as_of_dates]
+    for i, code, current, peak, peak_date, low, low_date, last_date in results:
+        r = metadata.get(str(code))
+        if r is None:
+            continue  # no alcohol row: not reportable (same as the generator)
+        pd = gen._product_meta(r)
+        pd['last_updated'] = last_date
+        by_date[i].append(gen._product_record(pd, code, current, peak, peak_date, low, low_date))
+
+    out_dir = gen.output_dir / 'backfill'
+    out_dir.mkdir(parents=True, exist_ok=True)
+    if output_format == 'reports':
+        for i, products in enumerate(by_date):
+            tp = f"{window}_asof_{as_of_dates[i]}"
+            totals = ReportMetaAccumulator()
+            with StreamingReportWriter(out_dir, tp) as writer:
+                for p in gen._sort_products(products):
+                    totals.add(p)
+                    writer.write_product(p)
+                meta = gen._report_meta(window, ranges[i], totals)
+                meta['as_of'] = as_of_dates[i]
+                writer.set_meta(meta)
+        return out_dir
+
+    path = out_dir / f"{window}_{as_of_dates[0]}_{upper}.ndjson"
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'wb') as f:
+        for i, products in enumerate(by_date):
+            for p in gen._sort_products(products):
+                f.write(dumps({'as_of': as_of_dates[i], 'nc_code': p['nc_code'],
+                               'current_inventory': p['current_inventory'],
+                               'peak_inventory': p['peak_inventory'], 'peak_inventory_date': p['peak_inventory_date'],
+                               'low_inventory': p['low_inventory'], 'low_inventory_date': p['low_inventory_date'],
+                               'last_updated': p['last_updated']}) + b'\n')
+    tmp.replace(path)
+    logger.info(f"Wrote {path} ({len(results)} records)")
+    return path
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Regenerate warehouse reports as of each date in a range")
+    parser.add_argument("--window", choices=TIME_PERIODS, default='last_30_days')
+    parser.add_argument("--from", dest="date_from", required=True, help="First as-of date (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="date_to", help="Last as-of date (default: today)")
+    parser.add_argument("--step", type=int, default=1, help="Sample every N days (default: 1)")
+    parser.add_argument("--workers", type=int, default=1, help="Processes sweeping product ranges in parallel")
+    parser.add_argument("--format", dest="output_format", choices=["stats", "reports"], default="stats",
+                        help="Compact NDJSON stats (default) or a full report per as-of date")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    date_from = datetime.strptime(args.date_from, '%Y-%m-%d')
+    date_to = datetime.strptime(args.date_to, '%Y-%m-%d') if args.date_to else datetime.now()
+    if date_to < date_from:
+        logger.error("--to is before --from")
+        sys.exit(2)
+    backfill(args.window, as_of_range(date_from, date_to, max(1, args.step)),
+             workers=max(1, args.workers), output_format=args.output_format)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Warehouse change-event feed
+
+After each generator run, compares the newest check_dates in
+warehouse_inventory_history_v2 and appends what changed to an append-only
+NDJSON feed next to the reports. Consumers keep the last seq they saw and poll
+for newer events without downloading a full report:
+
+- new_product   first row ever for the nc_code (previous is null)
+- sold_out      previous > 0, now 0
+- restocked     went up by at least RESTOCK_MIN_UNITS (change = amount added)
+- large_drop    still in stock, but fell by LARGE_DROP_PCT of the previous value
+                and at least LARGE_DROP_MIN_UNITS
+
+Polling walks the (nc_code, check_date) unique index one product at a time (a
+loose index scan: MIN(nc_code) > previous, then that product's newest rows),
+so it costs a few index seeks per product however long the history is, and
+needs no index beyond the migration's. A product with no row on the earlier
+date is compared with its last earlier value, one more seek on the same index.
+Products missing on the later date have no event, because a missing row is a
+scrape gap, not a sell-out.
+
+Files (output dir):
+- warehouse_events.ndjson        one event per line, seq strictly increasing
+- warehouse_events_state.json    cursor state: last_seq, through_check_date,
+                                 committed size and one batch entry (first/last
+                                 seq, byte offset) per check_date, so readers can
+                                 seek straight to the first event after a seq
+
+Events are appended and fsynced before the state is replaced. Bytes past the
+recorded size (an append interrupted before its state update) are truncated on
+the next run, so a batch is never recorded twice.
+"""
+
+import os
+import sys
+import json
+import logging
+import argparse
+from datetime import datetime
+from pathlib import Path
+
+from report_writer import dumps, write_json_atomic
+
+logger = logging.getLogger('warehouse_inventory_generator')
+
+EVENTS_FILE = 'warehouse_events.ndjson'
+EVENTS_STATE_FILE = 'warehouse_events_state.json'
+EVENT_TYPES = ('new_product', 'sold_out', 'restocked', 'large_drop')
+EVENT_DATES = int(os.getenv('EVENT_DATES', '2'))  # check_dates compared on a first run
+EVENT_MAX_CATCHUP = 31  # check_dates replayed after missed runs
+LARGE_DROP_PCT = float(os.getenv('LARGE_DROP_PCT', '0.5'))
+LARGE_DROP_MIN_UNITS = int(os.getenv('LARGE_DROP_MIN_UNITS', '12'))
+RESTOCK_MIN_UNITS = int(os.getenv('RESTOCK_MIN_UNITS', '1'))
+
+
+def classify(previous, current):
+    """Event type for one product between two check_dates, or None"""
+    current = current or 0
+    if previous is None:
+        return 'new_product'
+    if previous > 0 and current == 0:
+        return 'sold_out'
+    if current - previous >= RESTOCK_MIN_UNITS:
+        return 'restocked'
+    drop = previous - current
+    if current > 0 and drop >= LARGE_DROP_MIN_UNITS and drop >= previous * LARGE_DROP_PCT:
+        return 'large_drop'
+    return None
+
+
+def recent_rows_sql(table, through=None, n=EVENT_DATES):
+    """(sql, params) for recent_rows: a loose index scan over nc_code, then each product's newest rows"""
+    since, params = ("AND check_date >= ?", [through]) if through is not None else ("", [])
+    limit = n if through is None else EVENT_MAX_CATCHUP + 1
+    return f"""
+WITH RECURSIVE codes(nc_code) AS (
+  SELECT MIN(nc_code) FROM {table}
+  UNION ALL
+  SELECT (SELECT MIN(nc_code) FROM {table} WHERE nc_code > codes.nc_code) FROM codes
+  WHERE codes.nc_code IS NOT NULL
+)
+SELECT h.nc_code, h.check_date, h.total_available
+FROM codes c
+JOIN {table} h ON h.rowid IN (
+  SELECT rowid FROM {table} WHERE nc_code = c.nc_code {since} ORDER BY check_date DESC LIMIT ?)
+""", [*params, limit]
+
+
+def recent_rows(conn, table, through=None, n=EVENT_DATES):
+    """
+    {nc_code: {check_date: total}}: each product's newest rows, the last n on a
+    first run, else those on or after `through` (at most EVENT_MAX_CATCHUP + 1).
+    The newest k distinct check_dates are all among the products' last k rows.
+    """
+    out = {}
+    for code, d, total in conn.execute(*recent_rows_sql(table, through, n)):
+        out.setdefault(code, {})[d] = total or 0
+    return out
+
+
+def check_dates_to_process(rows, through=None, n=EVENT_DATES):
+    """Ascending check_dates in recent_rows(): the last n on a first run, else `through` onwards"""
+    dates = sorted({d for v in rows.values() for d in v}, reverse=True)
+    return sorted(dates[:n if through is None else EVENT_MAX_CATCHUP + 1])
+
+
+def diff_check_dates(conn, table, rows, previous_date, check_date):
+    """[(type, nc_code, previous, current)] for products with a row on check_date"""
+    events = []
+    for code in sorted(rows):
+        v = rows[code]
+        if check_date not in v:
+            continue
+        previous = v.get(previous_date)
+        if previous is None:
+            row = conn.execute(f"SELECT total_available FROM {table} WHERE nc_code = ? AND check_date < ? "
+                               f"ORDER BY check_date DESC LIMIT 1", [code, previous_date]).fetchone()
+            previous = None if row is None else (row[0] or 0)
+        kind = classify(previous, v[check_date])
+        if kind:
+            events.append((kind, code, previous, v[check_date]))
+    return events
+
+
+class EventFeed:
+    def __init__(self, output_dir, file_mode=None):
+        self.output_dir = Path(output_dir)
+        self.path = self.output_dir / EVENTS_FILE
+        self.state_path = self.output_dir / EVENTS_STATE_FILE
+        self.file_mode = file_mode
+
+    def load_state(self):
+        if self.state_path.exists():
+            return json.loads(self.state_path.read_text(encoding='utf-8'))
+        return {'last_seq': 0, 'through_check_date': None, 'size': 0, 'batches': []}
+
+    def append(self, state, batches):
+        """batches: [(previous_date, check_date, [event dicts without seq])]; returns the new state"""
+        seq = state['last_seq']
+        with open(self.path, 'ab') as f:
+            f.truncate(state['size'])  # drop an append whose state update never happened
+            f.seek(state['size'])
+            for previous_date, check_date, events in batches:
+                offset = f.tell()
+                first = seq + 1
+                for e in events:
+                    seq += 1
+                    f.write(dumps({'seq': seq, **e}) + b'\n')
+                state['batches'].append({'check_date': check_date, 'previous_check_date': previous_date,
+                                         'first_seq': first, 'last_seq': seq, 'offset': offset,
+                                         'count': len(events)})
+                state['through_check_date'] = check_date
+            f.flush()
+            os.fsync(f.fileno())
+            state['size'] = f.tell()
+        state['last_seq'] = seq
+        state['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        if self.file_mode is not None:
+            os.chmod(self.path, self.file_mode)
+        write_json_atomic(self.state_path, state, self.file_mode)
+        return state
+
+    def read(self, since=0, limit=500):
+        """Events with seq > since, oldest first, at most limit"""
+        state = self.load_state()
+        if since >= state['last_seq'] or not self.path.exists():
+            return []
+        offset = next((b['offset'] for b in state['batches'] if b['last_seq'] > since), state['size'])
+        out = []
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            while f.tell() < state['size'] and len(out) < limit:
+                e = json.loads(f.readline())
+                if e['seq'] > since:
+                    out.append(e)
+        return out
+
+
+def update_event_feed(gen, file_mode=None):
+    """Append events for every check_date newer than the feed's cursor; returns how many were added"""
+    feed = EventFeed(gen.output_dir, file_mode)
+    state = feed.load_state()
+    conn = gen._connect()
+    try:
+        rows = recent_rows(conn, gen.history_table, state['through_check_date'])
+        dates = check_dates_to_process(rows, state['through_check_date'])
+        pairs = [(a, b) for a, b in zip(dates, dates[1:])
+                 if state['through_check_date'] is None or b > state['through_check_date']]
+        diffs = [(a, b, diff_check_dates(conn, gen.history_table, rows, a, b)) for a, b in pairs]
+    finally:
+        conn.close()
+    if not pairs:
+        logger.info(f"Event feed up to date (through {state['through_check_date']})")
+        return 0
+
+    codes = sorted({code for _, _, events in diffs for _, code, _, _ in events})
+    metadata = gen._get_product_metadata(codes)
+    batches = []
+    for a, b, events in diffs:
+        rows = []
+        for kind, code, previous, current in events:
+            r = metadata.get(str(code)) or {}
+            rows.append({'check_date': b, 'previous_check_date': a, 'type': kind, 'nc_code': code,
+                         'plu': r.get('plu'), 'product_name': r.get('product_name') or r.get('brand_name'),
+                         'brand_name': r.get('brand_name'), 'listing_type': r.get('listing_type'),
+                         'previous': previous, 'current': current,
+                         'change': None if previous is None else current - previous})
+        batches.append((a, b, rows))
+    state = feed.append(state, batches)
+    added = sum(len(rows) for _, _, rows in batches)
+    logger.info(f"Appended {added} events for {', '.join(b for _, b, _ in batches)} "
+                f"to {feed.path} (last seq {state['last_seq']})")
+    return added
+
+
+def main():
+    from warehouse_inventory_generator import WarehouseInventoryGenerator
+
+    parser = argparse.ArgumentParser(description="Update or read the warehouse change-event feed")
+    parser.add_argument("--since", type=int, help="Print events after this seq instead of updating")
+    parser.add_argument("--limit", type=int, default=500)
+    args = parser.parse_args()
+    gen = WarehouseInventoryGenerator()
+    if args.since is not None:
+        for e in EventFeed(gen.output_dir).read(args.since, args.limit):
+            print(json.dumps(e, ensure_ascii=False))
+        return
+    try:
+        update_event_feed(gen)
+    except Exception as e:
+        logger.error(f"Event feed update failed: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
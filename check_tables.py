@@ -1,38 +1,265 @@
 #!/usr/bin/env python3
 """
-Check what tables exist in the database
+Inventory database capacity and growth profiler
+
+- Works on a read-only snapshot (online backup API) so scrapers are never blocked
+- Per table and per index: rows, pages and bytes (via dbstat), unused bytes, fragmentation;
+  without dbstat (SQLite built without SQLITE_ENABLE_DBSTAT_VTAB) rows come from COUNT(*)
+  and the page stats, byte growth and projections are omitted
+- Rows per day from each table's date column, overall and over the recent window
+- WAL size, freelist pages, and projected size at 6/12/24 months
+- Emits JSON (optionally appended to an NDJSON history file for trend tracking)
 """
 
+import os
 import sys
+import json
 import sqlite3
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+DEFAULT_DB_PATH = "BourbonDatabase/inventory.db"
+PROJECTION_MONTHS = (6, 12, 24)
+DAYS_PER_MONTH = 30.44
+
+# Date column used to measure growth, first match wins
+# (append-only tables only; current_inventory.last_updated is an upsert stamp, not growth)
+DATE_COLUMN_CANDIDATES = ['check_date', 'check_time', 'snapshot_date', 'ship_date', 'created_at']
+
+
+def take_snapshot(db_path: str, target: str = 'file'):
+    """
+    Copy the live database with the online backup API.
+    Returns (connection, temp_path or None). target: 'file' | 'memory' | 'none'
+    """
+    uri = Path(db_path).resolve().as_uri()
+    src = sqlite3.connect(f"{uri}?mode=ro", uri=True, timeout=30)
+    if target == 'none':
+        src.execute("PRAGMA query_only = ON")
+        return src, None
+
+    tmp_path = None
+    if target == 'memory':
+        dst = sqlite3.connect(':memory:')
+    else:
+        fd, tmp_path = tempfile.mkstemp(prefix='inventory-profile-', suffix='.db')
+        os.close(fd)
+        dst = sqlite3.connect(tmp_path)
+    # Paged steps so a busy writer is only ever blocked for a moment
+    src.backup(dst, pages=1024)
+    src.close()
+    return dst, tmp_path
+
+
+def _pick_date_column(cursor, table: str):
+    cols = [r[1] for r in cursor.execute(f'PRAGMA table_info("{table}")')]
+    lower = {c.lower(): c for c in cols}
+    for cand in DATE_COLUMN_CANDIDATES:
+        if cand in lower:
+            return lower[cand]
+    return None
+
+
+def _btree_stats(cursor):
+    """
+    One dbstat pass: pages/bytes/unused/leaf cells and out-of-order leaf pages
+    per b-tree, or None when this SQLite build has no dbstat table
+    """
+    stats = {}
+    prev = {}
+    try:
+        cursor.execute("SELECT name, pageno, pagetype, ncell, pgsize, unused FROM dbstat ORDER BY name, path")
+    except sqlite3.OperationalError as e:
+        print(f"dbstat unavailable, counting rows instead (no page stats): {e}", file=sys.stderr)
+        return None
+    for name, pageno, pagetype, ncell, pgsize, unused in cursor:
+        s = stats.setdefault(name, {'pages': 0, 'bytes': 0, 'unused_bytes': 0, 'leaf_cells': 0, 'leaf_pages': 0, 'seq_breaks': 0})
+        s['pages'] += 1
+        s['bytes'] += pgsize or 0
+        s['unused_bytes'] += unused or 0
+        if pagetype != 'leaf':
+            continue
+        s['leaf_cells'] += ncell or 0
+        s['leaf_pages'] += 1
+        # Leaves visited in key order; a jump in page number is a non-sequential read
+        last = prev.get(name)
+        if last is not None and pageno != last + 1:
+            s['seq_breaks'] += 1
+        prev[name] = pageno
+    for s in stats.values():
+        s['unused_pct'] = round(100.0 * s['unused_bytes'] / s['bytes'], 2) if s['bytes'] else 0.0
+        s['fragmentation_pct'] = (round(100.0 * s['seq_breaks'] / (s['leaf_pages'] - 1), 2)
+                                  if s['leaf_pages'] > 1 else 0.0)
+    return stats
+
+
+def _growth(cursor, table: str, date_col: str, recent_days: int):
+    row = cursor.execute(
+        f'SELECT MIN("{date_col}"), MAX("{date_col}"), COUNT(*) FROM "{table}" WHERE "{date_col}" IS NOT NULL'
+    ).fetchone()
+    first, last, dated_rows = row
+    if not first or not last:
+        return None
+    try:
+        first_d = datetime.fromisoformat(str(first)[:10])
+        last_d = datetime.fromisoformat(str(last)[:10])
+    except ValueError:
+        return None
+    span_days = max(1, (last_d - first_d).days + 1)
+    recent_start = (last_d - timedelta(days=recent_days - 1)).strftime('%Y-%m-%d')
+    recent_rows = cursor.execute(
+        f'SELECT COUNT(*) FROM "{table}" WHERE "{date_col}" >= ?', [recent_start]
+    ).fetchone()[0]
+    return {
+        'date_column': date_col,
+        'first_date': str(first)[:10],
+        'last_date': str(last)[:10],
+        'span_days': span_days,
+        'rows_per_day': round(dated_rows / span_days, 2),
+        'recent_days': min(recent_days, span_days),
+        'recent_rows_per_day': round(recent_rows / min(recent_days, span_days), 2),
+    }
+
 
-def check_tables():
-    db_path = "BourbonDatabase/inventory.db"
-    
+def profile_database(conn, db_path: str, recent_days: int = 30):
+    cursor = conn.cursor()
+    page_size = cursor.execute("PRAGMA page_size").fetchone()[0]
+    page_count = cursor.execute("PRAGMA page_count").fetchone()[0]
+    freelist = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+
+    objects = cursor.execute(
+        "SELECT type, name, tbl_name FROM sqlite_master WHERE type IN ('table', 'index') ORDER BY name"
+    ).fetchall()
+    btrees = _btree_stats(cursor)
+
+    tables = {}
+    for obj_type, name, _ in objects:
+        if obj_type != 'table' or name.startswith('sqlite_'):
+            continue
+        if btrees is None:
+            rows = cursor.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0]
+            tables[name] = {'rows': rows, 'indexes': {}}
+            continue
+        s = btrees.get(name, {})
+        tables[name] = {
+            'rows': s.get('leaf_cells', 0),
+            'pages': s.get('pages', 0),
+            'bytes': s.get('bytes', 0),
+            'unused_pct': s.get('unused_pct', 0.0),
+            'fragmentation_pct': s.get('fragmentation_pct', 0.0),
+            'indexes': {},
+        }
+    for obj_type, name, tbl_name in objects:
+        if obj_type != 'index' or tbl_name not in tables or btrees is None:
+            continue
+        s = btrees.get(name, {})
+        tables[tbl_name]['indexes'][name] = {
+            'pages': s.get('pages', 0),
+            'bytes': s.get('bytes', 0),
+            'unused_pct': s.get('unused_pct', 0.0),
+            'fragmentation_pct': s.get('fragmentation_pct', 0.0),
+        }
+
+    total_growth_per_day = 0.0
+    for name, t in tables.items():
+        if btrees is not None:
+            t['index_bytes'] = sum(i['bytes'] for i in t['indexes'].values())
+            t['total_bytes'] = t['bytes'] + t['index_bytes']
+        date_col = _pick_date_column(cursor, name)
+        growth = _growth(cursor, name, date_col, recent_days) if date_col and t['rows'] else None
+        t['growth'] = growth
+        if growth and t['rows'] and btrees is not None:
+            bytes_per_row = t['total_bytes'] / t['rows']
+            bytes_per_day = growth['recent_rows_per_day'] * bytes_per_row
+            growth['bytes_per_row'] = round(bytes_per_row, 1)
+            growth['bytes_per_day'] = round(bytes_per_day)
+            growth['projected_bytes'] = {
+                f'{m}_months': round(t['total_bytes'] + bytes_per_day * m * DAYS_PER_MONTH)
+                for m in PROJECTION_MONTHS
+            }
+            total_growth_per_day += bytes_per_day
+
+    wal_path = Path(str(db_path) + '-wal')
+    db_bytes = page_size * page_count
+    return {
+        'profiled_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'db_path': str(db_path),
+        'file_bytes': Path(db_path).stat().st_size,
+        'wal_bytes': wal_path.stat().st_size if wal_path.exists() else 0,
+        'page_size': page_size,
+        'page_count': page_count,
+        'freelist_pages': freelist,
+        'freelist_pct': round(100.0 * freelist / page_count, 2) if page_count else 0.0,
+        'db_bytes': db_bytes,
+        'page_stats': btrees is not None,
+        'growth_bytes_per_day': round(total_growth_per_day) if btrees is not None else None,
+        'projected_db_bytes': {
+            f'{m}_months': round(db_bytes + total_growth_per_day * m * DAYS_PER_MONTH)
+            for m in PROJECTION_MONTHS
+        } if btrees is not None else None,
+        # largest first: by bytes, or by rows without dbstat
+        'tables': dict(sorted(tables.items(), key=lambda kv: kv[1].get('total_bytes', kv[1]['rows']),
+                              reverse=True)),
+    }
+
+
+def check_tables(db_path: str = DEFAULT_DB_PATH, snapshot: str = 'file', recent_days: int = 30):
+    conn, tmp_path = take_snapshot(db_path, snapshot)
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # Get all tables
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name")
-        tables = [row[0] for row in cursor.fetchall()]
-        
-        print("Tables in database:")
-        for table in tables:
-            print(f"  - {table}")
-        
-        # Check for warehouse tables specifically
-        warehouse_tables = [t for t in tables if 'warehouse' in t.lower()]
-        print(f"\nWarehouse-related tables: {warehouse_tables}")
-        
-        # Check for inventory tables
-        inventory_tables = [t for t in tables if 'inventory' in t.lower()]
-        print(f"Inventory-related tables: {inventory_tables}")
-        
+        return profile_database(conn, db_path, recent_days)
+    finally:
         conn.close()
-        
-    except Exception as e:
-        print(f"Error: {e}")
+        if tmp_path:
+            os.remove(tmp_path)
+
+
+def print_summary(profile):
+    mb = lambda b: f"{b / 1048576:,.1f} MB"
+    print(f"Database: {profile['db_path']} ({mb(profile['db_bytes'])}, WAL {mb(profile['wal_bytes'])}, "
+          f"freelist {profile['freelist_pages']} pages / {profile['freelist_pct']}%)", file=sys.stderr)
+    for name, t in profile['tables'].items():
+        g = t['growth']
+        rate = f", {g['recent_rows_per_day']:,} rows/day" if g else ''
+        size = f", {mb(t['total_bytes'])} incl. indexes" if 'total_bytes' in t else ''
+        print(f"  - {name}: {t['rows']:,} rows{size}{rate}", file=sys.stderr)
+    if profile['projected_db_bytes']:
+        proj = ', '.join(f"{k.replace('_', ' ')}: {mb(v)}" for k, v in profile['projected_db_bytes'].items())
+        print(f"Projected size -> {proj}", file=sys.stderr)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Profile inventory DB capacity and growth")
+    parser.add_argument("db_path", nargs="?", default=DEFAULT_DB_PATH,
+                        help=f"Path to inventory database (default: {DEFAULT_DB_PATH})")
+    parser.add_argument("--snapshot", choices=["file", "memory", "none"], default="file",
+                        help="Profile a backup copy in a temp file (default), in memory, or the live file read-only")
+    parser.add_argument("--recent-days", type=int, default=30,
+                        help="Window used for the recent rows/day growth rate (default: 30)")
+    parser.add_argument("--output", "-o", type=str, help="Write JSON to this file instead of stdout")
+    parser.add_argument("--append-history", type=str,
+                        help="Append a compact JSON line to this NDJSON file for trend tracking")
+    parser.add_argument("--summary", action="store_true", help="Print a human-readable summary to stderr")
+    return parser.parse_args()
+
 
 if __name__ == "__main__":
-    check_tables()
\ No newline at end of file
+    args = parse_args()
+    try:
+        profile = check_tables(args.db_path, args.snapshot, args.recent_days)
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(profile, f, indent=2)
+    else:
+        json.dump(profile, sys.stdout, indent=2)
+        print()
+    if args.append_history:
+        with open(args.append_history, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(profile, separators=(',', ':')) + '\n')
+    if args.summary:
+        print_summary(profile)
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Run-length compaction for warehouse_inventory_history_v2 (opt-in)
+
+Most products sit at the same total_available for weeks, yet the history table
+stores one row per product per check_date. This folds those rows into change
+runs: (nc_code, from_date, to_date, total_available, listing_type,
+supplier_allotment), where a run spans consecutive global check_dates on which
+the product was present with identical values.
+
+- warehouse_check_dates         every check_date that has been compacted
+- warehouse_inventory_runs      the runs (WITHOUT ROWID, keyed nc_code+from_date)
+- warehouse_compaction_state    compacted_through marker
+- warehouse_inventory_history_v2_full
+                                view: runs expanded to daily rows up to
+                                compacted_through, UNION ALL raw daily rows after it
+
+Compaction is incremental (only check_dates after compacted_through are read)
+and atomic. --prune-keep-days deletes already-compacted daily rows older than N
+days from the raw table; the _full view keeps reconstructing them exactly.
+"""
+
+import os
+import sys
+import logging
+import argparse
+from datetime import datetime, timedelta
+
+from database_safety import get_database_manager
+
+DEV_MODE = os.getenv('DEV_MODE', 'false').lower() == 'true'
+DB_PATH = './BourbonDatabase/inventory.db' if DEV_MODE else '/opt/BourbonDatabase/inventory.db'
+
+RUNS_TABLE = 'warehouse_inventory_runs'
+DATES_TABLE = 'warehouse_check_dates'
+STATE_TABLE = 'warehouse_compaction_state'
+FULL_VIEW = 'warehouse_inventory_history_v2_full'
+
+logger = logging.getLogger('compact_warehouse_history')
+
+SCHEMA_SQL = f"""
+CREATE TABLE IF NOT EXISTS {DATES_TABLE} (
+  check_date DATE PRIMARY KEY
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS {RUNS_TABLE} (
+  nc_code TEXT NOT NULL,
+  from_date DATE NOT NULL,
+  to_date DATE NOT NULL,
+  total_available INTEGER,
+  listing_type TEXT,
+  supplier_allotment INTEGER,
+  PRIMARY KEY (nc_code, from_date)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_{RUNS_TABLE}_to_date ON {RUNS_TABLE}(to_date, nc_code);
+
+CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+  key TEXT PRIMARY KEY,
+  value TEXT
+);
+
+CREATE VIEW IF NOT EXISTS {FULL_VIEW} AS
+SELECT r.nc_code, d.check_date, r.total_available, r.listing_type, r.supplier_allotment
+FROM {RUNS_TABLE} r
+JOIN {DATES_TABLE} d ON d.check_date BETWEEN r.from_date AND r.to_date
+UNION ALL
+SELECT h.nc_code, h.check_date, h.total_available, h.listing_type, h.supplier_allotment
+FROM warehouse_inventory_history_v2 h
+WHERE h.check_date > COALESCE((SELECT value FROM {STATE_TABLE} WHERE key = 'compacted_through'), '');
+"""
+
+
+def ensure_schema(conn):
+    conn.executescript(SCHEMA_SQL)
+    _convert_integer_codes(conn)
+
+
+def _convert_integer_codes(conn):
+    """
+    Runs tables created with an INTEGER nc_code (the raw table's is TEXT) are
+    rebuilt with text codes in place; the runs may be the only copy of pruned rows
+    """
+    types = {r[1]: (r[2] or '').upper() for r in conn.execute(f"PRAGMA table_info({RUNS_TABLE})")}
+    if types.get('nc_code') != 'INTEGER':
+        return
+    logger.info(f"Converting {RUNS_TABLE}.nc_code from INTEGER to TEXT")
+    conn.executescript(f"""
+BEGIN IMMEDIATE;
+DROP VIEW IF EXISTS {FULL_VIEW};
+DROP INDEX IF EXISTS idx_{RUNS_TABLE}_to_date;
+ALTER TABLE {RUNS_TABLE} RENAME TO {RUNS_TABLE}_integer_codes;
+{SCHEMA_SQL}
+INSERT INTO {RUNS_TABLE} (nc_code, from_date, to_date, total_available, listing_type, supplier_allotment)
+SELECT CAST(nc_code AS TEXT), from_date, to_date, total_available, listing_type, supplier_allotment
+FROM {RUNS_TABLE}_integer_codes;
+DROP TABLE {RUNS_TABLE}_integer_codes;
+COMMIT;
+""")
+
+
+def get_compacted_through(conn):
+    try:
+        row = conn.execute(f"SELECT value FROM {STATE_TABLE} WHERE key = 'compacted_through'").fetchone()
+    except Exception:
+        return None
+    return row[0] if row else None
+
+
+def compute_runs(conn, compacted_through, through):
+    """
+    Read daily rows in (compacted_through, through] in (nc_code, check_date) index
+    order and fold them onto the runs still open at compacted_through.
+    Returns (runs_to_upsert, new_check_dates, rows_read).
+    """
+    lower = compacted_through or ''
+    new_dates = [r[0] for r in conn.execute(
+        "SELECT DISTINCT check_date FROM warehouse_inventory_history_v2 WHERE check_date > ? AND check_date <= ? "
+        "ORDER BY check_date", [lower, through])]
+    if not new_dates:
+        return [], [], 0
+
+    # Global predecessor of each new check_date; a run only continues across consecutive check_dates
+    prev_of = {d: (new_dates[i - 1] if i else compacted_through) for i, d in enumerate(new_dates)}
+
+    open_runs = {}
+    if compacted_through:
+        for nc_code, from_date, to_date, total, lt, allot in conn.execute(
+                f"SELECT nc_code, from_date, to_date, total_available, listing_type, supplier_allotment "
+                f"FROM {RUNS_TABLE} WHERE to_date = ?", [compacted_through]):
+            open_runs[nc_code] = [nc_code, from_date, to_date, total, lt, allot]
+
+    runs = []
+    rows_read = 0
+    current = None
+    cur = conn.execute(
+        "SELECT nc_code, check_date, total_available, listing_type, supplier_allotment "
+        "FROM warehouse_inventory_history_v2 WHERE check_date > ? AND check_date <= ? "
+        "ORDER BY nc_code, check_date", [lower, through])
+    for nc_code, check_date, total, lt, allot in cur:
+        rows_read += 1
+        if current is None or current[0] != nc_code:
+            if current is not None:
+                runs.append(tuple(current))
+            current = open_runs.pop(nc_code, None)
+        if (current is not None and current[2] == prev_of[check_date]
+                and (current[3], current[4], current[5]) == (total, lt, allot)):
+            current[2] = check_date
+            continue
+        if current is not None:
+            runs.append(tuple(current))
+        current = [nc_code, check_date, check_date, total, lt, allot]
+    if current is not None:
+        runs.append(tuple(current))
+
+    # Open runs never revisited above are already stored unchanged
+    return runs, new_dates, rows_read
+
+
+def compact(db_path=DB_PATH, through=None, prune_keep_days=None):
+    manager = get_database_manager(db_path)
+    with manager.get_connection() as conn:
+        ensure_schema(conn)
+        compacted_through = get_compacted_through(conn)
+        latest = conn.execute("SELECT MAX(check_date) FROM warehouse_inventory_history_v2").fetchone()[0]
+        if latest is None:
+            logger.info("warehouse_inventory_history_v2 is empty; nothing to compact.")
+            return {'runs': 0, 'rows_read': 0, 'compacted_through': compacted_through}
+        if through is None:
+            # The latest check_date may still be being scraped/upserted; leave it daily
+            through = (datetime.strptime(str(latest)[:10], '%Y-%m-%d') - timedelta(days=1)).strftime('%Y-%m-%d')
+        runs, new_dates, rows_read = compute_runs(conn, compacted_through, through)
+
+    if new_dates:
+        def write(conn):
+            if get_compacted_through(conn) != compacted_through:
+                raise RuntimeError("Another compaction advanced compacted_through concurrently")
+            conn.executemany(
+                f"INSERT OR REPLACE INTO {RUNS_TABLE} "
+                f"(nc_code, from_date, to_date, total_available, listing_type, supplier_allotment) "
+                f"VALUES (?, ?, ?, ?, ?, ?)", runs)
+            conn.executemany(f"INSERT OR IGNORE INTO {DATES_TABLE} (check_date) VALUES (?)",
+                             [(d,) for d in new_dates])
+            conn.execute(f"INSERT OR REPLACE INTO {STATE_TABLE} (key, value) VALUES ('compacted_through', ?)",
+                         [new_dates[-1]])
+        manager.execute_write(write)
+        compacted_through = new_dates[-1]
+        logger.info(f"Compacted {rows_read} daily rows over {len(new_dates)} check_dates into {len(runs)} runs "
+                    f"(through {compacted_through})")
+    else:
+        logger.info(f"No new check_dates to compact (compacted_through={compacted_through})")
+
+    pruned = 0
+    if prune_keep_days is not None and compacted_through:
+        keep_from = (datetime.strptime(str(latest)[:10], '%Y-%m-%d')
+                     - timedelta(days=prune_keep_days)).strftime('%Y-%m-%d')
+        horizon = min(keep_from, compacted_through)
+
+        def prune(conn):
+            return conn.execute("DELETE FROM warehouse_inventory_history_v2 WHERE check_date < ? AND check_date <= ?",
+                                [horizon, compacted_through]).rowcount
+        pruned = manager.execute_write(prune)
+        logger.info(f"Pruned {pruned} compacted daily rows older than {horizon}")
+
+    with manager.get_connection() as conn:
+        total_runs = conn.execute(f"SELECT COUNT(*) FROM {RUNS_TABLE}").fetchone()[0]
+    return {'runs': total_runs, 'new_runs': len(runs), 'rows_read': rows_read,
+            'compacted_through': compacted_through, 'pruned': pruned}
+
+
+def verify(db_path=DB_PATH):
+    """Check the _full view reproduces every raw daily row that is still present"""
+    manager = get_database_manager(db_path, read_only=True)
+    with manager.get_connection() as conn:
+        missing = conn.execute(f"""
+            SELECT COUNT(*) FROM (
+              SELECT nc_code, check_date, total_available, listing_type, supplier_allotment
+              FROM warehouse_inventory_history_v2
+              EXCEPT
+              SELECT nc_code, check_date, total_available, listing_type, supplier_allotment FROM {FULL_VIEW}
+            )""").fetchone()[0]
+        dupes = conn.execute(f"""
+            SELECT COUNT(*) FROM (
+              SELECT nc_code, check_date FROM {FULL_VIEW} GROUP BY nc_code, check_date HAVING COUNT(*) > 1
+            )""").fetchone()[0]
+    return {'missing_rows': missing, 'duplicate_rows': dupes, 'ok': missing == 0 and dupes == 0}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run-length compact warehouse_inventory_history_v2")
+    parser.add_argument("--db", default=DB_PATH, help=f"Inventory database (default: {DB_PATH})")
+    parser.add_argument("--through", help="Compact check_dates up to and including this date "
+                                          "(default: the day before the latest check_date)")
+    parser.add_argument("--prune-keep-days", type=int,
+                        help="Delete compacted raw daily rows older than N days before the latest check_date")
+    parser.add_argument("--verify", action="store_true", help="Verify the _full view against the raw table")
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s',
+                        stream=sys.stdout)
+    args = parse_args()
+    if args.verify:
+        result = verify(args.db)
+        logger.info(f"Verify: {result}")
+        sys.exit(0 if result['ok'] else 1)
+    result = compact(args.db, args.through, args.prune_keep_days)
+    logger.info(f"Done: {result}")
+
+
+if __name__ == '__main__':
+    main()
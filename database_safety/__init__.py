@@ -0,0 +1,16 @@
+"""
+Shared SQLite connection layer for the Python tooling (scrapers, report generator).
+
+Mirrors backend/config/databaseSafety.js: pragma-configured pooled connections,
+plus a bulk writer for batched upserts with busy backoff.
+"""
+
+from .manager import DatabaseManager, get_database_manager, get_safety_pragmas
+from .bulk import BulkWriter, TableSpec, TABLE_SPECS, build_upsert_sql
+from .retry import is_busy_error, run_with_busy_retry, with_busy_retry
+
+__all__ = [
+    'DatabaseManager', 'get_database_manager', 'get_safety_pragmas',
+    'BulkWriter', 'TableSpec', 'TABLE_SPECS', 'build_upsert_sql',
+    'is_busy_error', 'run_with_busy_retry', 'with_busy_retry',
+]
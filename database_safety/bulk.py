@@ -0,0 +1,130 @@
+"""
+Batched bulk ingestion for the scraper tables.
+
+Rows are buffered per table and flushed with executemany inside bounded
+IMMEDIATE transactions, so ingest holds the write lock once per batch
+instead of once per row. A busy database backs the whole batch off and
+retries it.
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .retry import run_with_busy_retry, DEFAULT_MAX_ATTEMPTS
+
+logger = logging.getLogger('database_safety')
+
+
+@dataclass(frozen=True)
+class TableSpec:
+    name: str
+    # Unique key for ON CONFLICT; None means append-only INSERT
+    conflict_columns: Optional[Tuple[str, ...]] = None
+
+
+TABLE_SPECS: Dict[str, TableSpec] = {
+    'warehouse_inventory_history_v2': TableSpec('warehouse_inventory_history_v2', ('nc_code', 'check_date')),
+    'shipments_history': TableSpec('shipments_history', ('nc_code', 'board_id', 'ship_date')),
+    # Change log: every detected change is its own row
+    'inventory_history': TableSpec('inventory_history', None),
+}
+
+
+def build_upsert_sql(spec: TableSpec, columns: Sequence[str]) -> str:
+    cols = ', '.join(columns)
+    placeholders = ', '.join('?' for _ in columns)
+    sql = f"INSERT INTO {spec.name} ({cols}) VALUES ({placeholders})"
+    if spec.conflict_columns:
+        updates = [c for c in columns if c not in spec.conflict_columns]
+        target = ', '.join(spec.conflict_columns)
+        if updates:
+            sets = ', '.join(f"{c} = excluded.{c}" for c in updates)
+            sql += f" ON CONFLICT({target}) DO UPDATE SET {sets}"
+        else:
+            sql += f" ON CONFLICT({target}) DO NOTHING"
+    return sql
+
+
+class BulkWriter:
+    """
+    Usage:
+        with manager.bulk_writer(batch_size=5000) as writer:
+            writer.upsert_warehouse_history({'nc_code': ..., 'check_date': ..., 'total_available': ...})
+    """
+
+    def __init__(self, manager, batch_size=5000, max_attempts=DEFAULT_MAX_ATTEMPTS, specs=None):
+        self.manager = manager
+        self.batch_size = max(1, batch_size)
+        self.max_attempts = max_attempts
+        self.specs = dict(TABLE_SPECS, **(specs or {}))
+        self._buffers: Dict[str, List[dict]] = {}
+        self.stats = {'rows': 0, 'batches': 0, 'retries': 0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        else:
+            dropped = sum(len(b) for b in self._buffers.values())
+            if dropped:
+                logger.warning(f"Discarding {dropped} buffered rows after error: {exc}")
+            self._buffers.clear()
+        return False
+
+    # ---------- Buffering ----------
+    def add(self, table: str, row: dict):
+        if table not in self.specs:
+            raise ValueError(f"No bulk spec for table {table}")
+        buf = self._buffers.setdefault(table, [])
+        buf.append(row)
+        if len(buf) >= self.batch_size:
+            self.flush(table)
+
+    def add_many(self, table: str, rows):
+        for row in rows:
+            self.add(table, row)
+
+    def upsert_warehouse_history(self, row: dict):
+        self.add('warehouse_inventory_history_v2', row)
+
+    def insert_inventory_history(self, row: dict):
+        self.add('inventory_history', row)
+
+    def upsert_shipment(self, row: dict):
+        self.add('shipments_history', row)
+
+    # ---------- Flushing ----------
+    def flush(self, table: Optional[str] = None):
+        tables = [table] if table else list(self._buffers.keys())
+        for t in tables:
+            rows = self._buffers.pop(t, [])
+            for i in range(0, len(rows), self.batch_size):
+                self._write_batch(self.specs[t], rows[i:i + self.batch_size])
+
+    def _write_batch(self, spec: TableSpec, rows: List[dict]):
+        if not rows:
+            return
+        # Group by column set so each executemany has a single statement
+        groups: Dict[Tuple[str, ...], List[tuple]] = {}
+        for row in rows:
+            cols = tuple(sorted(row.keys()))
+            groups.setdefault(cols, []).append(tuple(row[c] for c in cols))
+
+        def write(conn):
+            for cols, values in groups.items():
+                conn.executemany(build_upsert_sql(spec, cols), values)
+
+        def count_retry(attempt, exc):
+            self.stats['retries'] += 1
+
+        def attempt():
+            with self.manager.transaction(max_attempts=1) as conn:
+                write(conn)
+
+        run_with_busy_retry(attempt, max_attempts=self.max_attempts, on_retry=count_retry)
+        self.stats['rows'] += len(rows)
+        self.stats['batches'] += 1
+        logger.debug(f"Wrote batch of {len(rows)} rows to {spec.name}")
@@ -0,0 +1,205 @@
+"""
+Pooled, pragma-configured SQLite connection manager.
+
+Python counterpart of backend/config/databaseSafety.js: every connection gets the
+same safety pragmas, connections are reused from a bounded pool, and write
+transactions take the lock up front (BEGIN IMMEDIATE) with busy backoff.
+"""
+
+import queue
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from .retry import run_with_busy_retry
+
+logger = logging.getLogger('database_safety')
+
+
+def get_safety_pragmas(busy_timeout_ms=30000):
+    """Same pragma set as DatabaseManager.getSafetyPragmas() on the Node side"""
+    return [
+        # WAL mode for better concurrency
+        'PRAGMA journal_mode = WAL',
+        'PRAGMA foreign_keys = ON',
+        'PRAGMA synchronous = NORMAL',
+        f'PRAGMA busy_timeout = {int(busy_timeout_ms)}',
+        'PRAGMA cache_size = -64000',      # 64MB cache
+        'PRAGMA mmap_size = 134217728',    # 128MB
+        'PRAGMA wal_autocheckpoint = 1000',
+        'PRAGMA secure_delete = ON',
+        'PRAGMA cell_size_check = ON',
+    ]
+
+
+class DatabaseManager:
+    def __init__(self, db_path, max_connections=5, acquire_timeout=30.0, busy_timeout_ms=30000,
+                 read_only=False):
+        self.db_path = str(db_path)
+        self.max_connections = max_connections
+        self.acquire_timeout = acquire_timeout
+        self.busy_timeout_ms = busy_timeout_ms
+        self.read_only = read_only
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._in_use = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    # ---------- Connection lifecycle ----------
+    def _create_connection(self):
+        if self.read_only:
+            uri = f"{Path(self.db_path).resolve().as_uri()}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, timeout=self.busy_timeout_ms / 1000,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA query_only = ON')
+            conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout_ms)}')
+            return conn
+
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout_ms / 1000, check_same_thread=False)
+        for pragma in get_safety_pragmas(self.busy_timeout_ms):
+            try:
+                conn.execute(pragma)
+            except sqlite3.Error as e:
+                conn.close()
+                logger.error(f"Failed to apply pragma \"{pragma}\": {e}")
+                raise
+        logger.debug(f"Applied safety pragmas to {Path(self.db_path).name}")
+        return conn
+
+    def _acquire(self):
+        if self._closed:
+            raise RuntimeError('DatabaseManager is closed')
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if self._created < self.max_connections:
+                    self._created += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    conn = self._create_connection()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                try:
+                    conn = self._idle.get(timeout=self.acquire_timeout)
+                except queue.Empty:
+                    raise TimeoutError(
+                        f"No database connection available after {self.acquire_timeout}s "
+                        f"({self.max_connections} in use)")
+        with self._lock:
+            self._in_use += 1
+        return conn
+
+    def _release(self, conn):
+        with self._lock:
+            self._in_use -= 1
+        if self._closed:
+            conn.close()
+            with self._lock:
+                self._created -= 1
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def get_connection(self):
+        """
+        Borrow a pooled connection. Rolls back on error, commits any open
+        transaction on clean exit, then returns the connection to the pool.
+        """
+        conn = self._acquire()
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self._release(conn)
+
+    @contextmanager
+    def transaction(self, max_attempts=8):
+        """
+        Write transaction that takes the RESERVED lock up front (BEGIN IMMEDIATE),
+        retrying the BEGIN with backoff while another writer holds it.
+        """
+        with self.get_connection() as conn:
+            run_with_busy_retry(conn.execute, 'BEGIN IMMEDIATE', max_attempts=max_attempts)
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    def execute_write(self, fn, max_attempts=8):
+        """
+        Run fn(conn) inside an IMMEDIATE transaction; the whole transaction is
+        retried with backoff if SQLite reports busy/locked at any point.
+        """
+        def attempt():
+            with self.transaction(max_attempts=1) as conn:
+                return fn(conn)
+        return run_with_busy_retry(attempt, max_attempts=max_attempts)
+
+    def bulk_writer(self, batch_size=5000, **kwargs):
+        from .bulk import BulkWriter
+        return BulkWriter(self, batch_size=batch_size, **kwargs)
+
+    # ---------- Monitoring / shutdown ----------
+    def get_pool_stats(self):
+        with self._lock:
+            return {
+                'used': self._in_use,
+                'free': self._idle.qsize(),
+                'created': self._created,
+                'max': self.max_connections,
+            }
+
+    def health_check(self):
+        try:
+            with self.get_connection() as conn:
+                conn.execute('SELECT 1')
+            return {'status': 'healthy', 'pool': self.get_pool_stats()}
+        except Exception as e:
+            return {'status': 'unhealthy', 'error': str(e)}
+
+    def close_all_connections(self):
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                conn.close()
+            finally:
+                with self._lock:
+                    self._created -= 1
+        logger.info(f"Closed pooled connections for {Path(self.db_path).name}")
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_database_manager(db_path, **kwargs):
+    """Process-wide manager per database path and access mode (like the Node singleton)"""
+    key = (str(Path(db_path).resolve()), bool(kwargs.get('read_only')))
+    with _managers_lock:
+        mgr = _managers.get(key)
+        if mgr is None or mgr._closed:
+            mgr = DatabaseManager(db_path, **kwargs)
+            _managers[key] = mgr
+        return mgr
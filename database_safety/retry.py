@@ -0,0 +1,69 @@
+"""
+Busy/locked detection and exponential backoff for SQLite writes
+"""
+
+import time
+import random
+import logging
+import sqlite3
+from functools import wraps
+
+logger = logging.getLogger('database_safety')
+
+SQLITE_BUSY = 5
+SQLITE_LOCKED = 6
+
+DEFAULT_MAX_ATTEMPTS = 8
+DEFAULT_BASE_DELAY = 0.05   # seconds
+DEFAULT_MAX_DELAY = 5.0     # seconds
+
+
+def is_busy_error(exc: BaseException) -> bool:
+    """True for SQLITE_BUSY / SQLITE_LOCKED, including extended codes"""
+    if not isinstance(exc, sqlite3.OperationalError):
+        return False
+    code = getattr(exc, 'sqlite_errorcode', None)
+    if code is not None:
+        return (code & 0xff) in (SQLITE_BUSY, SQLITE_LOCKED)
+    msg = str(exc).lower()
+    return 'locked' in msg or 'busy' in msg
+
+
+def backoff_delays(max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY):
+    """Full-jitter exponential delays between attempts (max_attempts - 1 values)"""
+    for attempt in range(max_attempts - 1):
+        yield random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def run_with_busy_retry(fn, *args, max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY,
+                        max_delay=DEFAULT_MAX_DELAY, on_retry=None, **kwargs):
+    """Call fn, retrying with backoff while SQLite reports the database busy/locked"""
+    delays = backoff_delays(max_attempts, base_delay, max_delay)
+    attempt = 1
+    while True:
+        try:
+            return fn(*args, **kwargs)
+        except sqlite3.OperationalError as e:
+            if not is_busy_error(e):
+                raise
+            delay = next(delays, None)
+            if delay is None:
+                if max_attempts > 1:
+                    logger.error(f"Database still busy after {attempt} attempts: {e}")
+                raise
+            logger.warning(f"Database busy (attempt {attempt}/{max_attempts}), retrying in {delay:.2f}s: {e}")
+            if on_retry:
+                on_retry(attempt, e)
+            time.sleep(delay)
+            attempt += 1
+
+
+def with_busy_retry(max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY):
+    """Decorator form of run_with_busy_retry"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            return run_with_busy_retry(fn, *args, max_attempts=max_attempts, base_delay=base_delay,
+                                       max_delay=max_delay, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Integer day keys for the history tables (migration + helpers)
+
+check_date / check_time are TEXT, so every window filter is a string
+comparison, and the (nc_code, check_date) index still needs a table lookup
+for total_available. This adds
+
+- day_key INTEGER   days since 1970-01-01 of the row's date column,
+                    CAST(julianday(col) - 2440587.5 AS INTEGER), the same day
+                    as DATE(col)
+- triggers          fill day_key on INSERT (when the writer left it NULL) and
+                    on UPDATE of the date column, so existing writers need no change
+- covering indexes  warehouse_inventory_history_v2 (nc_code, day_key, total_available)
+                    and (day_key, nc_code, total_available); inventory_history
+                    (plu, day_key) and (day_key), so report window scans read
+                    only the index
+
+The generator's window scans and the backend's delivery/arrival date filters
+use day_key once the migration has finished (day_key_ready: the indexes are
+built after the backfill) and the text columns until then.
+
+It is a plain column kept up to date by triggers, not a generated column:
+SQLite (3.40) does not treat an index on a generated column as covering, so
+every row would be looked up in the table anyway.
+
+The backfill runs in batches of short IMMEDIATE transactions, so the scraper
+keeps writing during the migration. It walks the table in rowid order, so
+rows whose date julianday() can't parse are passed over once and counted in
+the log (their day_key stays NULL and --verify reports them). Archive files
+listed in history_archives are migrated too, so the archiver's SELECT *
+copies keep lining up with the hot table.
+
+    python3 day_keys.py            # migrate (idempotent, resumable)
+    python3 day_keys.py --verify   # rows whose day_key is missing or wrong
+    python3 day_keys.py --down     # drop triggers, indexes and the column
+"""
+
+import os
+import sys
+import sqlite3
+import logging
+import argparse
+from datetime import date, timedelta
+from functools import lru_cache
+from pathlib import Path
+
+from database_safety import get_database_manager
+
+DEV_MODE = os.getenv('DEV_MODE', 'false').lower() == 'true'
+DB_PATH = './BourbonDatabase/inventory.db' if DEV_MODE else '/opt/BourbonDatabase/inventory.db'
+
+DAY_KEY_COLUMN = 'day_key'
+EPOCH = date(1970, 1, 1)
+BACKFILL_BATCH = 50000
+
+DAY_KEY_TABLES = {
+    'warehouse_inventory_history_v2': {
+        'date_column': 'check_date',
+        'indexes': {
+            'idx_warehouse_inventory_nc_day': ('nc_code', 'day_key', 'total_available'),
+            'idx_warehouse_inventory_day': ('day_key', 'nc_code', 'total_available'),
+        },
+    },
+    'inventory_history': {
+        'date_column': 'check_time',
+        'indexes': {
+            'idx_inventory_history_plu_day': ('plu', 'day_key'),
+            'idx_inventory_history_day': ('day_key',),
+        },
+    },
+}
+
+logger = logging.getLogger('day_keys')
+
+
+# ------------------ Helpers ------------------
+def day_key_sql(column: str) -> str:
+    """SQL expression for a date/datetime column's day key"""
+    return f'CAST(julianday("{column}") - 2440587.5 AS INTEGER)'
+
+
+def day_key(value) -> int:
+    """'YYYY-MM-DD[...]' (or a date) -> days since 1970-01-01"""
+    if isinstance(value, date):
+        return (value - EPOCH).days
+    return (date.fromisoformat(str(value)[:10]) - EPOCH).days
+
+
+@lru_cache(maxsize=8192)
+def day_key_to_date(key: int) -> str:
+    return (EPOCH + timedelta(days=key)).isoformat()
+
+
+def date_from_key_sql(expr: str) -> str:
+    """SQL converting a day key expression back to 'YYYY-MM-DD'"""
+    return f"date({expr} * 86400, 'unixepoch')"
+
+
+def has_day_key(conn, table: str, schema: str = 'main') -> bool:
+    return any(r[1] == DAY_KEY_COLUMN for r in conn.execute(f'PRAGMA {schema}.table_info("{table}")'))
+
+
+def day_key_ready(conn, table: str, schema: str = 'main') -> bool:
+    """
+    True once migrate_table has backfilled `table`: its day_key indexes are
+    created only after the last batch, so readers gating on them never see
+    rows whose day_key is still NULL (has_day_key is already true mid-backfill).
+    """
+    names = list(DAY_KEY_TABLES[table]['indexes'])
+    found = conn.execute(f"SELECT COUNT(*) FROM {schema}.sqlite_master WHERE type = 'index' AND name IN "
+                         f"({','.join(['?'] * len(names))})", names).fetchone()[0]
+    return found == len(names)
+
+
+def _table_exists(conn, table: str, schema: str = 'main') -> bool:
+    return conn.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?",
+                        [table]).fetchone() is not None
+
+
+def _trigger_sql(table, date_col):
+    expr = day_key_sql(date_col).replace(f'"{date_col}"', f'NEW."{date_col}"')
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS trg_{table}_day_key_insert AFTER INSERT ON {table} "
+        f"WHEN NEW.{DAY_KEY_COLUMN} IS NULL BEGIN "
+        f"UPDATE {table} SET {DAY_KEY_COLUMN} = {expr} WHERE rowid = NEW.rowid; END",
+        f'CREATE TRIGGER IF NOT EXISTS trg_{table}_day_key_update AFTER UPDATE OF "{date_col}" ON {table} BEGIN '
+        f"UPDATE {table} SET {DAY_KEY_COLUMN} = {expr} WHERE rowid = NEW.rowid; END",
+    ]
+
+
+# ------------------ Migration ------------------
+def migrate_table(manager, table, spec, batch=BACKFILL_BATCH, triggers=True):
+    """Add, backfill and index day_key on one table; returns rows backfilled"""
+    date_col = spec['date_column']
+    with manager.get_connection() as conn:
+        if not _table_exists(conn, table):
+            logger.info(f"{Path(manager.db_path).name}: no {table} table, skipping")
+            return 0
+        present = has_day_key(conn, table)
+
+    def add_column(conn):
+        if not has_day_key(conn, table):
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {DAY_KEY_COLUMN} INTEGER")
+        if triggers:
+            for sql in _trigger_sql(table, date_col):
+                conn.execute(sql)
+    if not present or triggers:
+        manager.execute_write(add_column)  # triggers first: rows written during the backfill fill themselves
+
+    # Walk rowids forward: a date julianday() can't parse leaves day_key NULL,
+    # so "WHERE day_key IS NULL" alone would select the same rows forever.
+    pending = f"{DAY_KEY_COLUMN} IS NULL AND \"{date_col}\" IS NOT NULL"
+
+    def backfill(conn, after):
+        """(rows selected, rows still NULL, last rowid) for the next batch after `after`"""
+        rows = conn.execute(f"SELECT rowid FROM {table} WHERE rowid > ? AND {pending} ORDER BY rowid LIMIT ?",
+                            [after, batch]).fetchall()
+        if not rows:
+            return 0, 0, after
+        last = rows[-1][0]
+        conn.execute(f"UPDATE {table} SET {DAY_KEY_COLUMN} = {day_key_sql(date_col)} "
+                     f"WHERE rowid > ? AND rowid <= ? AND {pending}", [after, last])
+        unparsed = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE rowid > ? AND rowid <= ? AND {pending}",
+                                [after, last]).fetchone()[0]
+        return len(rows), unparsed, last
+
+    total = skipped = batches = 0
+    after = -(1 << 63)
+    while True:
+        n, unparsed, after = manager.execute_write(lambda conn, after=after: backfill(conn, after))
+        total += n - unparsed
+        skipped += unparsed
+        batches += 1
+        if n < batch:
+            break
+        if batches % 10 == 0:
+            logger.info(f"{table}: backfilled {total} rows so far")
+    if skipped:
+        logger.warning(f"{Path(manager.db_path).name}: {skipped} {table} rows have a {date_col} that is "
+                       f"not a date; their day_key stays NULL")
+
+    for name, cols in spec['indexes'].items():
+        manager.execute_write(lambda conn, name=name, cols=cols: conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {name} ON {table}({', '.join(cols)})"))
+    with manager.get_connection() as conn:
+        conn.execute(f"ANALYZE {table}")
+    logger.info(f"{Path(manager.db_path).name}: {table}.day_key ready ({total} rows backfilled, "
+                f"{skipped} skipped, indexes {', '.join(spec['indexes'])})")
+    return total
+
+
+def _archive_files(manager):
+    try:
+        with manager.get_connection() as conn:
+            return conn.execute("SELECT DISTINCT archive_file FROM history_archives").fetchall()
+    except sqlite3.OperationalError:
+        return []
+
+
+def migrate(db_path=DB_PATH, batch=BACKFILL_BATCH, archives=True):
+    manager = get_database_manager(db_path)
+    result = {}
+    for table, spec in DAY_KEY_TABLES.items():
+        result[table] = migrate_table(manager, table, spec, batch)
+    if archives:
+        base = Path(db_path).resolve().parent
+        for (archive_file,) in _archive_files(manager):
+            path = base / archive_file
+            if not path.exists():
+                logger.warning(f"Archive {archive_file} listed in history_archives is missing")
+                continue
+            arch = get_database_manager(path)
+            for table, spec in DAY_KEY_TABLES.items():
+                # archives are written once by the archiver (SELECT * from the hot table): no triggers
+                result[f"{archive_file}:{table}"] = migrate_table(arch, table, spec, batch, triggers=False)
+    return result
+
+
+def verify(db_path=DB_PATH):
+    """{table: rows whose day_key is NULL or differs from the date column}"""
+    manager = get_database_manager(db_path, read_only=True)
+    out = {}
+    with manager.get_connection() as conn:
+        for table, spec in DAY_KEY_TABLES.items():
+            if not _table_exists(conn, table) or not has_day_key(conn, table):
+                out[table] = None
+                continue
+            col = spec['date_column']
+            out[table] = conn.execute(
+                f"SELECT COUNT(*) FROM {table} WHERE \"{col}\" IS NOT NULL AND "
+                f"({DAY_KEY_COLUMN} IS NULL OR {DAY_KEY_COLUMN} != {day_key_sql(col)})").fetchone()[0]
+    return out
+
+
+def downgrade(db_path=DB_PATH):
+    manager = get_database_manager(db_path)
+    for table, spec in DAY_KEY_TABLES.items():
+        def drop(conn, table=table, spec=spec):
+            if not _table_exists(conn, table) or not has_day_key(conn, table):
+                return
+            conn.execute(f"DROP TRIGGER IF EXISTS trg_{table}_day_key_insert")
+            conn.execute(f"DROP TRIGGER IF EXISTS trg_{table}_day_key_update")
+            for name in spec['indexes']:
+                conn.execute(f"DROP INDEX IF EXISTS {name}")
+            conn.execute(f"ALTER TABLE {table} DROP COLUMN {DAY_KEY_COLUMN}")
+        manager.execute_write(drop)
+        logger.info(f"Dropped {table}.day_key")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Add integer day_key columns and covering indexes")
+    parser.add_argument("--db", default=DB_PATH, help=f"Inventory DB (default: {DB_PATH})")
+    parser.add_argument("--batch", type=int, default=BACKFILL_BATCH, help="Rows per backfill transaction")
+    parser.add_argument("--no-archives", action="store_true", help="Leave archive files untouched")
+    parser.add_argument("--verify", action="store_true", help="Count rows with a missing/wrong day_key")
+    parser.add_argument("--down", action="store_true", help="Remove the column, triggers and indexes")
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stdout)
+    args = parse_args()
+    if args.verify:
+        bad = verify(args.db)
+        for table, n in bad.items():
+            print(f"{table}: {'not migrated' if n is None else f'{n} bad rows'}")
+        sys.exit(1 if any(n for n in bad.values()) else 0)
+    if args.down:
+        downgrade(args.db)
+        return
+    migrate(args.db, args.batch, archives=not args.no_archives)
+
+
+if __name__ == '__main__':
+    main()
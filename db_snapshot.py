@@ -0,0 +1,191 @@
+"""
+Read snapshots of inventory.db for report runs
+
+The scraper writes to inventory.db while reports run; with timeout=30 a long
+write can stall a report query or fail it with "database is locked". A
+snapshot copies the live file once with SQLite's online backup API, and every
+report query then reads the copy, so writers and report runs never wait on
+each other.
+
+- The backup runs in paged steps inside one read transaction on the source.
+  In WAL mode that pins a consistent view, so concurrent scraper commits
+  neither block the copy nor restart it.
+- target 'file': <snapshot_dir>/<db name>.snapshot.db, opened with
+  mode=ro&immutable=1 (no locking or change detection, which is only safe
+  because nothing writes the copy) plus large cache/mmap settings.
+  target 'memory': a shared-cache in-memory database held open by the
+  snapshot object.
+- Reuse: in a long-running process the source connection stays open and
+  PRAGMA data_version tells whether any other connection committed since the
+  copy. PRAGMA data_version only means something on a single open connection,
+  so across cron runs a file snapshot is reused while the live DB and WAL
+  still have the size and mtime recorded next to it (<snapshot>.json).
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import itertools
+from pathlib import Path
+
+logger = logging.getLogger('warehouse_inventory_generator')
+
+SNAPSHOT_TARGETS = ('off', 'file', 'memory')
+BACKUP_PAGES = 1024  # pages per backup step
+BACKUP_SLEEP = 0.05  # seconds to back off when a step finds the source busy
+READ_PRAGMAS = (
+    "PRAGMA cache_size = -262144",  # 256MB
+    "PRAGMA mmap_size = 1073741824",  # 1GB
+    "PRAGMA temp_store = MEMORY",
+)
+
+_memory_ids = itertools.count()
+
+
+def source_fingerprint(db_path):
+    """(size, mtime_ns) of the DB and its WAL; changes whenever a commit reaches either file"""
+    out = []
+    for suffix in ('', '-wal'):
+        try:
+            st = os.stat(f"{db_path}{suffix}")
+            out.append([st.st_size, st.st_mtime_ns])
+        except FileNotFoundError:
+            out.append(None)
+    return out
+
+
+class ReadSnapshot:
+    """
+    Usage:
+        snap = ReadSnapshot(db_path, 'file', snapshot_dir)
+        snap.refresh()             # copies only if the source changed
+        conn = snap.connect()      # any number of read connections
+        ...
+        snap.close()
+    """
+
+    def __init__(self, db_path, target='file', snapshot_dir=None, pages=BACKUP_PAGES):
+        if target not in ('file', 'memory'):
+            raise ValueError(f"Unknown snapshot target: {target}")
+        self.db_path = Path(db_path)
+        self.target = target
+        self.pages = pages
+        self._source = None
+        self._data_version = None
+        self._keeper = None
+        self.taken_at = None
+        if target == 'file':
+            base = Path(snapshot_dir) if snapshot_dir else self.db_path.parent
+            base.mkdir(parents=True, exist_ok=True)
+            self.path = base / f"{self.db_path.stem}.snapshot.db"
+            self.state_path = self.path.with_name(self.path.name + '.json')
+            self.uri = f"{self.path.resolve().as_uri()}?mode=ro&immutable=1"
+        else:
+            self.path = self.state_path = None
+            self.uri = f"file:inventory_snapshot_{os.getpid()}_{next(_memory_ids)}?mode=memory&cache=shared"
+
+    # ---------- freshness ----------
+    def _open_source(self):
+        if self._source is None:
+            self._source = sqlite3.connect(f"{self.db_path.resolve().as_uri()}?mode=ro", uri=True,
+                                           timeout=30, isolation_level=None)
+        return self._source
+
+    def _current_version(self):
+        return self._open_source().execute("PRAGMA data_version").fetchone()[0]
+
+    def _saved_state(self):
+        if self.state_path is None or not self.path.exists() or not self.state_path.exists():
+            return None
+        try:
+            return json.loads(self.state_path.read_text(encoding='utf-8'))
+        except ValueError:
+            return None
+
+    def is_fresh(self):
+        version = self._current_version()
+        if self._data_version is not None:
+            return version == self._data_version
+        state = self._saved_state()
+        fresh = (state is not None and state.get('source') == str(self.db_path.resolve())
+                 and state.get('fingerprint') == source_fingerprint(self.db_path))
+        if fresh:
+            # Read before the fingerprint, so any later commit still moves data_version
+            self._data_version = version
+        return fresh
+
+    # ---------- copy ----------
+    def refresh(self, force=False):
+        """Copy the live DB unless the current snapshot still matches it; returns True if copied"""
+        if not force and self.is_fresh():
+            if self.taken_at is None:
+                self.taken_at = self._saved_state()['taken_at']
+            logger.info(f"Reusing {self.target} snapshot of {self.db_path} taken {self.taken_at}")
+            return False
+        started = time.monotonic()
+        src = self._open_source()
+        fingerprint = source_fingerprint(self.db_path)
+        wal = src.execute("PRAGMA journal_mode").fetchone()[0].lower() == 'wal'
+        if self.target == 'file':
+            tmp = self.path.with_name(self.path.name + '.tmp')
+            tmp.unlink(missing_ok=True)
+            dst = sqlite3.connect(tmp)
+        else:
+            dst = sqlite3.connect(self.uri, uri=True)
+        steps = [0]
+
+        def progress(status, remaining, total):
+            steps[0] += 1
+
+        try:
+            if wal:
+                # One read transaction for the whole copy: a fixed view, writers keep committing
+                src.execute("BEGIN")
+                src.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+            try:
+                data_version = src.execute("PRAGMA data_version").fetchone()[0]
+                src.backup(dst, pages=self.pages, progress=progress, sleep=BACKUP_SLEEP)
+            finally:
+                if wal:
+                    src.execute("COMMIT")
+        except BaseException:
+            dst.close()
+            if self.target == 'file':
+                tmp.unlink(missing_ok=True)
+            raise
+
+        self.taken_at = time.strftime('%Y-%m-%d %H:%M:%S')
+        self._data_version = data_version
+        if self.target == 'file':
+            dst.close()
+            os.replace(tmp, self.path)
+            tmp_state = self.state_path.with_name(self.state_path.name + '.tmp')
+            tmp_state.write_text(json.dumps({'source': str(self.db_path.resolve()), 'fingerprint': fingerprint,
+                                             'taken_at': self.taken_at}), encoding='utf-8')
+            os.replace(tmp_state, self.state_path)
+        else:
+            if self._keeper is not None:
+                self._keeper.close()
+            self._keeper = dst  # the shared in-memory DB lives as long as one connection to it does
+        logger.info(f"Took {self.target} snapshot of {self.db_path} in {time.monotonic() - started:.2f}s "
+                    f"({steps[0]} backup steps{', pinned WAL read' if wal else ''})")
+        return True
+
+    # ---------- readers ----------
+    def connect(self):
+        conn = sqlite3.connect(self.uri, uri=True)
+        for pragma in READ_PRAGMAS:
+            conn.execute(pragma)
+        if self.target == 'memory':
+            conn.execute("PRAGMA read_uncommitted = ON")  # no shared-cache table locks between readers
+        return conn
+
+    def close(self):
+        """Release the source connection and an in-memory copy; a snapshot file stays for reuse"""
+        for c in (self._source, self._keeper):
+            if c is not None:
+                c.close()
+        self._source = self._keeper = None
+        self._data_version = None
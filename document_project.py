@@ -21,17 +21,36 @@ import argparse
 import datetime
 import sqlite3
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Set, Optional, Any
+from typing import Dict, List, Set, Optional, Any, Tuple
+
+# Bump when filters/summarizers change so stale cached output is discarded
+CACHE_VERSION = 1
+CACHE_FILENAME = ".docgen-cache.json"
 
 
 class EnhancedBourbonTrackerDocumenter:
-    def __init__(self, project_root: str = ".", verbose: bool = False):
+    def __init__(self, project_root: str = ".", verbose: bool = False,
+                 use_cache: bool = True, workers: int = 8):
         self.project_root = Path(project_root).resolve()
         self.output_dir = self.project_root / "Project_Files"
         self.output_dir.mkdir(parents=True, exist_ok=True)
         self.timestamp = datetime.datetime.now().isoformat()
         self.verbose = verbose
+        self.use_cache = use_cache
+        self.workers = max(1, workers)
+
+        # One pruned walk per run, shared by every collect_files_by_pattern call
+        self._file_index: Optional[List[Tuple[str, Path, os.stat_result]]] = None
+
+        # Processed-content cache keyed on rel path, invalidated by mtime+size
+        self.cache_path = self.output_dir / CACHE_FILENAME
+        cache_data = self._load_cache() if use_cache else {}
+        self._cache: Dict[str, Dict[str, Any]] = cache_data.get("files", {})
+        # Schema snapshots keyed on db path; reused while file identity + schema_version match
+        self._schema_cache: Dict[str, Dict[str, Any]] = cache_data.get("schemas", {})
+        self._cache_dirty = False
 
         print(f"[docgen] project_root = {self.project_root}")
         print(f"[docgen] output_dir   = {self.output_dir}")
@@ -304,11 +323,11 @@ class EnhancedBourbonTrackerDocumenter:
             # Inventory database - production location (if accessible)
             ("inventory_database_prod", Path("/opt/BourbonDatabase/inventory.db"))
         ]
+        known = {str(path) for _, path in db_locations}
         
-        # Also find any other .db or .sqlite files
-        for db_file in self.project_root.rglob("*.db"):
-            if not any(part in self.exclude_dirs for part in db_file.parts):
-                rel_path = str(db_file.relative_to(self.project_root))
+        # Also find any other .db files, reusing the pruned project walk
+        for rel_path, db_file, _ in self.walk_project_files():
+            if db_file.suffix == '.db' and str(db_file) not in known:
                 db_locations.append((f"database_{rel_path.replace('/', '_').replace('.', '_')}", db_file))
         
         for db_name, db_path in db_locations:
@@ -330,60 +349,139 @@ class EnhancedBourbonTrackerDocumenter:
         
         return schemas
 
+    def _connect_readonly(self, db_path: Path) -> sqlite3.Connection:
+        """Open a database without taking write locks; fall back to immutable when ro cannot attach"""
+        uri = db_path.resolve().as_uri()
+        try:
+            conn = sqlite3.connect(f"{uri}?mode=ro", uri=True, timeout=5)
+            conn.execute("SELECT 1 FROM sqlite_master LIMIT 1")
+        except sqlite3.OperationalError:
+            # e.g. WAL database in a directory we cannot create -shm in
+            conn = sqlite3.connect(f"{uri}?immutable=1", uri=True)
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def _collect_table_stats(self, cursor: sqlite3.Cursor, tables: List[str]) -> Dict[str, Dict[str, int]]:
+        """Row counts and page usage per table in one dbstat pass, COUNT(*) fallback otherwise"""
+        stats: Dict[str, Dict[str, int]] = {}
+        try:
+            cursor.execute("""
+                SELECT name,
+                       COUNT(*) AS pages,
+                       SUM(pgsize) AS bytes,
+                       SUM(CASE WHEN pagetype = 'leaf' THEN ncell ELSE 0 END) AS leaf_cells
+                FROM dbstat
+                GROUP BY name
+            """)
+            for name, pages, size, leaf_cells in cursor.fetchall():
+                stats[name] = {"pages": pages, "bytes": size or 0}
+                if name in tables:
+                    # Leaf cells of a rowid table b-tree are exactly its rows
+                    stats[name]["rows"] = leaf_cells or 0
+        except sqlite3.Error as e:
+            if self.verbose:
+                print(f"[db-stats] dbstat unavailable, counting rows: {e}")
+            for table_name in tables:
+                try:
+                    cursor.execute(f'SELECT COUNT(*) FROM "{table_name}"')
+                    stats.setdefault(table_name, {})["rows"] = cursor.fetchone()[0]
+                except sqlite3.Error:
+                    continue
+        return stats
+
     def extract_single_sqlite_schema(self, db_path: Path) -> Optional[Dict]:
         """Extract schema from a single SQLite database"""
         try:
-            conn = sqlite3.connect(db_path)
+            conn = self._connect_readonly(db_path)
             cursor = conn.cursor()
-            
-            # Get all tables
-            cursor.execute("SELECT name, sql FROM sqlite_master WHERE type='table'")
-            tables_data = cursor.fetchall()
-            
-            schema = {
-                "tables": {},
-                "foreign_keys": [],
-                "samples": {},
-                "metadata": {}
-            }
-            
-            for table_name, create_sql in tables_data:
-                if table_name.startswith('sqlite_'):
-                    continue
-                    
-                # Store CREATE TABLE statement
-                schema["tables"][table_name] = create_sql
-                
-                # Get column info
-                cursor.execute(f"PRAGMA table_info({table_name})")
-                columns_info = cursor.fetchall()
-                
-                # Get foreign keys
-                cursor.execute(f"PRAGMA foreign_key_list({table_name})")
-                fk_info = cursor.fetchall()
-                for fk in fk_info:
-                    schema["foreign_keys"].append({
-                        "table": table_name,
-                        "id": fk[0], "seq": fk[1], "ref_table": fk[2],
-                        "from_column": fk[3], "to_column": fk[4],
-                        "on_update": fk[5], "on_delete": fk[6], "match": fk[7]
-                    })
-                
-                # Get sample data (first 5 rows)
+
+            st = db_path.stat()
+            identity = [st.st_dev, st.st_ino]
+            wal = db_path.with_name(db_path.name + "-wal")
+            freshness = [st.st_mtime_ns, st.st_size, wal.stat().st_size if wal.exists() else 0]
+            schema_version = cursor.execute("PRAGMA schema_version").fetchone()[0]
+
+            cache_key = str(db_path)
+            cached = self._schema_cache.get(cache_key)
+            if (cached and cached.get("identity") == identity
+                    and cached.get("schema_version") == schema_version):
+                if cached.get("freshness") == freshness:
+                    conn.close()
+                    if self.verbose:
+                        print(f"[db-cache] {db_path} unchanged")
+                    return cached["schema"]
+                schema = cached["schema"]
+                if self.verbose:
+                    print(f"[db-cache] {db_path} schema unchanged, refreshing samples/stats")
+            else:
+                schema = None
+
+            if schema is None:
+                schema = {
+                    "tables": {},
+                    "foreign_keys": [],
+                    "samples": {},
+                    "metadata": {}
+                }
+
+                # Get all tables
+                cursor.execute("SELECT name, sql FROM sqlite_master WHERE type='table'")
+                for table_name, create_sql in cursor.fetchall():
+                    if table_name.startswith('sqlite_'):
+                        continue
+
+                    # Store CREATE TABLE statement
+                    schema["tables"][table_name] = create_sql
+
+                    # Get foreign keys
+                    cursor.execute(f'PRAGMA foreign_key_list("{table_name}")')
+                    for fk in cursor.fetchall():
+                        schema["foreign_keys"].append({
+                            "table": table_name,
+                            "id": fk[0], "seq": fk[1], "ref_table": fk[2],
+                            "from_column": fk[3], "to_column": fk[4],
+                            "on_update": fk[5], "on_delete": fk[6], "match": fk[7]
+                        })
+
+            tables = list(schema["tables"].keys())
+
+            # Get sample data (first 5 rows)
+            schema["samples"] = {}
+            for table_name in tables:
                 try:
-                    cursor.execute(f"SELECT * FROM {table_name} LIMIT 5")
+                    cursor.execute(f'SELECT * FROM "{table_name}" LIMIT 5')
                     sample_rows = cursor.fetchall()
                     if sample_rows:
-                        column_names = [desc[1] for desc in columns_info]
                         schema["samples"][table_name] = {
-                            "columns": column_names,
+                            "columns": [desc[0] for desc in cursor.description],
                             "rows": sample_rows
                         }
                 except Exception as e:
                     if self.verbose:
                         print(f"[db-sample] Could not get sample from {table_name}: {e}")
-            
+
+            page_size = cursor.execute("PRAGMA page_size").fetchone()[0]
+            page_count = cursor.execute("PRAGMA page_count").fetchone()[0]
+            schema["metadata"] = {
+                "schema_version": schema_version,
+                "page_size": page_size,
+                "page_count": page_count,
+                "file_bytes": st.st_size,
+                "table_stats": self._collect_table_stats(cursor, tables)
+            }
+
             conn.close()
+
+            if self.use_cache:
+                # Round-trip through JSON so cached and fresh results have the same shape
+                schema = json.loads(json.dumps(schema, default=str))
+                self._schema_cache[cache_key] = {
+                    "identity": identity,
+                    "schema_version": schema_version,
+                    "freshness": freshness,
+                    "schema": schema
+                }
+                self._cache_dirty = True
             return schema
             
         except Exception as e:
@@ -576,6 +674,8 @@ class EnhancedBourbonTrackerDocumenter:
         config_data = self.extract_configuration_info()
         self._write_json(self.output_dir / "configuration.json", config_data)
 
+        self.save_cache()
+
         print("✅ Enhanced documentation generated:")
         outputs = [
             "project-overview.json", "database-schema.json", "backend-core.md", 
@@ -655,39 +755,157 @@ class EnhancedBourbonTrackerDocumenter:
         return routes
 
     # Utility methods
+    def walk_project_files(self) -> List[Tuple[str, Path, os.stat_result]]:
+        """Single os.scandir walk of the project, pruning excluded dirs before descending"""
+        if self._file_index is not None:
+            return self._file_index
+
+        index = []
+        stack = [self.project_root]
+        while stack:
+            current = stack.pop()
+            try:
+                with os.scandir(current) as it:
+                    entries = sorted(it, key=lambda e: e.name)
+            except OSError as e:
+                if self.verbose:
+                    print(f"[walk] Cannot scan {current}: {e}")
+                continue
+
+            subdirs = []
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name in self.exclude_dirs or Path(entry.path) == self.output_dir:
+                            continue
+                        subdirs.append(Path(entry.path))
+                    elif entry.is_file(follow_symlinks=False):
+                        path = Path(entry.path)
+                        rel_path = path.relative_to(self.project_root).as_posix()
+                        index.append((rel_path, path, entry.stat(follow_symlinks=False)))
+                except OSError:
+                    continue
+            # Reverse so the stack pops directories in sorted order
+            stack.extend(reversed(subdirs))
+
+        self._file_index = index
+        if self.verbose:
+            print(f"[walk] Indexed {len(index)} files")
+        return index
+
+    def _compile_pattern(self, pattern: str) -> re.Pattern:
+        """Translate an rglob-style pattern into a regex over posix relative paths"""
+        segments = pattern.strip('/').split('/')
+        pieces = []
+        for i, segment in enumerate(segments):
+            last = i == len(segments) - 1
+            if segment == '**':
+                pieces.append('.*' if last else '(?:[^/]+/)*')
+                continue
+            piece = ''.join(
+                '[^/]*' if ch == '*' else '[^/]' if ch == '?' else re.escape(ch)
+                for ch in segment
+            )
+            pieces.append(piece if last else piece + '/')
+        body = ''.join(pieces)
+        # rglob semantics: the pattern may match at any depth below the root
+        return re.compile(f"^(?:.*/)?{body}$")
+
     def collect_files_by_pattern(self, patterns: List[str]) -> List[Dict]:
         """Collect files matching patterns with enhanced filtering"""
-        files = []
-        seen_paths = set()
-        
-        for pattern in patterns:
-            for file_path in self.project_root.rglob(pattern):
-                if not file_path.is_file():
-                    continue
-                if any(part in self.exclude_dirs for part in file_path.parts):
-                    continue
-                
-                rel_path = str(file_path.relative_to(self.project_root))
-                if rel_path in seen_paths:
-                    continue
-                seen_paths.add(rel_path)
-                
-                if self.should_include_file(file_path):
+        compiled = [self._compile_pattern(p) for p in patterns]
+        buckets: List[List[Tuple[str, Path, os.stat_result]]] = [[] for _ in patterns]
+
+        # Dispatch each indexed file to the first pattern it matches
+        for rel_path, file_path, st in self.walk_project_files():
+            for i, rx in enumerate(compiled):
+                if rx.match(rel_path):
+                    buckets[i].append((rel_path, file_path, st))
+                    break
+
+        candidates = [item for bucket in buckets for item in bucket
+                      if self.should_include_file(item[1])]
+
+        results: Dict[str, str] = {}
+        misses = []
+        for rel_path, file_path, st in candidates:
+            cached = self._cache_lookup(rel_path, st)
+            if cached is not None:
+                results[rel_path] = cached
+                if self.verbose:
+                    print(f"[cache] {rel_path}")
+            else:
+                misses.append((rel_path, file_path, st))
+
+        def load(item):
+            rel_path, file_path, st = item
+            content = self.read_file_safely(file_path)
+            return rel_path, st, self.process_file_content(file_path, content)
+
+        if misses:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(misses))) as pool:
+                futures = [(item, pool.submit(load, item)) for item in misses]
+                for (rel_path, file_path, _), future in futures:
                     try:
-                        content = self.read_file_safely(file_path)
-                        processed_content = self.process_file_content(file_path, content)
-                        files.append({
-                            "path": rel_path,
-                            "content": processed_content,
-                            "size": len(processed_content)
-                        })
-                        if self.verbose:
-                            print(f"[add] {rel_path} ({len(processed_content)} chars)")
+                        _, st, processed_content = future.result()
                     except Exception as e:
                         if self.verbose:
                             print(f"[error] Skipped {file_path}: {e}")
+                        continue
+                    results[rel_path] = processed_content
+                    self._cache_store(rel_path, st, processed_content)
+
+        files = []
+        for rel_path, _, _ in candidates:
+            if rel_path not in results:
+                continue
+            processed_content = results[rel_path]
+            files.append({
+                "path": rel_path,
+                "content": processed_content,
+                "size": len(processed_content)
+            })
+            if self.verbose:
+                print(f"[add] {rel_path} ({len(processed_content)} chars)")
         return files
 
+    # Incremental cache
+    def _load_cache(self) -> Dict[str, Any]:
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") == CACHE_VERSION:
+                return data
+        except (OSError, ValueError):
+            pass
+        return {}
+
+    def _cache_lookup(self, rel_path: str, st: os.stat_result) -> Optional[str]:
+        entry = self._cache.get(rel_path)
+        if entry and entry.get("mtime_ns") == st.st_mtime_ns and entry.get("size") == st.st_size:
+            return entry.get("content")
+        return None
+
+    def _cache_store(self, rel_path: str, st: os.stat_result, content: str):
+        if not self.use_cache:
+            return
+        self._cache[rel_path] = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "content": content}
+        self._cache_dirty = True
+
+    def save_cache(self):
+        if not self.use_cache or not self._cache_dirty:
+            return
+        tmp = self.cache_path.with_name(self.cache_path.name + ".tmp")
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({"version": CACHE_VERSION, "files": self._cache,
+                           "schemas": self._schema_cache}, f)
+            os.replace(tmp, self.cache_path)
+            self._cache_dirty = False
+        except OSError as e:
+            if self.verbose:
+                print(f"[cache] Could not save {self.cache_path}: {e}")
+
     def should_include_file(self, file_path: Path) -> bool:
         rel_path = str(file_path.relative_to(self.project_root))
         
@@ -752,10 +970,15 @@ def parse_args():
                         help="Path to project root (default: current directory)")
     parser.add_argument("--verbose", "-v", action="store_true", 
                         help="Print detailed processing information")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Ignore and do not update the incremental file cache")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="Thread pool size for reading uncached files (default: 8)")
     return parser.parse_args()
 
 
 if __name__ == "__main__":
     args = parse_args()
-    documenter = EnhancedBourbonTrackerDocumenter(project_root=args.project_root, verbose=args.verbose)
+    documenter = EnhancedBourbonTrackerDocumenter(project_root=args.project_root, verbose=args.verbose,
+                                                  use_cache=not args.no_cache, workers=args.workers)
     documenter.generate_enhanced_documentation()
\ No newline at end of file
@@ -210,6 +210,7 @@ const WarehouseInventory = () => {
       }
 
       const variations = [
+        product.thumbnail_url,
         product.image_url,
         `/api/images/${product.image_path}`,
         `/api/images/${product.image_path.replace(/^alcohol_images[\\\/]/, '')}`,
@@ -223,7 +224,7 @@ const WarehouseInventory = () => {
       ];
 
       return variations.filter(Boolean);
-    }, [product.image_path, product.image_url, product.plu, product.nc_code]);
+    }, [product.image_path, product.image_url, product.thumbnail_url, product.plu, product.nc_code]);
 
     const imageVariations = useMemo(() => getImageVariations(), [getImageVariations]);
 
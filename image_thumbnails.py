@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Report image thumbnails and manifest
+
+Report pages show ~2,900 product images, and each was the full-size original
+from alcohol_images/. This batch step, run by the generator before the reports
+(THUMBNAILS=true) or on its own, reads every product image path. It renders
+JPEG thumbnails at THUMBNAIL_SIZES (longest edge, never upscaled) into
+<images dir>/thumbs/<size>/, which the existing /api/images route serves, and
+writes image_manifest.json next to the reports:
+
+  meta      generated_at, sizes, quality, counts (ok/missing/broken/rendered/reused)
+  images    {relative path: status, sha1, bytes, mtime_ns, width, height, format,
+             thumbs {size: {path, width, height, bytes}}, error}
+  products  {nc_code: relative path}
+  missing / broken   nc_codes whose image file is absent or does not decode
+
+Unchanged images are skipped. If the size and mtime match the manifest and
+the thumbnails exist, the file is not even opened. If only the mtime moved,
+the image is hashed and re-rendered only when its sha1 changed. Rendering runs
+in a process pool. Report products get thumbnail_url (smallest size) and
+thumbnails {size: url}, each with ?v=<sha1 prefix> so a changed image gets a
+new URL while the old one can be cached for good.
+
+Needs Pillow (optional; without it the step logs a warning and reports keep
+only image_url).
+"""
+
+import os
+import sys
+import json
+import stat
+import hashlib
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+
+from report_writer import write_compact_json_atomic
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # thumbnails are optional
+    Image = ImageOps = None
+
+logger = logging.getLogger('warehouse_inventory_generator')
+
+DEV_MODE = os.getenv('DEV_MODE', 'false').lower() == 'true'
+IMAGES_DIR = os.getenv('IMAGES_DIR') or ('./BourbonDatabase/alcohol_images' if DEV_MODE else '/opt/alcohol_images')
+THUMBS_SUBDIR = 'thumbs'
+THUMB_URL_PREFIX = '/api/images/thumbs'
+THUMBNAIL_SIZES = tuple(sorted(int(s) for s in os.getenv('THUMBNAIL_SIZES', '160,480').split(',') if s.strip()))
+THUMBNAIL_QUALITY = int(os.getenv('THUMBNAIL_QUALITY', '82'))
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', str(min(4, os.cpu_count() or 1))))
+MANIFEST_FILE = 'image_manifest.json'
+
+
+def _relative_image_path(image_path):
+    """alcohol.image_path ('alcohol_images\\29452.jpg') -> path under the images dir ('29452.jpg')"""
+    p = str(image_path).replace('\\', '/')
+    return p[len('alcohol_images/'):] if p.startswith('alcohol_images/') else p
+
+
+def _thumb_rel(rel, size):
+    return f"{size}/{Path(rel).with_suffix('.jpg').as_posix()}"
+
+
+def _render(src, rel, thumb_root, sizes, quality, prev_sha1):
+    """Worker: hash, validate and (if the content changed) render one image"""
+    try:
+        st = os.stat(src)
+        data = Path(src).read_bytes()
+    except FileNotFoundError:
+        return {'status': 'missing'}
+    out = {'sha1': hashlib.sha1(data).hexdigest(), 'bytes': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    if prev_sha1 == out['sha1'] and all((thumb_root / _thumb_rel(rel, s)).exists() for s in sizes):
+        return dict(out, status='unchanged')
+    try:
+        with Image.open(BytesIO(data)) as im:
+            im.verify()  # structural check; the image must be reopened afterwards
+        im = Image.open(BytesIO(data))
+        im.load()
+    except Exception as e:
+        return dict(out, status='broken', error=f"{type(e).__name__}: {e}")
+    out.update(status='ok', width=im.width, height=im.height, format=im.format, thumbs={})
+    im = ImageOps.exif_transpose(im)
+    if im.mode in ('RGBA', 'LA', 'P'):
+        im = im.convert('RGBA')
+        background = Image.new('RGB', im.size, (255, 255, 255))
+        background.paste(im, mask=im.getchannel('A'))
+        im = background
+    elif im.mode != 'RGB':
+        im = im.convert('RGB')
+    for size in sizes:
+        thumb = im.copy()
+        thumb.thumbnail((size, size), Image.LANCZOS)
+        path = thumb_root / _thumb_rel(rel, size)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        thumb.save(tmp, 'JPEG', quality=quality, optimize=True, progressive=True)
+        os.replace(tmp, path)
+        out['thumbs'][str(size)] = {'path': _thumb_rel(rel, size), 'width': thumb.width,
+                                    'height': thumb.height, 'bytes': path.stat().st_size}
+    return out
+
+
+def _image_rows(gen):
+    """(nc_code, image_path) for every reportable product with an image (product_dim or alcohol)"""
+    parts = gen._alcohol_select_parts()
+    table, key, cond = gen._product_source()
+    rows = gen.execute_query(f"SELECT a.{key} AS nc_code, {', '.join(parts)} FROM {table} a WHERE {cond}")
+    return [(str(r['nc_code']), r['image_path']) for r in rows if r['has_image']]
+
+
+def load_manifest(output_dir):
+    path = Path(output_dir) / MANIFEST_FILE
+    try:
+        return json.loads(path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+
+
+def build_thumbnails(gen, file_mode=None, images_dir=IMAGES_DIR, sizes=THUMBNAIL_SIZES,
+                     quality=THUMBNAIL_QUALITY, workers=THUMBNAIL_WORKERS, force=False):
+    """Render new/changed thumbnails and rewrite the manifest; returns the manifest (None without Pillow)"""
+    if Image is None:
+        logger.warning("Pillow not installed; skipping thumbnails (pip install Pillow).")
+        return None
+    images_dir = Path(images_dir)
+    thumb_root = images_dir / THUMBS_SUBDIR
+    previous = None if force else load_manifest(gen.output_dir)
+    settings = {'sizes': list(sizes), 'quality': quality}
+    if previous and previous.get('meta', {}).get('settings') != settings:
+        logger.info("Thumbnail sizes/quality changed; re-rendering every image.")
+        previous = None
+    prev_images = (previous or {}).get('images', {})
+
+    products = {}
+    for code, image_path in _image_rows(gen):
+        products[code] = _relative_image_path(image_path)
+
+    images, todo = {}, []
+    for rel in sorted(set(products.values())):
+        src = images_dir / rel
+        prev = prev_images.get(rel)
+        try:
+            st = os.stat(src)
+        except FileNotFoundError:
+            st = None
+        if st is None or not stat.S_ISREG(st.st_mode):
+            images[rel] = {'status': 'missing'}
+            continue
+        same_file = prev and prev.get('bytes') == st.st_size and prev.get('mtime_ns') == st.st_mtime_ns
+        if same_file and (prev['status'] == 'broken' or (
+                prev['status'] == 'ok' and all((thumb_root / t['path']).exists() for t in prev['thumbs'].values()))):
+            images[rel] = prev
+            continue
+        todo.append((rel, prev))
+
+    counts = {'rendered': 0, 'reused': sum(1 for i in images.values() if i['status'] == 'ok')}
+    if todo:
+        with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = []
+            for rel, prev in todo:
+                prev_sha1 = prev['sha1'] if prev and prev['status'] == 'ok' else None
+                futures.append((rel, prev, pool.submit(_render, images_dir / rel, rel, thumb_root, sizes,
+                                                       quality, prev_sha1)))
+            for rel, prev, future in futures:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {'status': 'broken', 'error': f"{type(e).__name__}: {e}"}
+                if result['status'] == 'unchanged':
+                    result = dict(prev, bytes=result['bytes'], mtime_ns=result['mtime_ns'])
+                    counts['reused'] += 1
+                elif result['status'] == 'ok':
+                    counts['rendered'] += 1
+                images[rel] = result
+
+    for status in ('ok', 'missing', 'broken'):
+        counts[status] = sum(1 for i in images.values() if i['status'] == status)
+    manifest = {
+        'meta': {'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                 'images_dir': str(images_dir), 'url_prefix': THUMB_URL_PREFIX,
+                 'settings': settings, 'counts': counts},
+        'images': images,
+        'products': products,
+        'missing': sorted(c for c, rel in products.items() if images[rel]['status'] == 'missing'),
+        'broken': sorted(c for c, rel in products.items() if images[rel]['status'] == 'broken'),
+    }
+    path = write_compact_json_atomic(Path(gen.output_dir) / MANIFEST_FILE, manifest, file_mode)
+    logger.info(f"Wrote {path}: {counts['ok']} images ok ({counts['rendered']} rendered, "
+                f"{counts['reused']} unchanged), {counts['missing']} missing, {counts['broken']} broken")
+    return manifest
+
+
+def thumbnail_urls(manifest):
+    """{nc_code: {size: url}} with ?v=<sha1 prefix> cache busting, for products whose image rendered"""
+    out = {}
+    if not manifest:
+        return out
+    prefix = manifest['meta'].get('url_prefix', THUMB_URL_PREFIX)
+    images = manifest['images']
+    for code, rel in manifest['products'].items():
+        image = images.get(rel)
+        if image and image['status'] == 'ok':
+            version = image['sha1'][:10]
+            out[code] = {size: f"{prefix}/{t['path']}?v={version}" for size, t in image['thumbs'].items()}
+    return out
+
+
+def main():
+    from warehouse_inventory_generator import WarehouseInventoryGenerator
+
+    parser = argparse.ArgumentParser(description="Render report thumbnails and write image_manifest.json")
+    parser.add_argument("--images-dir", default=IMAGES_DIR, help=f"Original images (default: {IMAGES_DIR})")
+    parser.add_argument("--force", action="store_true", help="Re-render every image")
+    parser.add_argument("--list-problems", action="store_true", help="Print missing/broken images after the run")
+    args = parser.parse_args()
+    gen = WarehouseInventoryGenerator()
+    manifest = build_thumbnails(gen, images_dir=args.images_dir, force=args.force)
+    if manifest is None:
+        sys.exit(1)
+    if args.list_problems:
+        for status in ('missing', 'broken'):
+            for code in manifest[status]:
+                rel = manifest['products'][code]
+                print(f"{status:>8} {code:>8}  {rel}  {manifest['images'][rel].get('error', '')}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,729 @@
+#!/usr/bin/env python3
+"""
+Load test for the report-serving and live inventory endpoints
+
+Everything runs locally in a scratch directory (--workdir):
+
+1. A synthetic inventory.db (BourbonDatabase/inventory.db): stores, alcohol,
+   bourbons, daily warehouse history, store-level deliveries, shipments.
+   The indexes come from backend/optimize-db.sql, plus the day_key migration
+   (day_keys.py). It is rebuilt only when the size parameters or the day change.
+2. product_dim (product_dim.py, as its scheduled step does in production),
+   then reports from warehouse_inventory_generator.py (DEV_MODE paths, so
+   ./warehouse-reports), which also builds the search index.
+3. A copy of backend/ (node_modules symlinked) started with node. Its dev paths
+   point at the files above. TRUST_PROXY=loopback lets every simulated client
+   send its own X-Forwarded-For, so rate limits count per client as they do
+   behind nginx.
+
+Requests are signed with a locally minted JWT cookie. The mix is replayed by
+closed-loop asyncio clients, one keep-alive HTTP/1.1 connection each, at every
+concurrency step:
+
+  report         GET  /api/reports/warehouse-inventory?timePeriod=<random window>
+  report_304     the same with If-None-Match (the last ETag seen for that window)
+  report_search  GET  /api/reports/warehouse-inventory/search?q=<word>
+  delivery       POST /api/inventory/delivery-analysis {plu, weeksBack}
+  store          GET  /api/stores/<id>/inventory
+  search         GET  /api/inventory/search/<word or PLU>
+  allocated      GET  /api/inventory/allocated-current
+
+Per step the JSON result has throughput, latency percentiles (overall and per
+kind), status counts, the 304 ratio, server RSS (start/max/end) and the load
+generator's own CPU share. If that share is near 100%, the client was the
+bottleneck, not the server.
+
+    python3 load_test.py                                     # default mix, steps 1,4,16,64 x 20s
+    python3 load_test.py --steps 8,32 --step-seconds 30 --mix report=1,report_304=1 --out run.json
+    python3 load_test.py --base-url http://127.0.0.1:3000 --db ./BourbonDatabase/inventory.db --jwt-secret ...
+    python3 load_test.py --compare before.json after.json    # throughput / p99 change per step
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import hmac
+import base64
+import shutil
+import random
+import socket
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import argparse
+import platform
+import subprocess
+import tempfile
+import urllib.request
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from urllib.parse import quote, urlsplit
+
+try:
+    from day_keys import migrate as migrate_day_keys
+except ImportError:  # day_key migration not deployed alongside the harness
+    migrate_day_keys = None
+
+logger = logging.getLogger('load_test')
+
+REPO_DIR = Path(__file__).resolve().parent
+WORKDIR = Path(os.getenv('LOAD_TEST_DIR') or Path(tempfile.gettempdir()) / 'bourbon-loadtest')
+COPY_MARKER = '.load_test_copy'
+DATASET_FILE = 'dataset.json'
+REPORT_PERIODS = ('current_month', 'last_30_days', 'last_90_days', 'last_180_days')  # generator TIME_PERIODS
+
+KINDS = ('report', 'report_304', 'report_search', 'delivery', 'store', 'search', 'allocated')
+DEFAULT_MIX = 'report=25,report_304=25,report_search=10,delivery=10,store=15,search=15'
+DEFAULT_STEPS = '1,4,16,64'
+
+ALLOCATED_TYPES = ('Allocation', 'Limited', 'Barrel')
+NAME_WORDS = ('Eagle', 'Buffalo', 'Stagg', 'Weller', 'Blanton', 'Taylor', 'Elijah', 'Booker', 'Baker', 'Knob',
+              'Russell', 'Willett', 'Heaven', 'Old Forester', 'Four Roses', 'Larceny', 'Pappy', 'Rock Hill',
+              'Henry', 'Michter', 'Angel', 'Wild Turkey', 'Maker', 'Jefferson', 'Barton', 'Bardstown')
+STYLE_WORDS = ('Bourbon', 'Rye', 'Single Barrel', 'Small Batch', 'Bottled in Bond', 'Cask Strength',
+               'Reserve', 'Private Select', 'Straight Wheat', '12 Year', '10 Year', 'Full Proof')
+REGIONS = ('Raleigh', 'Durham', 'Cary', 'Apex', 'Garner', 'Wake Forest', 'Holly Springs', 'Fuquay-Varina')
+WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday')
+BOARDS = ('Wake County ABC', 'Durham ABC', 'Mecklenburg ABC')
+
+
+# ------------------ Synthetic dataset ------------------
+SCHEMA_SQL = """
+CREATE TABLE stores (store_id INTEGER PRIMARY KEY, store_number TEXT NOT NULL UNIQUE, address TEXT UNIQUE,
+  region TEXT, nickname TEXT, delivery_interval_days INTEGER, last_delivery_date DATE,
+  mixed_beverage INTEGER NOT NULL DEFAULT 0, delivery_day TEXT);
+CREATE TABLE boards (board_id INTEGER PRIMARY KEY, board_name TEXT NOT NULL UNIQUE);
+CREATE TABLE alcohol (alcohol_id INTEGER PRIMARY KEY, nc_code INTEGER NOT NULL UNIQUE, brand_name TEXT, size_ml INTEGER,
+  cases_per_pallet INTEGER, supplier TEXT, broker_name TEXT, first_seen_date DATE, image_path TEXT,
+  Listing_Type TEXT, style_tags TEXT, alcohol_type TEXT, alcohol_subtype TEXT, retail_price REAL,
+  bottles_per_case INTEGER);
+CREATE TABLE bourbons (bourbon_id INTEGER PRIMARY KEY, name TEXT NOT NULL, plu INTEGER NOT NULL UNIQUE,
+  last_seeded_date DATE);
+CREATE TABLE current_inventory (inventory_id INTEGER PRIMARY KEY, store_id INTEGER NOT NULL, plu INTEGER NOT NULL,
+  quantity INTEGER, last_updated TIMESTAMP, UNIQUE(store_id, plu));
+CREATE TABLE inventory_history (history_id INTEGER PRIMARY KEY, store_id INTEGER NOT NULL, plu INTEGER NOT NULL,
+  quantity INTEGER, check_time TEXT, change_type TEXT, delta INTEGER);
+CREATE TABLE warehouse_inventory_history_v2 (history_id INTEGER PRIMARY KEY, nc_code TEXT NOT NULL,
+  check_date DATE NOT NULL, total_available INTEGER, listing_type TEXT, supplier_allotment INTEGER,
+  UNIQUE(nc_code, check_date));
+CREATE TABLE shipments_history (shipment_id INTEGER PRIMARY KEY, nc_code TEXT NOT NULL, board_id INTEGER NOT NULL,
+  ship_date DATE NOT NULL, num_units INTEGER NOT NULL, UNIQUE(nc_code, board_id, ship_date));
+"""
+
+
+def dataset_params(args):
+    return {'products': args.products, 'stores': args.stores, 'days': args.days,
+            'allocated_share': args.allocated_share, 'seed': args.seed, 'built_on': date.today().isoformat()}
+
+
+def _warehouse_series(rng, allocated, days):
+    """Daily total_available: allocated products sit near zero between drops; listed ones restock"""
+    out, level = [], (0 if allocated else rng.randint(50, 2000))
+    for _ in range(days):
+        if allocated:
+            if rng.random() < 0.04:
+                level += rng.randint(24, 600)
+            level = max(0, level - rng.randint(0, max(1, level // 2)))
+        else:
+            level = max(0, level - rng.randint(0, 40))
+            if level < 100 and rng.random() < 0.3:
+                level += rng.randint(200, 1500)
+        out.append(level)
+    return out
+
+
+def build_dataset(db_path, params):
+    """Create and fill a synthetic inventory.db; returns row counts"""
+    rng = random.Random(params['seed'])
+    today = date.today()
+    first_day = today - timedelta(days=params['days'] - 1)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    for suffix in ('', '-wal', '-shm'):
+        Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.executescript(SCHEMA_SQL)
+        stores = []
+        for i in range(1, params['stores'] + 1):
+            stores.append((i, str(i), f"{100 + i} {rng.choice(REGIONS)} Rd", rng.choice(REGIONS), f"Store {i}", 7,
+                           None, int(rng.random() < 0.3), rng.choice(WEEKDAYS)))
+        conn.executemany("INSERT INTO stores VALUES (?,?,?,?,?,?,?,?,?)", stores)
+        conn.executemany("INSERT INTO boards (board_name) VALUES (?)", [(b,) for b in BOARDS])
+
+        products = []  # (nc_code, name, listing_type)
+        alcohol, bourbons = [], []
+        for i in range(params['products']):
+            code = 10000 + i
+            allocated = rng.random() < params['allocated_share']
+            listing = rng.choice(ALLOCATED_TYPES) if allocated else 'Listed'
+            name = f"{rng.choice(NAME_WORDS)} {rng.choice(STYLE_WORDS)} {i}"
+            image = rng.random()
+            image_path = (f"alcohol_images\\{code}.jpg" if image < 0.7
+                          else 'no image available' if image < 0.8 else None)
+            alcohol.append((code, name, rng.choice((750, 750, 1750, 375)), 56, f"Supplier {rng.randint(1, 60)}",
+                            f"Broker {rng.randint(1, 15)}", first_day.isoformat(), image_path, listing, 'bourbon',
+                            'Whiskey', 'Bourbon', round(rng.uniform(20, 250), 2), rng.choice((6, 6, 12))))
+            if allocated or rng.random() < 0.1:
+                bourbons.append((name, code, today.isoformat()))
+            products.append((code, listing, allocated))
+        conn.executemany(
+            "INSERT INTO alcohol (nc_code, brand_name, size_ml, cases_per_pallet, supplier, broker_name, first_seen_date, "
+            "image_path, Listing_Type, style_tags, alcohol_type, alcohol_subtype, retail_price, bottles_per_case) "
+            "VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)", alcohol)
+        conn.executemany("INSERT INTO bourbons (name, plu, last_seeded_date) VALUES (?,?,?)", bourbons)
+
+        days = [(first_day + timedelta(days=d)).isoformat() for d in range(params['days'])]
+        for code, listing, allocated in products:
+            series = _warehouse_series(rng, allocated, params['days'])
+            conn.executemany("INSERT INTO warehouse_inventory_history_v2 (nc_code, check_date, total_available, "
+                             "listing_type) VALUES (?,?,?,?)",
+                             [(code, d, v, listing) for d, v in zip(days, series)])
+
+        # Store-level deliveries for allocated products over the last ~4 months
+        history, current, shipments = [], [], []
+        store_days = min(params['days'], 120)
+        for code, _, allocated in products:
+            if not allocated:
+                continue
+            for store in rng.sample(stores, max(1, len(stores) // 5)):
+                qty = None
+                for d in range(store_days - 1, -1, -1):
+                    day = today - timedelta(days=d)
+                    stamp = f"{day.isoformat()} 10:00:00"
+                    if day.strftime('%A') == store[8] and rng.random() < 0.3:
+                        added = rng.randint(1, 4) * 6
+                        history.append((store[0], code, (qty or 0) + added, stamp, 'up' if qty else 'first', added))
+                        qty = (qty or 0) + added
+                    elif qty and rng.random() < 0.15:
+                        sold = rng.randint(1, qty)
+                        qty -= sold
+                        history.append((store[0], code, qty, stamp, 'down', -sold))
+                if qty is not None:
+                    current.append((store[0], code, qty, f"{today.isoformat()} 10:00:00"))
+            for board_id in range(1, len(BOARDS) + 1):
+                for m in range(0, min(params['days'], 180), 30):
+                    if rng.random() < 0.5:
+                        shipments.append((str(code), board_id, (today - timedelta(days=m)).isoformat(),
+                                          rng.randint(6, 240)))
+        conn.executemany("INSERT INTO inventory_history (store_id, plu, quantity, check_time, change_type, delta) "
+                         "VALUES (?,?,?,?,?,?)", history)
+        conn.executemany("INSERT INTO current_inventory (store_id, plu, quantity, last_updated) VALUES (?,?,?,?)",
+                         current)
+        conn.executemany("INSERT INTO shipments_history (nc_code, board_id, ship_date, num_units) VALUES (?,?,?,?)",
+                         shipments)
+        conn.commit()
+        conn.executescript((REPO_DIR / 'backend' / 'optimize-db.sql').read_text(encoding='utf-8'))
+        counts = {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+                  for t in ('stores', 'alcohol', 'bourbons', 'warehouse_inventory_history_v2',
+                            'inventory_history', 'current_inventory', 'shipments_history')}
+    finally:
+        conn.close()
+    if migrate_day_keys is not None:
+        migrate_day_keys(str(db_path), archives=False)
+    return counts
+
+
+def prepare_dataset(workdir, args):
+    """Build the DB (unless an identical one is there) and regenerate the reports; returns the dataset record"""
+    db_path = workdir / 'BourbonDatabase' / 'inventory.db'
+    marker = workdir / DATASET_FILE
+    params = dataset_params(args)
+    record = json.loads(marker.read_text(encoding='utf-8')) if marker.exists() else None
+    if db_path.exists() and record is None:
+        raise SystemExit(f"{db_path} exists but was not built by load_test.py; pick another --workdir")
+    if args.rebuild or record is None or record.get('params') != params:
+        logger.info(f"Building synthetic inventory.db ({params['products']} products, {params['stores']} stores, "
+                    f"{params['days']} days)")
+        t0 = time.perf_counter()
+        counts = build_dataset(db_path, params)
+        record = {'params': params, 'counts': counts, 'build_seconds': round(time.perf_counter() - t0, 1)}
+        marker.write_text(json.dumps(record, indent=2), encoding='utf-8')
+        logger.info(f"Built in {record['build_seconds']}s: {counts}")
+
+    logger.info("Generating reports")
+    env = dict(os.environ, DEV_MODE='true', THUMBNAILS='false')
+    env.pop('REPORT_TIERS', None)
+    with open(workdir / 'generator.log', 'ab') as log:
+        for step in (['product_dim.py'], ['warehouse_inventory_generator.py', '--requested-by', 'load_test']):
+            done = subprocess.run([sys.executable, str(REPO_DIR / step[0]), *step[1:]], cwd=workdir, env=env,
+                                  stdout=log, stderr=log)
+            if done.returncode != 0:
+                raise SystemExit(f"{step[0]} failed; see {workdir / 'generator.log'}")
+    return record
+
+
+def load_samples(db_path):
+    """Request parameters drawn from the dataset: allocated PLUs, store ids, search words"""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        plus = [r[0] for r in conn.execute(
+            f"SELECT nc_code FROM alcohol WHERE Listing_Type IN ({','.join('?' * len(ALLOCATED_TYPES))})",
+            ALLOCATED_TYPES)]
+        stores = [r[0] for r in conn.execute("SELECT DISTINCT store_id FROM current_inventory")]
+        names = [r[0] for r in conn.execute("SELECT name FROM bourbons")]
+    finally:
+        conn.close()
+    if not plus or not stores:
+        raise SystemExit(f"{db_path} has no allocated products or store inventory to sample")
+    words = sorted({w for n in names for w in n.split() if len(w) > 3 and not w.isdigit()})
+    return {'plus': plus, 'stores': stores, 'words': words or ['Bourbon']}
+
+
+# ------------------ Backend ------------------
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def copy_backend(workdir):
+    """backend/ copied next to the synthetic DB (dev paths are relative to it), node_modules symlinked"""
+    dst = workdir / 'backend'
+    if dst.exists():
+        if not (dst / COPY_MARKER).exists():
+            raise SystemExit(f"{dst} exists but is not a load_test.py copy; pick another --workdir")
+        shutil.rmtree(dst)  # a symlinked node_modules is unlinked, not followed
+    shutil.copytree(REPO_DIR / 'backend', dst,
+                    ignore=shutil.ignore_patterns('node_modules', 'data', '.env', 'cookies.txt', '*.log'))
+    (dst / 'node_modules').symlink_to(REPO_DIR / 'backend' / 'node_modules', target_is_directory=True)
+    (dst / 'data').mkdir()
+    (dst / COPY_MARKER).touch()
+    return dst
+
+
+def start_backend(workdir, node, secret, port):
+    backend = copy_backend(workdir)
+    env = dict(os.environ, NODE_ENV='development', PORT=str(port), JWT_SECRET=secret, TRUST_PROXY='loopback',
+               EMAIL_USER='loadtest@example.com', EMAIL_PASS='unused')
+    log = open(workdir / 'server.log', 'ab')
+    proc = subprocess.Popen([node, 'server.js'], cwd=backend, env=env, stdout=log, stderr=subprocess.STDOUT)
+    log.close()
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"Backend exited with {proc.returncode}; see {workdir / 'server.log'}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=2) as r:
+                if r.status == 200:
+                    logger.info(f"Backend up on port {port} (pid {proc.pid})")
+                    return proc
+        except OSError:
+            pass
+        time.sleep(0.25)
+    proc.terminate()
+    raise SystemExit(f"Backend did not answer /health within 60s; see {workdir / 'server.log'}")
+
+
+def stop_backend(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def make_token(secret, ttl=24 * 3600):
+    """HS256 JWT shaped like authController's login token"""
+    def b64(data):
+        return base64.urlsafe_b64encode(data).rstrip(b'=')
+    now = int(time.time())
+    header = b64(json.dumps({'alg': 'HS256', 'typ': 'JWT'}, separators=(',', ':')).encode())
+    payload = b64(json.dumps({'userId': 1, 'email': 'loadtest@example.com', 'role': 'user', 'firstName': 'Load',
+                              'lastName': 'Test', 'iat': now, 'exp': now + ttl}, separators=(',', ':')).encode())
+    signature = b64(hmac.new(secret.encode(), header + b'.' + payload, hashlib.sha256).digest())
+    return (header + b'.' + payload + b'.' + signature).decode()
+
+
+def read_rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except FileNotFoundError:
+        pass
+    except OSError:
+        return None
+    try:  # no /proc (macOS)
+        out = subprocess.run(['ps', '-o', 'rss=', '-p', str(pid)], capture_output=True, text=True, timeout=2)
+        return int(out.stdout.strip()) if out.stdout.strip() else None
+    except (OSError, ValueError, subprocess.TimeoutExpired):
+        return None
+
+
+class RssSampler:
+    """Samples the server's resident set in the background; window() summarises a time range"""
+
+    def __init__(self, pid, interval=0.25):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []  # (perf_counter, kB)
+
+    async def run(self):
+        while True:
+            kb = await asyncio.to_thread(read_rss_kb, self.pid)
+            if kb:
+                self.samples.append((time.perf_counter(), kb))
+            await asyncio.sleep(self.interval)
+
+    def window(self, t0, t1):
+        values = [kb for t, kb in self.samples if t0 <= t <= t1]
+        if not values:
+            return None
+        return {'start': values[0], 'max': max(values), 'end': values[-1]}
+
+
+# ------------------ HTTP client ------------------
+class Connection:
+    """One keep-alive HTTP/1.1 connection; reconnects on the next request after a close or error"""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def request(self, method, path, headers, body=None):
+        """(status, lower-cased headers, body bytes); the body is read and dropped"""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port, limit=1 << 20)
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}"]
+        lines += [f"{k}: {v}" for k, v in headers.items()]
+        if body is not None:
+            lines.append(f"Content-Length: {len(body)}")
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + (body or b''))
+        await self.writer.drain()
+
+        head = (await self.reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+        status = int(head[0].split(' ', 2)[1])
+        resp = {}
+        for line in head[1:]:
+            if ':' in line:
+                k, v = line.split(':', 1)
+                resp[k.strip().lower()] = v.strip()
+        size = 0
+        if status in (204, 304) or status < 200:
+            pass
+        elif resp.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                n = int((await self.reader.readline()).split(b';')[0], 16)
+                if n == 0:
+                    while (await self.reader.readline()) not in (b'\r\n', b''):
+                        pass
+                    break
+                size += len(await self.reader.readexactly(n + 2)) - 2
+        elif 'content-length' in resp:
+            size = int(resp['content-length'])
+            await self.reader.readexactly(size)
+        else:
+            size = len(await self.reader.read())
+            self.close()
+        if resp.get('connection', '').lower() == 'close':
+            self.close()
+        return status, resp, size
+
+
+def build_request(kind, rng, samples, etags):
+    """(method, path, headers, body, report window or None) for one request of `kind`"""
+    if kind in ('report', 'report_304'):
+        tp = rng.choice(REPORT_PERIODS)
+        headers = {'If-None-Match': etags[tp]} if kind == 'report_304' and tp in etags else {}
+        return 'GET', f"/api/reports/warehouse-inventory?timePeriod={tp}", headers, None, tp
+    if kind == 'report_search':
+        return ('GET', f"/api/reports/warehouse-inventory/search?q={quote(rng.choice(samples['words']))}",
+                {}, None, None)
+    if kind == 'delivery':
+        body = json.dumps({'plu': rng.choice(samples['plus']), 'weeksBack': rng.randint(0, 3)}).encode()
+        return 'POST', '/api/inventory/delivery-analysis', {'Content-Type': 'application/json'}, body, None
+    if kind == 'store':
+        return 'GET', f"/api/stores/{rng.choice(samples['stores'])}/inventory", {}, None, None
+    if kind == 'search':
+        term = str(rng.choice(samples['plus'])) if rng.random() < 0.3 else rng.choice(samples['words'])
+        return 'GET', f"/api/inventory/search/{quote(term)}", {}, None, None
+    return 'GET', '/api/inventory/allocated-current', {}, None, None
+
+
+# ------------------ Measurement ------------------
+def latency_summary(values):
+    if not values:
+        return None
+    v = sorted(values)
+    n = len(v)
+
+    def pct(q):
+        return round(v[min(n - 1, max(0, math.ceil(q * n) - 1))], 2)
+    return {'p50': pct(0.50), 'p90': pct(0.90), 'p95': pct(0.95), 'p99': pct(0.99),
+            'max': round(v[-1], 2), 'mean': round(sum(v) / n, 2)}
+
+
+def summarize(results, seconds):
+    """results: [(kind, status, latency_ms, bytes)] -> throughput, latency and status figures"""
+    def block(rows):
+        statuses = {}
+        for _, status, _, _ in rows:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        return {'requests': len(rows), 'throughput_rps': round(len(rows) / seconds, 1) if seconds else 0,
+                'latency_ms': latency_summary([r[2] for r in rows if isinstance(r[1], int)]),
+                'status_counts': statuses, 'bytes': sum(r[3] for r in rows)}
+    out = block(results)
+    out['errors'] = sum(1 for r in results if not isinstance(r[1], int) or r[1] >= 500)
+    out['rate_limited'] = sum(1 for r in results if r[1] == 429)
+    out['not_modified_ratio'] = round(sum(1 for r in results if r[1] == 304) / len(results), 4) if results else 0
+    conditional = [r for r in results if r[0] == 'report_304']
+    out['conditional_304_ratio'] = (round(sum(1 for r in conditional if r[1] == 304) / len(conditional), 4)
+                                    if conditional else None)
+    out['by_kind'] = {kind: block([r for r in results if r[0] == kind])
+                      for kind in KINDS if any(r[0] == kind for r in results)}
+    return out
+
+
+class LoadRunner:
+    def __init__(self, base_url, token, samples, mix, args, rss=None):
+        url = urlsplit(base_url)
+        self.host, self.port = url.hostname, url.port or 80
+        self.base_headers = {'Cookie': f"token={token}", 'Accept': 'application/json'}
+        if args.gzip:
+            self.base_headers['Accept-Encoding'] = 'gzip'
+        self.samples = samples
+        self.kinds = [k for k, w in mix.items() if w > 0]
+        self.weights = [mix[k] for k in self.kinds]
+        self.args = args
+        self.rss = rss
+        self.etags = {}  # report window -> last ETag seen
+        self._next_client = 0
+
+    def _client_ip(self):
+        self._next_client += 1
+        n = self._next_client
+        return f"10.{(n >> 16) & 255}.{(n >> 8) & 255}.{n & 255}"
+
+    async def prime_etags(self):
+        conn = Connection(self.host, self.port)
+        try:
+            for tp in REPORT_PERIODS:
+                headers = dict(self.base_headers, **{'X-Forwarded-For': self._client_ip()})
+                try:
+                    status, resp, _ = await conn.request('GET', f"/api/reports/warehouse-inventory?timePeriod={tp}",
+                                                         headers)
+                except OSError as e:
+                    raise SystemExit(f"Cannot reach {self.host}:{self.port}: {e}") from None
+                if status != 200:
+                    raise SystemExit(f"Report {tp} returned {status}; is the backend serving the generated reports?")
+                if 'etag' in resp:
+                    self.etags[tp] = resp['etag']
+        finally:
+            conn.close()
+
+    async def _client(self, seed, measure_from, end, results):
+        rng = random.Random(seed)
+        conn = Connection(self.host, self.port)
+        ip, served = self._client_ip(), 0
+        try:
+            while time.perf_counter() < end:
+                if served >= self.args.requests_per_client:
+                    ip, served = self._client_ip(), 0
+                kind = rng.choices(self.kinds, self.weights)[0]
+                method, path, headers, body, window = build_request(kind, rng, self.samples, self.etags)
+                headers = dict(self.base_headers, **headers, **{'X-Forwarded-For': ip})
+                t0 = time.perf_counter()
+                try:
+                    status, resp, size = await asyncio.wait_for(conn.request(method, path, headers, body),
+                                                                self.args.timeout)
+                    if window and status == 200 and 'etag' in resp:
+                        self.etags[window] = resp['etag']
+                except asyncio.TimeoutError:
+                    status, size = 'timeout', 0
+                    conn.close()
+                except (OSError, ValueError, IndexError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    status, size = 'error', 0
+                    conn.close()
+                served += 1
+                if t0 >= measure_from:
+                    results.append((kind, status, (time.perf_counter() - t0) * 1000, size))
+                if self.args.think_ms:
+                    await asyncio.sleep(rng.expovariate(1000 / self.args.think_ms))
+        finally:
+            conn.close()
+
+    async def run_step(self, concurrency):
+        args = self.args
+        results = []
+        start = time.perf_counter()
+        measure_from = start + args.warmup_seconds
+        end = measure_from + args.step_seconds
+        cpu0 = time.process_time()
+        await asyncio.gather(*(self._client(args.seed * 1_000_003 + concurrency * 10_007 + i, measure_from, end,
+                                            results) for i in range(concurrency)))
+        finished = time.perf_counter()
+        seconds = finished - measure_from
+        step = {'concurrency': concurrency, 'duration_s': round(seconds, 2), **summarize(results, seconds)}
+        step['client_cpu_pct'] = round(100 * (time.process_time() - cpu0) / (finished - start), 1)
+        step['server_rss_kb'] = self.rss.window(measure_from, finished) if self.rss else None
+        return step
+
+
+def parse_mix(spec):
+    mix = {}
+    for part in (p.strip() for p in spec.split(',')):
+        if not part:
+            continue
+        kind, _, weight = part.partition('=')
+        if kind not in KINDS:
+            raise ValueError(f"unknown request kind '{kind}' (one of {', '.join(KINDS)})")
+        mix[kind] = float(weight or 1)
+    if not any(w > 0 for w in mix.values()):
+        raise ValueError("the mix has no positive weights")
+    return mix
+
+
+def _log_step(step):
+    lat = step['latency_ms'] or {}
+    rss = step['server_rss_kb'] or {}
+    logger.info(f"c={step['concurrency']:<4} {step['throughput_rps']:>8.1f} req/s  p50 {lat.get('p50', '-'):>8} ms  "
+                f"p95 {lat.get('p95', '-'):>8} ms  p99 {lat.get('p99', '-'):>8} ms  "
+                f"304 {100 * step['not_modified_ratio']:.0f}%  errors {step['errors']}  "
+                f"429 {step['rate_limited']}  rss max {round(rss['max'] / 1024) if rss else '-'} MB  "
+                f"client cpu {step['client_cpu_pct']}%")
+
+
+async def run_load(base_url, token, samples, mix, args, server_pid=None):
+    rss = RssSampler(server_pid) if server_pid else None
+    sampler = asyncio.create_task(rss.run()) if rss else None
+    runner = LoadRunner(base_url, token, samples, mix, args, rss)
+    try:
+        await runner.prime_etags()
+        idle_rss = await asyncio.to_thread(read_rss_kb, server_pid) if server_pid else None
+        steps = []
+        for concurrency in args.steps:
+            logger.info(f"Step: {concurrency} client(s), {args.warmup_seconds}s warm-up + {args.step_seconds}s")
+            step = await runner.run_step(concurrency)
+            _log_step(step)
+            steps.append(step)
+        return idle_rss, steps
+    finally:
+        if sampler:
+            sampler.cancel()
+
+
+# ------------------ Comparison ------------------
+def compare(old_path, new_path):
+    """Print throughput and p99 changes per step (matched on concurrency), overall and per kind"""
+    old, new = (json.loads(Path(p).read_text(encoding='utf-8')) for p in (old_path, new_path))
+    old_steps = {s['concurrency']: s for s in old['steps']}
+
+    def change(a, b):
+        return f"{b} ({(b - a) / a * 100:+.0f}%)" if a else str(b)
+    for step in new['steps']:
+        before = old_steps.get(step['concurrency'])
+        if before is None:
+            continue
+        print(f"c={step['concurrency']}: {change(before['throughput_rps'], step['throughput_rps'])} req/s, "
+              f"p99 {change((before['latency_ms'] or {}).get('p99', 0), (step['latency_ms'] or {}).get('p99', 0))} ms")
+        for kind, b in step['by_kind'].items():
+            a = before['by_kind'].get(kind)
+            if a:
+                print(f"    {kind:<14} {change(a['throughput_rps'], b['throughput_rps'])} req/s, "
+                      f"p99 {change((a['latency_ms'] or {}).get('p99', 0), (b['latency_ms'] or {}).get('p99', 0))} ms")
+
+
+# ------------------ Entrypoint ------------------
+def _git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load test the report and inventory endpoints against synthetic data")
+    parser.add_argument("--workdir", type=Path, default=WORKDIR, help=f"Scratch directory (default: {WORKDIR})")
+    parser.add_argument("--steps", default=DEFAULT_STEPS, help=f"Concurrency steps (default: {DEFAULT_STEPS})")
+    parser.add_argument("--step-seconds", type=float, default=20, help="Measured seconds per step (default: 20)")
+    parser.add_argument("--warmup-seconds", type=float, default=3, help="Unmeasured seconds before each step")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"kind=weight,... (default: {DEFAULT_MIX})")
+    parser.add_argument("--think-ms", type=float, default=0, help="Mean pause between a client's requests")
+    parser.add_argument("--timeout", type=float, default=30, help="Per-request timeout in seconds")
+    parser.add_argument("--requests-per-client", type=int, default=200,
+                        help="Requests before a client takes a new X-Forwarded-For address (default: 200)")
+    parser.add_argument("--no-gzip", dest="gzip", action="store_false", help="Do not send Accept-Encoding: gzip")
+    parser.add_argument("--seed", type=int, default=1, help="Dataset and request-mix seed")
+    parser.add_argument("--products", type=int, default=3000, help="Synthetic products (default: 3000)")
+    parser.add_argument("--stores", type=int, default=400, help="Synthetic stores (default: 400)")
+    parser.add_argument("--days", type=int, default=180, help="Days of warehouse history (default: 180)")
+    parser.add_argument("--allocated-share", type=float, default=0.08, help="Share of allocated products")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the synthetic DB even if it matches")
+    parser.add_argument("--node", default=shutil.which('node') or 'node', help="node binary")
+    parser.add_argument("--base-url", help="Test an already running backend instead of booting one")
+    parser.add_argument("--db", type=Path, help="With --base-url: inventory.db to draw request parameters from")
+    parser.add_argument("--jwt-secret", default=os.getenv('JWT_SECRET'), help="With --base-url: the server's JWT_SECRET")
+    parser.add_argument("--server-pid", type=int, help="With --base-url: backend pid, for RSS sampling")
+    parser.add_argument("--out", type=Path, help="Result JSON (default: <workdir>/results/loadtest-<time>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two result files and exit")
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stdout)
+    args = parse_args()
+    if args.compare:
+        compare(*args.compare)
+        return
+    try:
+        mix = parse_mix(args.mix)
+        args.steps = [int(s) for s in args.steps.split(',') if s.strip()]
+    except ValueError as e:
+        logger.error(f"Bad arguments: {e}")
+        sys.exit(2)
+
+    started = datetime.now()
+    meta = {'started_at': started.strftime('%Y-%m-%d %H:%M:%S'), 'git_commit': _git_commit(),
+            'python': platform.python_version(), 'host': platform.node(), 'mix': mix, 'steps': args.steps,
+            'step_seconds': args.step_seconds, 'warmup_seconds': args.warmup_seconds, 'think_ms': args.think_ms,
+            'gzip': args.gzip}
+    proc = None
+    if args.base_url:
+        if not args.db or not args.jwt_secret:
+            logger.error("--base-url needs --db (request parameters) and --jwt-secret")
+            sys.exit(2)
+        base_url, samples, secret, pid = args.base_url, load_samples(args.db), args.jwt_secret, args.server_pid
+    else:
+        workdir = args.workdir.resolve()
+        if workdir == REPO_DIR:
+            logger.error("--workdir must not be the repository (its BourbonDatabase would be overwritten)")
+            sys.exit(2)
+        workdir.mkdir(parents=True, exist_ok=True)
+        meta['dataset'] = prepare_dataset(workdir, args)
+        samples = load_samples(workdir / 'BourbonDatabase' / 'inventory.db')
+        secret = base64.urlsafe_b64encode(os.urandom(24)).decode()
+        port = _free_port()
+        proc = start_backend(workdir, args.node, secret, port)
+        base_url, pid = f"http://127.0.0.1:{port}", proc.pid
+        try:
+            meta['node'] = subprocess.run([args.node, '--version'], capture_output=True, text=True).stdout.strip()
+        except OSError:
+            pass
+    meta['base_url'] = base_url
+
+    try:
+        idle_rss, steps = asyncio.run(run_load(base_url, make_token(secret), samples, mix, args, pid))
+    finally:
+        if proc is not None:
+            stop_backend(proc)
+    meta['server_rss_kb_idle'] = idle_rss
+    meta['finished_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    out = args.out or args.workdir / 'results' / f"loadtest-{started.strftime('%Y%m%d-%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps({'meta': meta, 'steps': steps}, indent=2), encoding='utf-8')
+    logger.info(f"Wrote {out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Unified product dimension (alcohol ∪ bourbons)
+
+Readers used to join alcohol and bourbons per query (COALESCE(b.name,
+a.brand_name), sometimes ON COALESCE(b.plu, a.nc_code), which no index can
+serve), and the generator guessed alcohol's column names on every run. This
+module is the one place that maps those schemas. It maintains product_dim in
+inventory.db, one row per integer product code (alcohol.nc_code / bourbons.plu):
+
+  product_code       INTEGER PRIMARY KEY, so joins are rowid lookups
+  alcohol_id, bourbon_id   source rows (NULL when the product is missing there)
+  display_name       COALESCE(bourbons.name, brand_name), what the UI shows
+  brand_name, product_name, listing_type, retail_price, supplier, broker, plu,
+  size_ml, bottles_per_case
+                     alcohol columns, resolved through ALCOHOL_COLUMNS
+  has_image, image_path, image_url   image fields with 'no image available' handled once
+  is_allocated       listing_type is Allocation/Limited/Barrel
+  row_hash, updated_at
+
+refresh() reads both sources, hashes each resolved row and writes only new or
+changed rows, then deletes products gone from both sources. An unchanged
+catalogue costs one read and no write transaction.
+
+Triggers on alcohol and bourbons bump product_dim_state.source_version on
+every write, and refresh() records the version it was built from, so the
+scraper and seeders need no change to make a stale table visible. Readers
+(the generator, the backend) use product_dim only while is_current() and read
+alcohol/bourbons directly otherwise. Refresh runs as its own scheduled step
+(cron_setup.txt) and after seeding, never from a report run:
+
+    python3 product_dim.py            # refresh
+    python3 product_dim.py --rebuild  # drop and rebuild
+    python3 product_dim.py --check    # exit 1 if product_dim is missing or stale
+"""
+
+import os
+import re
+import sys
+import json
+import sqlite3
+import hashlib
+import logging
+import argparse
+from datetime import datetime
+
+from database_safety import get_database_manager
+
+DEV_MODE = os.getenv('DEV_MODE', 'false').lower() == 'true'
+DB_PATH = './BourbonDatabase/inventory.db' if DEV_MODE else '/opt/BourbonDatabase/inventory.db'
+
+PRODUCT_DIM_TABLE = 'product_dim'
+PRODUCT_DIM_STATE_TABLE = 'product_dim_state'
+SOURCE_TABLES = ('alcohol', 'bourbons')
+ALLOCATED_TYPES = ('Allocation', 'Limited', 'Barrel')
+
+# Report field -> alcohol column candidates, matched case/underscore-insensitively
+ALCOHOL_COLUMNS = {
+    'brand_name': ['brand_name', 'Brand_Name', 'brand', 'Brand'],
+    'product_name': ['product_name', 'Product_Name', 'name', 'ProductName', 'Product'],
+    'listing_type': ['listing_type', 'Listing_Type', 'listing', 'type', 'Type'],
+    'retail_price': ['retail_price', 'Retail_Price', 'price', 'Price'],
+    'supplier': ['supplier', 'Supplier', 'supplier_name', 'Supplier_Name'],
+    'broker': ['broker_name', 'Broker_Name', 'broker', 'Broker'],
+    'plu': ['plu', 'PLU', 'Plu', 'product_number', 'Product_Number', 'item_number', 'Item_Number', 'sku', 'SKU'],
+    'size_ml': ['size_ml', 'Size_ML', 'size', 'Size'],
+    'bottles_per_case': ['bottles_per_case', 'Bottles_Per_Case', 'case_size'],
+    'image_path': ['image_path', 'Image_Path', 'image', 'Image', 'ImagePath'],
+}
+
+# Metadata fields the reports carry, in report order (see alcohol_select_parts)
+REPORT_FIELDS = ('brand_name', 'product_name', 'listing_type', 'retail_price', 'supplier', 'broker', 'plu',
+                 'has_image', 'image_path', 'image_url')
+
+DIM_COLUMNS = ('product_code', 'alcohol_id', 'bourbon_id', 'display_name', 'brand_name', 'product_name',
+               'listing_type', 'retail_price', 'supplier', 'broker', 'plu', 'size_ml', 'bottles_per_case',
+               'has_image', 'image_path', 'image_url', 'is_allocated')
+
+SCHEMA_SQL = f"""
+CREATE TABLE IF NOT EXISTS {PRODUCT_DIM_TABLE} (
+  product_code INTEGER PRIMARY KEY,
+  alcohol_id INTEGER,
+  bourbon_id INTEGER,
+  display_name TEXT,
+  brand_name TEXT,
+  product_name TEXT,
+  listing_type TEXT,
+  retail_price REAL,
+  supplier TEXT,
+  broker TEXT,
+  plu TEXT,
+  size_ml INTEGER,
+  bottles_per_case INTEGER,
+  has_image INTEGER NOT NULL DEFAULT 0,
+  image_path TEXT,
+  image_url TEXT,
+  is_allocated INTEGER NOT NULL DEFAULT 0,
+  row_hash TEXT NOT NULL,
+  updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_product_dim_listing ON {PRODUCT_DIM_TABLE}(listing_type, product_code);
+CREATE INDEX IF NOT EXISTS idx_product_dim_display_name ON {PRODUCT_DIM_TABLE}(display_name COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS {PRODUCT_DIM_STATE_TABLE} (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  source_version INTEGER NOT NULL,
+  built_version INTEGER
+);
+INSERT OR IGNORE INTO {PRODUCT_DIM_STATE_TABLE} (id, source_version, built_version) VALUES (1, 0, NULL);
+"""
+
+logger = logging.getLogger('product_dim')
+
+
+# ------------------ Schema mapping ------------------
+def _normalize(name: str) -> str:
+    """normalize col name: lower + remove spaces/underscores"""
+    return re.sub(r'[\s_]+', '', (name or '').lower())
+
+
+def _quote_ident(identifier: str) -> str:
+    return identifier if re.match(r'^[A-Za-z_][A-Za-z0-9_]*$', identifier or '') else f'"{identifier}"'
+
+
+def pick_column(cols, candidates):
+    """Pick first matching column name from candidates, case/format-insensitive."""
+    norm_map = {_normalize(c): c for c in cols}
+    for cand in candidates:
+        key = _normalize(cand)
+        if key in norm_map:
+            return norm_map[key]
+    return None
+
+
+def table_columns(conn, table: str):
+    return [r[1] for r in conn.execute(f"PRAGMA table_info({_quote_ident(table)})")]
+
+
+def resolve_alcohol_columns(cols):
+    """{field: actual alcohol column or None}"""
+    return {field: pick_column(cols, candidates) for field, candidates in ALCOHOL_COLUMNS.items()}
+
+
+def alcohol_select_parts(cols, alias='a', fields=REPORT_FIELDS):
+    """
+    SELECT expressions for `fields` over alcohol (alias `alias`), one per field
+    in order; NULL for columns this alcohol table does not have. Image fields
+    treat '' and 'no image available' as no image.
+    """
+    mapping = resolve_alcohol_columns(cols)
+    image_col = mapping['image_path']
+    image_expr = f"{alias}.{_quote_ident(image_col)}" if image_col else None
+    has_image_cond = (f"{image_expr} IS NOT NULL AND {image_expr} != '' AND {image_expr} != 'no image available'"
+                      if image_expr else None)
+    parts = []
+    for field in fields:
+        if field == 'has_image':
+            parts.append(f"CASE WHEN {has_image_cond} THEN 1 ELSE 0 END AS has_image" if image_expr
+                         else "0 AS has_image")
+        elif field == 'image_path':
+            parts.append(f"CASE WHEN {has_image_cond} THEN {image_expr} ELSE NULL END AS image_path" if image_expr
+                         else "NULL AS image_path")
+        elif field == 'image_url':
+            parts.append(f"""CASE WHEN {has_image_cond}
+  THEN '/api/images/' || REPLACE(REPLACE({image_expr}, 'alcohol_images\\', ''), 'alcohol_images/', '')
+  ELSE NULL END AS image_url""" if image_expr else "NULL AS image_url")
+        else:
+            col = mapping[field]
+            parts.append(f"{alias}.{_quote_ident(col)} AS {field}" if col else f"NULL AS {field}")
+    return parts
+
+
+def has_product_dim(conn) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                        [PRODUCT_DIM_TABLE]).fetchone() is not None
+
+
+def _source_version(conn):
+    """(source_version, built_version), or None before the first refresh that tracks versions"""
+    try:
+        return conn.execute(f"SELECT source_version, built_version FROM {PRODUCT_DIM_STATE_TABLE} "
+                            f"WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        return None
+
+
+def is_current(conn) -> bool:
+    """product_dim exists and no alcohol/bourbons write happened since it was built"""
+    if not has_product_dim(conn):
+        return False
+    state = _source_version(conn)
+    return state is not None and state[1] == state[0]
+
+
+def _create_schema(conn):
+    """product_dim, its state row and the source triggers (idempotent)"""
+    for stmt in SCHEMA_SQL.strip().split(';'):
+        if stmt.strip():
+            conn.execute(stmt)
+    bump = f"UPDATE {PRODUCT_DIM_STATE_TABLE} SET source_version = source_version + 1 WHERE id = 1;"
+    for table in SOURCE_TABLES:
+        if table_columns(conn, table):
+            for op in ('INSERT', 'UPDATE', 'DELETE'):
+                conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_product_dim_{op.lower()} "
+                             f"AFTER {op} ON {table} BEGIN {bump} END")
+
+
+# ------------------ Build ------------------
+def _product_code(value):
+    if isinstance(value, int):
+        return value
+    s = str(value).strip() if value is not None else ''
+    return int(s) if s.isdigit() else None
+
+
+def source_rows(conn):
+    """({product_code: dim row dict}, skipped source codes) resolved from alcohol and bourbons"""
+    conn.row_factory = sqlite3.Row
+    a_cols = table_columns(conn, 'alcohol')
+    b_cols = table_columns(conn, 'bourbons')
+    fields = [f for f in DIM_COLUMNS if f in ALCOHOL_COLUMNS or f in ('has_image', 'image_url')]
+    rows, skipped = {}, []
+    if a_cols:
+        id_col = pick_column(a_cols, ['alcohol_id'])
+        alcohol_id = f"a.{id_col}" if id_col else "a.rowid"
+        for r in conn.execute(f"SELECT a.nc_code AS nc_code, {alcohol_id} AS alcohol_id, "
+                              f"{', '.join(alcohol_select_parts(a_cols, fields=fields))} "
+                              f"FROM alcohol a ORDER BY a.rowid"):
+            code = _product_code(r['nc_code'])
+            if code is None:
+                skipped.append(r['nc_code'])
+                continue
+            if code not in rows:  # duplicate alcohol rows: first wins, as in the generator
+                rows[code] = dict(r, product_code=code, bourbon_id=None, bourbon_name=None)
+    if b_cols:
+        for r in conn.execute("SELECT plu, bourbon_id, name FROM bourbons ORDER BY rowid"):
+            code = _product_code(r['plu'])
+            if code is None:
+                skipped.append(r['plu'])
+                continue
+            row = rows.get(code)
+            if row is None:
+                row = rows[code] = {f: None for f in fields}
+                row.update(product_code=code, alcohol_id=None, bourbon_id=None, has_image=0)
+            if row['bourbon_id'] is None:
+                row.update(bourbon_id=r['bourbon_id'], bourbon_name=r['name'])
+    out = {}
+    for code, r in rows.items():
+        d = {c: r.get(c) for c in DIM_COLUMNS}
+        d['plu'] = None if d['plu'] is None else str(d['plu'])
+        d['display_name'] = r.get('bourbon_name') or r.get('brand_name')
+        d['is_allocated'] = 1 if d['listing_type'] in ALLOCATED_TYPES else 0
+        out[code] = d
+    return out, skipped
+
+
+def _row_hash(d):
+    return hashlib.sha1(json.dumps([d[c] for c in DIM_COLUMNS], default=str).encode()).hexdigest()
+
+
+def refresh(db_path=DB_PATH, rebuild=False):
+    """Bring product_dim in line with alcohol/bourbons; returns {'inserted', 'updated', 'deleted', 'unchanged'}"""
+    manager = get_database_manager(db_path)
+    with manager.get_connection() as conn:
+        tracked = _source_version(conn) is not None
+    if not tracked:
+        manager.execute_write(_create_schema)  # triggers before the first read, so no source write goes unseen
+    with manager.get_connection() as conn:
+        # read the version first: a write during the read leaves the table marked stale
+        state = _source_version(conn)
+        version = state[0]
+        rows, skipped = source_rows(conn)
+        conn.row_factory = None
+        existing = ({} if rebuild or not has_product_dim(conn) else
+                    dict(conn.execute(f"SELECT product_code, row_hash FROM {PRODUCT_DIM_TABLE}")))
+    if skipped:
+        logger.warning(f"{len(skipped)} source rows have a non-numeric product code and were left out "
+                       f"(e.g. {skipped[:5]})")
+
+    changed = []
+    for code, d in rows.items():
+        h = _row_hash(d)
+        if existing.get(code) != h:
+            changed.append([d[c] for c in DIM_COLUMNS] + [h])
+    gone = [code for code in existing if code not in rows]
+    counts = {'inserted': sum(1 for r in changed if r[0] not in existing),
+              'updated': sum(1 for r in changed if r[0] in existing),
+              'deleted': len(gone), 'unchanged': len(rows) - len(changed)}
+    if not changed and not gone and not rebuild and existing and state[1] == version:
+        logger.info(f"{PRODUCT_DIM_TABLE} up to date ({len(rows)} products)")
+        return counts
+
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    placeholders = ', '.join(['?'] * (len(DIM_COLUMNS) + 2))
+    assignments = ', '.join(f"{c} = excluded.{c}" for c in DIM_COLUMNS[1:] + ('row_hash', 'updated_at'))
+
+    def write(conn):
+        if rebuild:
+            conn.execute(f"DROP TABLE IF EXISTS {PRODUCT_DIM_TABLE}")
+        _create_schema(conn)
+        conn.execute(f"UPDATE {PRODUCT_DIM_STATE_TABLE} SET built_version = ? WHERE id = 1", [version])
+        conn.executemany(
+            f"INSERT INTO {PRODUCT_DIM_TABLE} ({', '.join(DIM_COLUMNS)}, row_hash, updated_at) "
+            f"VALUES ({placeholders}) ON CONFLICT(product_code) DO UPDATE SET {assignments}",
+            [r + [now] for r in changed])
+        for i in range(0, len(gone), 500):
+            chunk = gone[i:i + 500]
+            conn.execute(f"DELETE FROM {PRODUCT_DIM_TABLE} WHERE product_code IN ({','.join(['?'] * len(chunk))})",
+                         chunk)
+    manager.execute_write(write)
+    logger.info(f"{PRODUCT_DIM_TABLE}: {counts['inserted']} inserted, {counts['updated']} updated, "
+                f"{counts['deleted']} deleted, {counts['unchanged']} unchanged")
+    return counts
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stdout)
+    parser = argparse.ArgumentParser(description="Refresh the product_dim table from alcohol and bourbons")
+    parser.add_argument("--db", default=DB_PATH, help=f"Inventory DB (default: {DB_PATH})")
+    parser.add_argument("--rebuild", action="store_true", help="Drop and rebuild the table")
+    parser.add_argument("--check", action="store_true", help="Exit 1 if product_dim is missing or stale")
+    args = parser.parse_args()
+    if args.check:
+        with get_database_manager(args.db, read_only=True).get_connection() as conn:
+            current = is_current(conn)
+        logger.info(f"{PRODUCT_DIM_TABLE} is {'current' if current else 'missing or stale'}")
+        sys.exit(0 if current else 1)
+    try:
+        refresh(args.db, rebuild=args.rebuild)
+    except sqlite3.Error as e:
+        logger.error(f"product_dim refresh failed: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
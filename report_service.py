@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+Resident warehouse report service
+
+Cron builds the fixed windows as files. Ad-hoc requests (any start/end,
+listing_type filter, text search) would otherwise each start a fresh generator
+process, with interpreter start, schema detection and a full history scan. This
+process loads the per-product history into memory once and answers those
+requests from it over loopback HTTP or a Unix socket:
+
+  GET  /report?period=last_30_days            same {'meta', 'products'} as the report files
+  GET  /report?start=2024-01-01&end=2024-02-15&listing_type=Limited,Allocation&q=eagle&limit=50&offset=0
+  GET  /health                                dataset and cache stats
+  POST /reload                                full reload (after backfilling older check_dates)
+
+Dataset: one sorted list of distinct check_dates, and per product two arrays
+(date indexes, total_available). A window is a bisect on the date array,
+and peak/low use the generator's rules (last occurrence of the max; last
+occurrence of the min at/after it) computed with max()/min() over the slice.
+current_inventory is the product's latest value, as in the reports.
+
+Refresh: a poll thread checks PRAGMA data_version on its open connection every
+REPORT_SERVICE_POLL seconds. After a commit it re-reads the rows from the last
+loaded check_date onwards, so the scrape day that is still filling in is
+included. Product metadata is re-read at the same time. If MIN(check_date)
+moved (archiving, backfill), it reloads everything.
+
+Rendered responses are kept in an LRU (REPORT_SERVICE_CACHE entries) keyed by
+window, filters, paging and the dataset version, so a refresh makes the old
+entries unreachable.
+
+Reads the hot table only: windows reaching past it (see archive_history.py)
+start at meta['data_from'].
+"""
+
+import os
+import sys
+import time
+import signal
+import socket
+import sqlite3
+import argparse
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from urllib.parse import urlsplit, parse_qs
+
+from report_writer import ReportMetaAccumulator, dumps
+from search_index import normalize
+from warehouse_inventory_generator import WarehouseInventoryGenerator, HISTORY_TABLE, DEV_MODE, logger
+
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = int(os.getenv('REPORT_SERVICE_PORT', '8765'))
+SERVICE_SOCKET = os.getenv('REPORT_SERVICE_SOCKET')  # path; overrides host/port
+POLL_SECONDS = float(os.getenv('REPORT_SERVICE_POLL', '5'))
+CACHE_ENTRIES = int(os.getenv('REPORT_SERVICE_CACHE', '64'))
+MAX_LIMIT = 5000
+
+
+class HistoryDataset:
+    """In-memory per-product history of warehouse_inventory_history_v2"""
+
+    def __init__(self, gen: WarehouseInventoryGenerator):
+        self.gen = gen
+        self.lock = threading.RLock()
+        self.version = 0
+        self.dates = []  # sorted distinct check_dates
+        self.date_index = {}
+        self.points = {}  # nc_code -> (array of date indexes, array of totals)
+        self.metadata = {}  # str(nc_code) -> alcohol row
+        self.loaded_at = None
+        self._conn = None
+        self._data_version = None
+        self._min_date = None
+
+    def _connection(self):
+        if self._conn is None:
+            uri = f"file:{os.path.abspath(self.gen.db_path)}?mode=ro"
+            self._conn = sqlite3.connect(uri, uri=True, timeout=30, check_same_thread=False)
+        return self._conn
+
+    def _bounds(self):
+        return self._connection().execute(
+            f"SELECT MIN(check_date), MAX(check_date) FROM {HISTORY_TABLE}").fetchone()
+
+    def _load_rows(self, since=None):
+        """(nc_code, check_date, total) from since (inclusive) onwards, ordered like the generator's scan"""
+        sql = f"SELECT nc_code, check_date, total_available FROM {HISTORY_TABLE}"
+        params = []
+        if since is not None:
+            sql += " WHERE check_date >= ?"
+            params.append(since)
+        return self._connection().execute(sql + " ORDER BY nc_code, check_date", params)
+
+    def _index_dates(self, since=None):
+        """Register check_dates in order first, so date indexes sort the same way as the dates"""
+        sql = f"SELECT DISTINCT check_date FROM {HISTORY_TABLE}"
+        params = []
+        if since is not None:
+            sql += " WHERE check_date >= ?"
+            params.append(since)
+        for (d,) in self._connection().execute(sql + " ORDER BY check_date", params):
+            self._index_of(d)
+
+    def _index_of(self, check_date):
+        i = self.date_index.get(check_date)
+        if i is None:
+            # check_dates only ever arrive at the end (older ones trigger a full reload)
+            i = self.date_index[check_date] = len(self.dates)
+            self.dates.append(check_date)
+        return i
+
+    def _append(self, rows):
+        count = 0
+        for code, check_date, total in rows:
+            entry = self.points.get(code)
+            if entry is None:
+                entry = self.points[code] = (array('i'), array('q'))
+            entry[0].append(self._index_of(check_date))
+            entry[1].append(int(total or 0))
+            count += 1
+        return count
+
+    def _load_metadata(self):
+        self.gen._products = None  # product_dim or alcohol, whichever is current now
+        self.metadata = self.gen._get_product_metadata(list(self.points.keys()))
+        self.gen._thumbnails = None  # pick up a newer image manifest too
+
+    def load(self):
+        """Full (re)load"""
+        started = time.monotonic()
+        with self.lock:
+            self._data_version = self._connection().execute("PRAGMA data_version").fetchone()[0]
+            self._min_date, _ = self._bounds()
+            self.dates, self.date_index, self.points = [], {}, {}
+            self._index_dates()
+            count = self._append(self._load_rows())
+            self._load_metadata()
+            self.version += 1
+            self.loaded_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        logger.info(f"Loaded {count} history rows for {len(self.points)} products "
+                    f"({self.dates[0] if self.dates else '-'}..{self.dates[-1] if self.dates else '-'}) "
+                    f"in {time.monotonic() - started:.2f}s")
+
+    def refresh(self):
+        """Pick up commits since the last load; returns True if the dataset changed"""
+        with self.lock:
+            data_version = self._connection().execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self._data_version:
+                return False
+            min_date, max_date = self._bounds()
+            if min_date != self._min_date or (self.dates and max_date is not None and max_date < self.dates[-1]):
+                logger.info("History changed before the loaded range; reloading everything.")
+                self.load()
+                return True
+            self._data_version = data_version
+            if not self.dates:
+                self.load()
+                return True
+            since = self.dates[-1]
+            cut = self.date_index[since]
+            for idx, totals in self.points.values():
+                while idx and idx[-1] >= cut:
+                    idx.pop()
+                    totals.pop()
+            self._index_dates(since)
+            count = self._append(self._load_rows(since))
+            new_codes = [c for c in self.points if str(c) not in self.metadata]
+            self._load_metadata()
+            self.version += 1
+        logger.info(f"Refreshed from {since}: {count} rows, {len(new_codes)} new products, "
+                    f"now through {self.dates[-1]} (dataset v{self.version})")
+        return True
+
+    def window_products(self, start_date, end_date, listing_types=None, words=None):
+        """Sorted product records for [start_date, end_date], the same as the generator's output"""
+        gen = self.gen
+        with self.lock:
+            lo_idx = bisect_left(self.dates, start_date)
+            hi_idx = bisect_right(self.dates, end_date) - 1
+            out = []
+            if hi_idx < lo_idx:
+                return out
+            for code, (idx, totals) in self.points.items():
+                lo = bisect_left(idx, lo_idx)
+                hi = bisect_right(idx, hi_idx)
+                if lo == hi:
+                    continue
+                r = self.metadata.get(str(code))
+                if r is None:
+                    continue  # no alcohol row: not reportable
+                pd = gen._product_meta(r)
+                if listing_types and pd['listing_type'].lower() not in listing_types:
+                    continue
+                if words:
+                    text = ' '.join(normalize(x) for x in (pd['product_name'], pd['brand_name'], pd['supplier'],
+                                                           code, pd['plu']))
+                    if not all(w in text for w in words):
+                        continue
+                window = totals[lo:hi]
+                n = len(window)
+                peak = max(window)
+                peak_at = n - 1 - window[::-1].index(peak)
+                after = window[peak_at:]
+                low = min(after)
+                low_at = peak_at + len(after) - 1 - after[::-1].index(low)
+                pd['last_updated'] = self.dates[idx[hi - 1]]
+                out.append(gen._product_record(pd, code, totals[-1], peak, self.dates[idx[lo + peak_at]],
+                                               low, self.dates[idx[lo + low_at]]))
+        return gen._sort_products(out)
+
+    def stats(self):
+        with self.lock:
+            return {'dataset_version': self.version, 'loaded_at': self.loaded_at,
+                    'products': len(self.points), 'points': sum(len(i) for i, _ in self.points.values()),
+                    'data_from': self.dates[0] if self.dates else None,
+                    'data_through': self.dates[-1] if self.dates else None}
+
+
+class ReportService:
+    def __init__(self, dataset: HistoryDataset, cache_entries=CACHE_ENTRIES):
+        self.dataset = dataset
+        self.cache_entries = cache_entries
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def _resolve_window(self, params):
+        period = params.get('period')
+        if period:
+            ranges = self.dataset.gen._get_time_periods()
+            if period not in ranges:
+                raise ValueError(f"Unknown period: {period}")
+            r = ranges[period]
+            return period, r['start'].strftime('%Y-%m-%d'), r['end'].strftime('%Y-%m-%d'), r['description']
+        start, end = params.get('start'), params.get('end') or datetime.now().strftime('%Y-%m-%d')
+        if not start:
+            raise ValueError("Give period=<name> or start=YYYY-MM-DD (and optionally end)")
+        for d in (start, end):
+            datetime.strptime(d, '%Y-%m-%d')
+        if start > end:
+            raise ValueError("start is after end")
+        return 'custom', start, end, f"{start} to {end}"
+
+    def render(self, params):
+        """Response body (bytes) for a /report query; ValueError for bad parameters"""
+        time_period, start, end, description = self._resolve_window(params)
+        listing_types = tuple(sorted({t.strip().lower() for t in params.get('listing_type', '').split(',')
+                                      if t.strip()}))
+        words = tuple(normalize(params.get('q', '')).split())
+        limit = min(int(params.get('limit') or MAX_LIMIT), MAX_LIMIT)
+        offset = max(int(params.get('offset') or 0), 0)
+        key = (start, end, listing_types, words, limit, offset, self.dataset.version)
+        with self._cache_lock:
+            body = self._cache.get(key)
+            if body is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return body
+            self.misses += 1
+
+        started = time.monotonic()
+        products = self.dataset.window_products(start, end, set(listing_types), words)
+        totals = ReportMetaAccumulator()
+        for p in products:
+            totals.add(p)
+        data = self.dataset.stats()
+        meta = {
+            'time_period': time_period,
+            'description': description,
+            'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'start_date': start,
+            'end_date': end,
+            **totals.fields(),
+            'filters': {'listing_type': list(listing_types), 'q': params.get('q') or None},
+            'offset': offset,
+            'limit': limit,
+            'dataset_version': key[-1],
+            'data_from': data['data_from'],
+            'data_through': data['data_through'],
+            'compute_ms': round((time.monotonic() - started) * 1000, 1),
+        }
+        body = dumps({'meta': meta, 'products': products[offset:offset + limit]})
+        with self._cache_lock:
+            self._cache[key] = body
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+        return body
+
+    def stats(self):
+        with self._cache_lock:
+            cache = {'entries': len(self._cache), 'max_entries': self.cache_entries,
+                     'hits': self.hits, 'misses': self.misses}
+        return {**self.dataset.stats(), 'cache': cache}
+
+
+def _make_handler(service: ReportService):
+    class Handler(BaseHTTPRequestHandler):
+        server_version = 'WarehouseReportService/1'
+
+        def address_string(self):
+            # Unix socket peers have no (host, port)
+            return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+        def log_message(self, fmt, *args):
+            logger.debug(f"{self.address_string()} {fmt % args}")
+
+        def _send(self, status, body, content_type='application/json'):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_json(self, status, obj):
+            self._send(status, dumps(obj))
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            try:
+                if url.path == '/report':
+                    self._send(200, service.render(params))
+                elif url.path == '/health':
+                    self._send_json(200, {'success': True, **service.stats()})
+                else:
+                    self._send_json(404, {'success': False, 'error': 'Not found'})
+            except ValueError as e:
+                self._send_json(400, {'success': False, 'error': str(e)})
+            except Exception as e:
+                logger.error(f"Request {self.path} failed: {e}")
+                self._send_json(500, {'success': False, 'error': 'Report service error'})
+
+        def do_POST(self):
+            if urlsplit(self.path).path != '/reload':
+                self._send_json(404, {'success': False, 'error': 'Not found'})
+                return
+            try:
+                service.dataset.load()
+                self._send_json(200, {'success': True, **service.stats()})
+            except Exception as e:
+                logger.error(f"Reload failed: {e}")
+                self._send_json(500, {'success': False, 'error': 'Reload failed'})
+
+    return Handler
+
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        try:
+            os.unlink(self.server_address)
+        except FileNotFoundError:
+            pass
+        super().server_bind()
+        os.chmod(self.server_address, 0o660)  # backend user via the shared group only
+
+
+def _poll(dataset: HistoryDataset, interval, stop: threading.Event):
+    while not stop.wait(interval):
+        try:
+            dataset.refresh()
+        except Exception as e:
+            logger.error(f"Dataset refresh failed: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve ad-hoc warehouse reports from an in-memory history")
+    parser.add_argument("--port", type=int, default=SERVICE_PORT, help=f"Loopback port (default: {SERVICE_PORT})")
+    parser.add_argument("--socket", default=SERVICE_SOCKET, help="Listen on this Unix socket instead")
+    parser.add_argument("--db", help="Inventory DB (default: the generator's DB_PATH)")
+    parser.add_argument("--poll", type=float, default=POLL_SECONDS,
+                        help=f"Seconds between change checks (default: {POLL_SECONDS})")
+    args = parser.parse_args()
+
+    gen = WarehouseInventoryGenerator(db_path=args.db)
+    if not gen.test_database_connection():
+        logger.error("Cannot connect to database; exiting.")
+        sys.exit(1)
+    dataset = HistoryDataset(gen)
+    dataset.load()
+    service = ReportService(dataset)
+
+    if args.socket:
+        server = ThreadingUnixHTTPServer(args.socket, _make_handler(service))
+        where = args.socket
+    else:
+        server = ThreadingHTTPServer((SERVICE_HOST, args.port), _make_handler(service))
+        server.daemon_threads = True
+        where = f"http://{SERVICE_HOST}:{args.port}"
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))  # systemd stop: run the cleanup below
+    stop = threading.Event()
+    threading.Thread(target=_poll, args=(dataset, args.poll, stop), daemon=True).start()
+    logger.info(f"Report service listening on {where} (dev_mode={DEV_MODE}, pid {os.getpid()}, "
+                f"host {socket.gethostname()})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+        if args.socket:
+            try:
+                os.unlink(args.socket)
+            except FileNotFoundError:
+                pass
+
+
+if __name__ == '__main__':
+    main()
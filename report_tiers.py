@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Tiered report refresh: hot listing types often, the catalogue rarely
+
+A plain generator run rebuilds every product of every window, so the ~250
+Allocation/Limited/Barrel products people watch are no fresher than the
+~3,000 Listed ones that barely move. With REPORT_TIERS set, runs refresh
+slices instead:
+
+    REPORT_TIERS="hot:Allocation|Limited|Barrel:15,catalog:*:360"
+                  name:listing types ('|'-separated, * = every product):minutes between refreshes
+
+Exactly one tier is '*', the catalogue. A tier run scans history for its own
+products only (the generator's listing_types filter, an IN-list on the
+nc_code indexes) and writes one slice per window:
+
+    slices/<tier>/<tp>.json   {"meta": {tier, listing_types, time_period, generated_at,
+                                        start_date, end_date, products},
+                               "products": [...], "sparklines": <sidecar> | null}
+
+Each window's published files (report, metadata, sparklines) are then
+reassembled from the newest slices. Slices are applied oldest first; each one
+replaces the products of its listing types and any product it lists. A
+product therefore always comes from the newest slice covering it, including
+after its listing type changed. meta.slices records the generated_at of each
+slice used.
+
+A plain run (the fixed cron times, the admin button) is a catalogue run. It
+also does the catalogue-cadence extras (thumbnails, shipments). --due runs the
+tiers whose interval has elapsed; a tier counts as refreshed whenever the
+catalogue was:
+
+    */5 * * * * python3 warehouse_inventory_generator.py --due
+    python3 warehouse_inventory_generator.py --tier hot
+    python3 report_tiers.py               # when each tier was refreshed, what is due
+"""
+
+import os
+import sys
+import json
+import logging
+import argparse
+from datetime import datetime
+from pathlib import Path
+
+from report_writer import write_compact_json_atomic
+from sparklines import delta_encode, delta_decode
+
+logger = logging.getLogger('warehouse_inventory_generator')
+
+DEV_MODE = os.getenv('DEV_MODE', 'false').lower() == 'true'
+OUTPUT_DIR = './warehouse-reports' if DEV_MODE else '/opt/warehouse-reports'
+REPORT_TIERS = os.getenv('REPORT_TIERS', '')
+SLICES_DIR = 'slices'
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+# A tier this close to its interval counts as due, so a run that took a while still fits the next cron tick
+DUE_GRACE_SECONDS = int(os.getenv('TIER_DUE_GRACE_SECONDS', '60'))
+
+
+# ------------------ Config ------------------
+def parse_tiers(spec):
+    """'name:Type|Type:minutes,...' -> {name: {name, listing_types (tuple, None = all), interval_minutes}}"""
+    tiers = {}
+    for entry in (e.strip() for e in spec.split(',')):
+        if not entry:
+            continue
+        parts = [p.strip() for p in entry.split(':')]
+        if len(parts) != 3 or not parts[0] or not parts[1]:
+            raise ValueError(f"tier '{entry}' is not name:listing types:minutes")
+        name, types, minutes = parts
+        if name in tiers:
+            raise ValueError(f"tier '{name}' is listed twice")
+        try:
+            interval = int(minutes)
+        except ValueError:
+            raise ValueError(f"tier '{name}': interval '{minutes}' is not a number of minutes") from None
+        if interval <= 0:
+            raise ValueError(f"tier '{name}': interval must be positive")
+        listing_types = None if types == '*' else tuple(t.strip() for t in types.split('|') if t.strip())
+        tiers[name] = {'name': name, 'listing_types': listing_types, 'interval_minutes': interval}
+    catalogues = [t['name'] for t in tiers.values() if t['listing_types'] is None]
+    if len(catalogues) != 1:
+        raise ValueError(f"exactly one tier must cover every listing type ('*'), found {len(catalogues)}")
+    return tiers
+
+
+def catalogue_tier(tiers):
+    return next(t for t in tiers.values() if t['listing_types'] is None)
+
+
+def select_tiers(tiers, names=None):
+    """Tiers to refresh for a request: the catalogue alone when it is asked for (or nothing is)"""
+    unknown = [n for n in names or [] if n not in tiers]
+    if unknown:
+        raise ValueError(f"Unknown report tier(s): {', '.join(unknown)} (REPORT_TIERS has {', '.join(tiers)})")
+    selected = [tiers[n] for n in dict.fromkeys(names or [])]
+    if not selected or any(t['listing_types'] is None for t in selected):
+        return [catalogue_tier(tiers)]
+    return selected
+
+
+# ------------------ Slices ------------------
+def slice_path(output_dir, tier_name, time_period):
+    return Path(output_dir) / SLICES_DIR / tier_name / f"{time_period}.json"
+
+
+def load_slice(path):
+    try:
+        return json.loads(Path(path).read_bytes())
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable slice {path}: {e}")
+        return None
+
+
+def write_slice(gen, tier, time_period, date_range, file_mode=None):
+    """Build one tier's products for a window and save them as its slice; returns the slice"""
+    generated_at = datetime.now().strftime(TIME_FORMAT)
+    sparklines = gen._sparkline_collector(date_range)
+    gen.listing_types = tier['listing_types']
+    try:
+        products = gen._build_report_products(time_period, date_range, sparklines)
+    finally:
+        gen.listing_types = None
+    doc = {
+        'meta': {
+            'tier': tier['name'],
+            'listing_types': None if tier['listing_types'] is None else list(tier['listing_types']),
+            'time_period': time_period,
+            'generated_at': generated_at,
+            'start_date': date_range['start'].strftime('%Y-%m-%d'),
+            'end_date': date_range['end'].strftime('%Y-%m-%d'),
+            'products': len(products),
+        },
+        'products': products,
+        'sparklines': (sparklines.to_sidecar(time_period, [p['nc_code'] for p in products])
+                       if sparklines is not None else None),
+    }
+    path = slice_path(gen.output_dir, tier['name'], time_period)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    write_compact_json_atomic(path, doc, file_mode)
+    logger.info(f"Wrote {tier['name']} slice for {time_period}: {len(products)} products")
+    return doc
+
+
+def _shift_series(series, days):
+    """Re-base one delta-encoded [days, values] pair by `days`, dropping points before the new start"""
+    if days == 0:
+        return series
+    points = [(x + days, y) for x, y in zip(delta_decode(series[0]), delta_decode(series[1])) if x + days >= 0]
+    return [delta_encode([x for x, _ in points]), delta_encode([y for _, y in points])]
+
+
+def assemble_window(gen, tiers, time_period, date_range):
+    """
+    (products, sparkline sidecar or None, {tier: generated_at}) for a window,
+    from the newest slice of every configured tier
+    """
+    slices = [s for s in (load_slice(slice_path(gen.output_dir, name, time_period)) for name in tiers) if s]
+    # oldest first; on a tie the catalogue goes first so the narrower slice lands on top
+    slices.sort(key=lambda s: (s['meta']['generated_at'], s['meta']['listing_types'] is not None))
+    chosen = {}  # str(nc_code) -> (product, slice)
+    for sl in slices:
+        cover = sl['meta']['listing_types']
+        fresh = {str(p['nc_code']): p for p in sl['products']}
+        chosen = {code: v for code, v in chosen.items()
+                  if cover is not None and v[0]['listing_type'] not in cover and code not in fresh}
+        chosen.update((code, (p, sl)) for code, p in fresh.items())
+
+    products = gen._sort_products(sorted((p for p, _ in chosen.values()), key=lambda p: p['nc_code']))
+
+    start = date_range['start'].strftime('%Y-%m-%d')
+    sidecar = None
+    if gen._sparkline_collector(date_range) is not None and any(sl.get('sparklines') for sl in slices):
+        series, max_points = {}, None
+        for p in products:
+            code = str(p['nc_code'])
+            sl = chosen[code][1]
+            side = sl.get('sparklines')
+            if not side or code not in side['series']:
+                continue
+            offset = (datetime.strptime(side['meta']['start_date'], '%Y-%m-%d')
+                      - datetime.strptime(start, '%Y-%m-%d')).days
+            series[code] = _shift_series(side['series'][code], offset)
+            max_points = side['meta']['max_points']
+        sidecar = {
+            'meta': {'time_period': time_period, 'start_date': start,
+                     'end_date': date_range['end'].strftime('%Y-%m-%d'),
+                     'max_points': max_points, 'encoding': 'delta', 'products': len(series)},
+            'series': series,
+        }
+    used = {sl['meta']['tier']: sl['meta']['generated_at'] for sl in slices}
+    return products, sidecar, used
+
+
+def refresh_tier_window(gen, tiers, time_period, date_range, file_mode=None):
+    """Rebuild these tiers' slices for one window and republish it from all slices; returns the meta block"""
+    for tier in tiers:
+        write_slice(gen, tier, time_period, date_range, file_mode)
+    products, sidecar, used = assemble_window(gen, gen.tiers, time_period, date_range)
+    meta = gen.publish_report(time_period, date_range, products, sidecar, slices=used)
+    logger.info(f"Published {time_period} from slices " + ', '.join(f"{t} ({at})" for t, at in used.items()))
+    return meta
+
+
+# ------------------ Schedule ------------------
+def last_refreshed(output_dir, tier_name, periods):
+    """Oldest generated_at among a tier's slices for `periods` (None if any is missing)"""
+    stamps = []
+    for tp in periods:
+        sl = load_slice(slice_path(output_dir, tier_name, tp))
+        if sl is None:
+            return None
+        stamps.append(datetime.strptime(sl['meta']['generated_at'], TIME_FORMAT))
+    return min(stamps) if stamps else None
+
+
+def tier_schedule(output_dir, tiers, periods, now=None):
+    """{name: (last refresh or None, due)}; a catalogue refresh counts for every tier"""
+    now = now or datetime.now()
+    catalogue = catalogue_tier(tiers)['name']
+    refreshed = {name: last_refreshed(output_dir, name, periods) for name in tiers}
+    out = {}
+    for name, tier in tiers.items():
+        last = max(filter(None, (refreshed[name], refreshed[catalogue])), default=None)
+        due = last is None or (now - last).total_seconds() + DUE_GRACE_SECONDS >= tier['interval_minutes'] * 60
+        out[name] = (last, due)
+    return out
+
+
+def due_tiers(output_dir, tiers, periods, now=None):
+    """Names of the tiers to refresh now: the catalogue alone if it is due, else every due tier"""
+    schedule = tier_schedule(output_dir, tiers, periods, now)
+    catalogue = catalogue_tier(tiers)['name']
+    if schedule[catalogue][1]:
+        return [catalogue]
+    return [name for name, (_, due) in schedule.items() if due]
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stdout)
+    parser = argparse.ArgumentParser(description="Show when each REPORT_TIERS slice was refreshed and what is due")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR, help=f"Report directory (default: {OUTPUT_DIR})")
+    parser.add_argument("--tiers", default=REPORT_TIERS, help="Tier spec (default: $REPORT_TIERS)")
+    args = parser.parse_args()
+    try:
+        tiers = parse_tiers(args.tiers)
+    except ValueError as e:
+        logger.error(f"Bad REPORT_TIERS: {e}")
+        sys.exit(2)
+    from warehouse_inventory_generator import TIME_PERIODS
+    for name, (last, due) in tier_schedule(args.output_dir, tiers, TIME_PERIODS).items():
+        tier = tiers[name]
+        types = '*' if tier['listing_types'] is None else '|'.join(tier['listing_types'])
+        print(f"{name:<12} {types:<32} every {tier['interval_minutes']:>4} min  "
+              f"last {last.strftime(TIME_FORMAT) if last else 'never':<19}  {'DUE' if due else ''}")
+
+
+if __name__ == '__main__':
+    main()
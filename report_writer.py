@@ -0,0 +1,184 @@
+"""
+Streaming writers for the warehouse report files
+
+Products are serialised one at a time as the generator yields them, so a
+window never has to exist as one big serialised document. Uses orjson when it
+is installed and falls back to the stdlib json module otherwise.
+
+Only the serialisation is streamed: every engine still builds and sorts the
+full list of product dicts before the first one is written. The report order
+(product name, then brand) needs every product's metadata, and the history
+scan runs in nc_code index order. Peak memory is therefore the product list
+plus one product's bytes, not the list plus the whole encoded document.
+
+Files per time period (all written to .tmp and os.replace()d on success):
+- warehouse_inventory_{tp}.json     {"products": [...], "meta": {...}}
+- warehouse_inventory_{tp}.ndjson   one product per line (optional)
+- {tp}_metadata.json                meta only
+
+meta is written after the products because its totals are accumulated while
+streaming; JSON consumers parse the whole object so key order does not matter.
+"""
+
+import os
+import json
+import logging
+from pathlib import Path
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+logger = logging.getLogger('warehouse_inventory_generator')
+
+SERIALIZER = 'orjson' if orjson is not None else 'json'
+
+
+def dumps(obj) -> bytes:
+    """Compact UTF-8 JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def write_json_atomic(path, obj, file_mode=None):
+    """Small documents (metadata, index): pretty-printed, temp file + rename"""
+    path = Path(path)
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(obj, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+    if file_mode is not None:
+        os.chmod(path, file_mode)
+    return path
+
+
+def write_compact_json_atomic(path, obj, file_mode=None):
+    """Larger machine-read documents (sidecars): compact bytes, temp file + rename"""
+    path = Path(path)
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(dumps(obj))
+    os.replace(tmp, path)
+    if file_mode is not None:
+        os.chmod(path, file_mode)
+    return path
+
+
+class ReportMetaAccumulator:
+    """Running totals for the report meta block, updated one product at a time"""
+
+    def __init__(self):
+        self.total_products = 0
+        self.products_with_inventory = 0
+        self.products_with_images = 0
+        self.total_inventory = 0
+        self.listing_type_counts = {}
+
+    def add(self, product):
+        current = product['current_inventory'] or 0
+        self.total_products += 1
+        if current > 0:
+            self.products_with_inventory += 1
+        if product['has_image']:
+            self.products_with_images += 1
+        self.total_inventory += current
+        d = self.listing_type_counts.setdefault(product['listing_type'] or 'Unknown', {'count': 0, 'inventory': 0})
+        d['count'] += 1
+        d['inventory'] += current
+
+    def fields(self):
+        return {
+            'total_products': self.total_products,
+            'products_with_inventory': self.products_with_inventory,
+            'products_with_images': self.products_with_images,
+            'total_inventory': self.total_inventory,
+            'listing_type_counts': self.listing_type_counts,
+        }
+
+
+class StreamingReportWriter:
+    """
+    Usage:
+        with StreamingReportWriter(output_dir, 'last_30_days', ndjson=True) as w:
+            for product in products:
+                w.write_product(product)
+            w.set_meta(meta)
+    Nothing replaces the live files unless the block exits cleanly.
+    """
+
+    def __init__(self, output_dir, time_period, json_output=True, ndjson=False, file_mode=None):
+        self.output_dir = Path(output_dir)
+        self.time_period = time_period
+        self.file_mode = file_mode
+        self.meta = None
+        self.count = 0
+        self._targets = []  # (tmp, final, fh, kind)
+        if json_output:
+            self._targets.append(self._target(f"warehouse_inventory_{time_period}.json", 'json'))
+        if ndjson:
+            self._targets.append(self._target(f"warehouse_inventory_{time_period}.ndjson", 'ndjson'))
+        self.meta_path = self.output_dir / f"{time_period}_metadata.json"
+
+    def _target(self, name, kind):
+        final = self.output_dir / name
+        return [final.with_name(name + '.tmp'), final, None, kind]
+
+    def __enter__(self):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            for t in self._targets:
+                t[2] = open(t[0], 'wb')
+                if t[3] == 'json':
+                    t[2].write(b'{"products":[')
+        except BaseException:
+            self._abort()
+            raise
+        return self
+
+    def write_product(self, product):
+        data = dumps(product)
+        for _, _, fh, kind in self._targets:
+            if kind == 'json':
+                fh.write(b'\n' if self.count == 0 else b',\n')
+                fh.write(data)
+            else:
+                fh.write(data)
+                fh.write(b'\n')
+        self.count += 1
+
+    def set_meta(self, meta):
+        self.meta = meta
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None or self.meta is None:
+            self._abort()
+            if exc_type is None:
+                raise RuntimeError(f"Report {self.time_period} closed without meta; files not replaced")
+            return False
+        try:
+            for t in self._targets:
+                if t[3] == 'json':
+                    t[2].write(b'\n],\n"meta":' + dumps(self.meta) + b'}\n')
+                t[2].close()
+            for tmp, final, _, _ in self._targets:
+                os.replace(tmp, final)
+                if self.file_mode is not None:
+                    os.chmod(final, self.file_mode)
+                logger.info(f"Wrote {final} ({self.count} products, {SERIALIZER})")
+            write_json_atomic(self.meta_path, self.meta, self.file_mode)
+            logger.info(f"Wrote {self.meta_path}")
+        except BaseException:
+            self._abort()
+            raise
+        return False
+
+    def _abort(self):
+        for tmp, _, fh, _ in self._targets:
+            if fh is not None and not fh.closed:
+                fh.close()
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
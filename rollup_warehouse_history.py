@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Weekly and monthly rollups of warehouse_inventory_history_v2 (opt-in)
+
+A long report window (last_180_days, a year) mostly reads days that carry no
+information for its peak/low. This maintains per-product buckets:
+
+- warehouse_inventory_rollup    one row per (grain, bucket_start, nc_code);
+                                grain 'week' (Monday start) or 'month'
+    row_count, first/last date and value,
+    max and min with the date of their last occurrence,
+    post_max_min: the min at/after max_date, again its last occurrence
+- warehouse_rollup_state        rolled_through per grain (end of the last
+                                complete bucket written)
+
+Only complete buckets are stored, and only up to the day before the latest
+check_date (that day may still be being scraped). Refresh is incremental:
+each run reads daily rows for the buckets after rolled_through, through the
+archive union when history has been archived.
+
+The generator uses the rollups (see plan_window and rollup_points_sql) by
+replacing the complete buckets inside a window with their max, post-max min,
+min and last points. It reads full daily rows at the edges. Fed in date order
+to the report fold, these points reach the same peak, low and dates as the
+daily rows they replace, so reports stay exact.
+Rows inserted or changed in already rolled days are not picked up; run
+--rebuild after such a backfill.
+"""
+
+import os
+import sys
+import sqlite3
+import logging
+import argparse
+from datetime import datetime, timedelta
+
+from database_safety import get_database_manager
+
+try:
+    from archive_history import open_history_connection
+except ImportError:  # archive support not deployed
+    open_history_connection = None
+
+DEV_MODE = os.getenv('DEV_MODE', 'false').lower() == 'true'
+DB_PATH = './BourbonDatabase/inventory.db' if DEV_MODE else '/opt/BourbonDatabase/inventory.db'
+
+HISTORY_TABLE = 'warehouse_inventory_history_v2'
+ROLLUP_TABLE = 'warehouse_inventory_rollup'
+ROLLUP_STATE_TABLE = 'warehouse_rollup_state'
+GRAINS = ('month', 'week')  # coarsest first
+
+logger = logging.getLogger('rollup_warehouse_history')
+
+SCHEMA_SQL = f"""
+CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+  grain TEXT NOT NULL,
+  bucket_start DATE NOT NULL,
+  nc_code {{code_type}} NOT NULL,
+  bucket_end DATE NOT NULL,
+  row_count INTEGER NOT NULL,
+  first_date DATE NOT NULL,
+  first_value INTEGER NOT NULL,
+  last_date DATE NOT NULL,
+  last_value INTEGER NOT NULL,
+  max_value INTEGER NOT NULL,
+  max_date DATE NOT NULL,
+  min_value INTEGER NOT NULL,
+  min_date DATE NOT NULL,
+  post_max_min_value INTEGER NOT NULL,
+  post_max_min_date DATE NOT NULL,
+  PRIMARY KEY (grain, bucket_start, nc_code)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS {ROLLUP_STATE_TABLE} (
+  grain TEXT PRIMARY KEY,
+  rolled_through DATE
+);
+"""
+
+
+def _code_type(conn, table):
+    """Declared type of a table's nc_code column (upper case), None if the table does not exist"""
+    for row in conn.execute(f"PRAGMA table_info({table})"):
+        if row[1] == 'nc_code':
+            return (row[2] or '').upper()
+    return None
+
+
+def ensure_schema(conn):
+    """
+    Create the rollup tables. nc_code takes the history column's declared type
+    (TEXT in the backend migration) so rollup points and daily rows unioned
+    by the generator carry the same keys; rollups stored with another type are
+    dropped and rebuilt by the refresh that follows.
+    """
+    code_type = _code_type(conn, HISTORY_TABLE) or 'TEXT'
+    stored = _code_type(conn, ROLLUP_TABLE)
+    if stored is not None and stored != code_type:
+        logger.warning(f"{ROLLUP_TABLE}.nc_code is {stored} but {HISTORY_TABLE}.nc_code is {code_type}; "
+                       f"dropping the rollups to rebuild them")
+        conn.executescript(f"BEGIN IMMEDIATE; DROP TABLE {ROLLUP_TABLE}; DELETE FROM {ROLLUP_STATE_TABLE}; COMMIT;")
+    conn.executescript(SCHEMA_SQL.format(code_type=code_type))
+
+
+def get_rolled_through(conn):
+    """{grain: rolled_through}; empty when no rollups exist or their nc_code type no longer matches history's"""
+    try:
+        rolled = {g: d for g, d in conn.execute(f"SELECT grain, rolled_through FROM {ROLLUP_STATE_TABLE}") if d}
+    except sqlite3.OperationalError:
+        return {}
+    if rolled and _code_type(conn, ROLLUP_TABLE) != (_code_type(conn, HISTORY_TABLE) or 'TEXT'):
+        logger.warning(f"Ignoring {ROLLUP_TABLE}: its nc_code type differs from {HISTORY_TABLE}'s "
+                       f"(run rollup_warehouse_history.py to rebuild it)")
+        return {}
+    return rolled
+
+
+# ------------------ Buckets ------------------
+def _day(s):
+    return datetime.strptime(str(s)[:10], '%Y-%m-%d').date()
+
+
+def bucket_bounds(grain, day):
+    """(start, end) dates of the bucket containing `day`"""
+    if grain == 'week':
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=6)
+    start = day.replace(day=1)
+    nxt = (start.replace(year=start.year + 1, month=1) if start.month == 12
+           else start.replace(month=start.month + 1))
+    return start, nxt - timedelta(days=1)
+
+
+def _complete_run(grain, lo, hi):
+    """(first_start, last_end) of the complete buckets inside [lo, hi], or None"""
+    start, _ = bucket_bounds(grain, lo)
+    if start < lo:
+        start = bucket_bounds(grain, start)[1] + timedelta(days=1)
+    end = None
+    b_start = start
+    while True:
+        _, b_end = bucket_bounds(grain, b_start)
+        if b_end > hi:
+            break
+        end = b_end
+        b_start = b_end + timedelta(days=1)
+    return (start, end) if end is not None else None
+
+
+def plan_window(start_date, end_date, rolled_through, grains=GRAINS):
+    """
+    Cover [start_date, end_date] with segments [(grain, from, to)] in date
+    order: complete months in the middle, complete weeks around them, single
+    days at the edges. grain 'day' means read the daily rows.
+    """
+    def cover(lo, hi, levels):
+        if lo > hi:
+            return []
+        if not levels:
+            return [('day', lo, hi)]
+        grain, rest = levels[0], levels[1:]
+        limit = rolled_through.get(grain)
+        run = _complete_run(grain, lo, min(hi, _day(limit))) if limit else None
+        if run is None:
+            return cover(lo, hi, rest)
+        a, b = run
+        return cover(lo, a - timedelta(days=1), rest) + [(grain, a, b)] + cover(b + timedelta(days=1), hi, rest)
+
+    return [(g, a.isoformat(), b.isoformat())
+            for g, a, b in cover(_day(start_date), _day(end_date), list(grains))]
+
+
+def rollup_points_sql(grain, bucket_from, bucket_to):
+    """
+    (sql, params) yielding (nc_code, check_date, total_available) points that
+    stand in for the daily rows of the buckets starting in [bucket_from, bucket_to]:
+    max, post-max min, min (only if before the max) and last, without repeats.
+    """
+    where = f"FROM {ROLLUP_TABLE} WHERE grain = ? AND bucket_start >= ? AND bucket_start <= ?"
+    parts = [
+        f"SELECT nc_code, max_date AS check_date, max_value AS total_available {where}",
+        f"SELECT nc_code, post_max_min_date, post_max_min_value {where} AND post_max_min_date > max_date",
+        f"SELECT nc_code, min_date, min_value {where} AND min_date < max_date",
+        f"SELECT nc_code, last_date, last_value {where} "
+        f"AND last_date > max_date AND last_date > post_max_min_date",
+    ]
+    return "\nUNION ALL\n".join(parts), [grain, bucket_from, bucket_to] * len(parts)
+
+
+def summarize(rows):
+    """rows: [(check_date, value)] in date order for one product/bucket -> rollup column values"""
+    first_date, first_value = rows[0]
+    mx, mx_date = first_value, first_date
+    mn, mn_date = first_value, first_date
+    pmm, pmm_date = first_value, first_date
+    for d, v in rows[1:]:
+        if v >= mx:
+            mx, mx_date = v, d
+            pmm, pmm_date = v, d
+        elif v <= pmm:
+            pmm, pmm_date = v, d
+        if v <= mn:
+            mn, mn_date = v, d
+    last_date, last_value = rows[-1]
+    return (len(rows), first_date, first_value, last_date, last_value,
+            mx, mx_date, mn, mn_date, pmm, pmm_date)
+
+
+def compute_buckets(conn, table, grain, first_start, last_end):
+    """Rollup rows for every bucket in [first_start, last_end], read in (nc_code, check_date) order"""
+    out = []
+    bounds = {}
+    cur_key, cur_rows = None, []
+
+    def flush():
+        if cur_rows:
+            code, b_start, b_end = cur_key
+            out.append((grain, b_start, code, b_end) + summarize(cur_rows))
+
+    for code, check_date, total in conn.execute(
+            f"SELECT nc_code, check_date, total_available FROM {table} "
+            f"WHERE check_date >= ? AND check_date <= ? ORDER BY nc_code, check_date",
+            [first_start, last_end]):
+        day = str(check_date)[:10]
+        b = bounds.get(day)
+        if b is None:
+            s, e = bucket_bounds(grain, _day(day))
+            b = bounds[day] = (s.isoformat(), e.isoformat())
+        key = (code, b[0], b[1])
+        if key != cur_key:
+            flush()
+            cur_key, cur_rows = key, []
+        cur_rows.append((check_date, total or 0))
+    flush()
+    return out
+
+
+def _open_reader(db_path, start, end):
+    if open_history_connection is not None:
+        return open_history_connection(db_path, HISTORY_TABLE, start, end)
+    return sqlite3.connect(db_path, timeout=30), HISTORY_TABLE
+
+
+# ------------------ Refresh ------------------
+def refresh(db_path=DB_PATH, through=None, rebuild=False, grains=GRAINS):
+    manager = get_database_manager(db_path)
+    with manager.get_connection() as conn:
+        ensure_schema(conn)
+        rolled = {} if rebuild else get_rolled_through(conn)
+        latest = conn.execute(f"SELECT MAX(check_date) FROM {HISTORY_TABLE}").fetchone()[0]
+    if latest is None:
+        logger.info(f"{HISTORY_TABLE} is empty; nothing to roll up.")
+        return {}
+    if through is None:
+        # The latest check_date may still be being scraped/upserted; leave it out
+        through = (_day(latest) - timedelta(days=1)).isoformat()
+
+    result = {}
+    for grain in grains:
+        if rolled.get(grain):
+            lo = _day(rolled[grain]) + timedelta(days=1)
+        else:
+            with manager.get_connection() as conn:
+                earliest = conn.execute(f"SELECT MIN(check_date) FROM {HISTORY_TABLE}").fetchone()[0]
+            lo = bucket_bounds(grain, _day(earliest))[0]  # first bucket may start before the earliest row
+            if open_history_connection is not None:
+                with manager.get_connection() as conn:
+                    try:
+                        arch = conn.execute("SELECT MIN(from_date) FROM history_archives WHERE table_name = ?",
+                                            [HISTORY_TABLE]).fetchone()[0]
+                    except sqlite3.OperationalError:
+                        arch = None
+                if arch:
+                    lo = min(lo, bucket_bounds(grain, _day(arch))[0])
+        run = _complete_run(grain, lo, _day(through))
+        if run is None:
+            logger.info(f"{grain}: no complete buckets after {rolled.get(grain)}")
+            result[grain] = {'buckets': 0, 'rolled_through': rolled.get(grain)}
+            continue
+        first_start, last_end = run[0].isoformat(), run[1].isoformat()
+        reader, table = _open_reader(db_path, first_start, last_end)
+        try:
+            rows = compute_buckets(reader, table, grain, first_start, last_end)
+        finally:
+            reader.close()
+
+        def write(conn, rows=rows, grain=grain, first_start=first_start, last_end=last_end):
+            if not rebuild and get_rolled_through(conn).get(grain) != rolled.get(grain):
+                raise RuntimeError(f"Another rollup refresh advanced {grain} concurrently")
+            if rebuild:
+                conn.execute(f"DELETE FROM {ROLLUP_TABLE} WHERE grain = ?", [grain])
+            conn.executemany(f"INSERT OR REPLACE INTO {ROLLUP_TABLE} VALUES ({', '.join(['?'] * 15)})", rows)
+            conn.execute(f"INSERT OR REPLACE INTO {ROLLUP_STATE_TABLE} (grain, rolled_through) VALUES (?, ?)",
+                         [grain, last_end])
+        manager.execute_write(write)
+        logger.info(f"{grain}: wrote {len(rows)} bucket rows for {first_start}..{last_end}")
+        result[grain] = {'buckets': len(rows), 'rolled_through': last_end}
+    return result
+
+
+def verify(db_path=DB_PATH, grains=GRAINS):
+    """Recompute every stored bucket from daily rows and compare"""
+    manager = get_database_manager(db_path, read_only=True)
+    with manager.get_connection() as conn:
+        stored_type, code_type = _code_type(conn, ROLLUP_TABLE), _code_type(conn, HISTORY_TABLE) or 'TEXT'
+        if stored_type is not None and stored_type != code_type:
+            logger.error(f"{ROLLUP_TABLE}.nc_code is {stored_type}, {HISTORY_TABLE}.nc_code is {code_type}; "
+                         f"refresh to rebuild")
+            return {'mismatches': None, 'ok': False, 'rolled_through': {}}
+        rolled = get_rolled_through(conn)
+    mismatches = 0
+    for grain in grains:
+        if not rolled.get(grain):
+            continue
+        with manager.get_connection() as conn:
+            first = conn.execute(f"SELECT MIN(bucket_start) FROM {ROLLUP_TABLE} WHERE grain = ?", [grain]).fetchone()[0]
+            stored = {(r[1], r[2]): tuple(r) for r in conn.execute(
+                f"SELECT * FROM {ROLLUP_TABLE} WHERE grain = ?", [grain])}
+        reader, table = _open_reader(db_path, first, rolled[grain])
+        try:
+            fresh = {(r[1], r[2]): r for r in compute_buckets(reader, table, grain, first, rolled[grain])}
+        finally:
+            reader.close()
+        bad = [k for k in stored.keys() | fresh.keys() if stored.get(k) != fresh.get(k)]
+        if bad:
+            logger.error(f"{grain}: {len(bad)} buckets differ from daily rows, e.g. {sorted(bad, key=str)[:3]}")
+        mismatches += len(bad)
+    return {'mismatches': mismatches, 'ok': mismatches == 0, 'rolled_through': rolled}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Maintain weekly/monthly rollups of warehouse_inventory_history_v2")
+    parser.add_argument("--db", default=DB_PATH, help=f"Inventory database (default: {DB_PATH})")
+    parser.add_argument("--through", help="Roll up complete buckets ending on or before this date "
+                                          "(default: the day before the latest check_date)")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute every bucket from daily rows")
+    parser.add_argument("--verify", action="store_true", help="Compare stored buckets with daily rows")
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s',
+                        stream=sys.stdout)
+    args = parse_args()
+    if args.verify:
+        result = verify(args.db)
+        logger.info(f"Verify: {result}")
+        sys.exit(0 if result['ok'] else 1)
+    result = refresh(args.db, args.through, args.rebuild)
+    logger.info(f"Done: {result}")
+
+
+if __name__ == '__main__':
+    main()
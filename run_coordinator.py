@@ -0,0 +1,232 @@
+"""
+Single-flight coordination for generator runs
+
+Cron and the admin trigger both start warehouse_inventory_generator.py; every
+start goes through RunCoordinator.run():
+
+1. The requested windows are merged into the pending request
+   (generation_queue.json), under a short queue lock.
+2. The caller tries the exclusive run lock (generation.lock, flock). If another
+   run holds it, the caller returns at once: its windows wait in the queue.
+3. The lock holder takes the whole pending set, generates it, and repeats
+   until the queue is empty. Triggers that arrive during a run therefore
+   become at most one follow-up run covering the union of their windows.
+   Report tier requests (report_tiers.py) merge the same way: the union of
+   their tiers, or a full run as soon as any request asked for one.
+   The run lock is released while the queue lock is held, so a request can't
+   land between the last check and the release and be left waiting.
+
+Stale locks: flock is released by the kernel when its holder dies. A status
+file still saying 'running' when the lock is taken means the previous run
+died; it is recorded as abandoned_run and its windows are queued again. A
+holder whose heartbeat is older than RUN_STALE_SECONDS is reported as stale
+but never killed.
+
+generation_status.json (output dir) is what the backend polls:
+  state idle|running, pid, started_at, heartbeat_at, current run progress,
+  pending request, last_run summary.
+"""
+
+import os
+import json
+import time
+import fcntl
+import socket
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from report_writer import write_json_atomic
+
+logger = logging.getLogger('warehouse_inventory_generator')
+
+STATUS_FILE = 'generation_status.json'
+QUEUE_FILE = 'generation_queue.json'
+RUN_LOCK_FILE = 'generation.lock'
+QUEUE_LOCK_FILE = 'generation_queue.lock'
+RUN_STALE_SECONDS = int(os.getenv('RUN_STALE_SECONDS', '7200'))
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _read_json(path, default):
+    try:
+        return json.loads(Path(path).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return default
+
+
+class RunCoordinator:
+    def __init__(self, state_dir, all_periods, file_mode=None):
+        self.state_dir = Path(state_dir)
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self.all_periods = list(all_periods)
+        self.file_mode = file_mode
+        self.status_path = self.state_dir / STATUS_FILE
+        self.queue_path = self.state_dir / QUEUE_FILE
+        self._run_fd = None
+        self._queue_locked = False
+
+    # ---------- locks ----------
+    @contextmanager
+    def _queue_lock(self):
+        """Guards the queue and every status read-modify-write; re-entrant within this object"""
+        if self._queue_locked:
+            yield
+            return
+        fd = os.open(self.state_dir / QUEUE_LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            self._queue_locked = True
+            yield
+        finally:
+            self._queue_locked = False
+            os.close(fd)  # closing releases the flock
+
+    def _try_run_lock(self):
+        fd = os.open(self.state_dir / RUN_LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}@{socket.gethostname()} {_now()}\n".encode())
+        self._run_fd = fd
+        return True
+
+    def _release_run_lock(self):
+        if self._run_fd is not None:
+            os.close(self._run_fd)
+            self._run_fd = None
+
+    # ---------- status ----------
+    def read_status(self):
+        return _read_json(self.status_path, {'state': 'idle'})
+
+    def _write_status(self, status):
+        status['updated_at'] = _now()
+        write_json_atomic(self.status_path, status, self.file_mode)
+
+    def _update_status(self, **fields):
+        with self._queue_lock():
+            status = self.read_status()
+            status.update(fields)
+            self._write_status(status)
+        return status
+
+    def _finish(self):
+        """Mark idle, then release the run lock (so a new holder's 'running' is never overwritten)"""
+        with self._queue_lock():
+            self._update_status(state='idle', pid=None, current=None, stale=False)
+            self._release_run_lock()
+
+    # ---------- queue ----------
+    def enqueue(self, periods, requested_by, tiers=None):
+        """Merge a request into the pending set (empty periods = every window, no tiers = full run)"""
+        periods = list(periods) or self.all_periods
+        with self._queue_lock():
+            queue = _read_json(self.queue_path, {})
+            full_pending = bool(queue.get('periods')) and 'tiers' not in queue
+            if tiers and not full_pending:
+                queue['tiers'] = sorted(set(queue.get('tiers', [])) | set(tiers))
+            else:
+                queue.pop('tiers', None)
+            merged = set(queue.get('periods', [])) | set(periods)
+            queue['periods'] = [p for p in self.all_periods if p in merged]
+            queue.setdefault('first_requested_at', _now())
+            request = {'periods': periods, 'requested_by': requested_by, 'requested_at': _now()}
+            if tiers:
+                request['tiers'] = list(tiers)
+            queue['requests'] = queue.get('requests', []) + [request]
+            write_json_atomic(self.queue_path, queue, self.file_mode)
+            self._update_status(pending=queue)
+        return queue
+
+    def _take_queue(self):
+        """Pending request, cleared; on an empty queue also releases the run lock (under the queue lock)"""
+        with self._queue_lock():
+            queue = _read_json(self.queue_path, {})
+            if not queue.get('periods'):
+                self._finish()
+                return None
+            write_json_atomic(self.queue_path, {}, self.file_mode)
+            self._update_status(pending=None)
+            return queue
+
+    def _check_stale_holder(self):
+        status = self.read_status()
+        beat = status.get('heartbeat_at')
+        if status.get('state') == 'running' and beat:
+            age = (datetime.now() - datetime.strptime(beat, '%Y-%m-%d %H:%M:%S')).total_seconds()
+            if age > RUN_STALE_SECONDS:
+                logger.error(f"Run lock held by pid {status.get('pid')} with no heartbeat for {int(age)}s; "
+                             f"it may be hung")
+                self._update_status(stale=True)
+
+    # ---------- driver ----------
+    def run(self, periods, requested_by, runner, tiers=None):
+        """
+        runner(periods, on_period) -> bool does one generation; on_period(tp, state)
+        reports progress. A run limited to report tiers calls runner(periods,
+        on_period, tiers). Returns (ran, ok): ran=False when another run will
+        pick the request up.
+        """
+        self.enqueue(periods, requested_by, tiers)
+        if not self._try_run_lock():
+            self._check_stale_holder()
+            logger.info("Another generator run is in progress; request queued for its follow-up run.")
+            return False, True
+
+        previous = self.read_status()
+        if previous.get('state') == 'running':
+            unfinished = previous.get('current') or {}
+            logger.warning(f"Previous run (pid {previous.get('pid')}, started {previous.get('started_at')}) "
+                           f"ended without finishing; re-queuing its windows.")
+            self._update_status(abandoned_run=dict(unfinished, pid=previous.get('pid'), detected_at=_now()))
+            if unfinished.get('periods'):
+                self.enqueue(unfinished['periods'], f"retry of abandoned run (pid {previous.get('pid')})",
+                             unfinished.get('tiers'))
+        ok = True
+        try:
+            while True:
+                queue = self._take_queue()
+                if queue is None:
+                    break
+                ok = self._run_once(queue, runner) and ok
+        finally:
+            if self._run_fd is not None:  # runner raised; the queue may still hold later requests
+                self._finish()
+        return True, ok
+
+    def _run_once(self, queue, runner):
+        current = {'periods': queue['periods'], 'requests': queue.get('requests', []),
+                   'started_at': _now(), 'in_progress': None, 'completed': [], 'failed': []}
+        if 'tiers' in queue:
+            current['tiers'] = queue['tiers']
+        self._update_status(state='running', pid=os.getpid(), host=socket.gethostname(),
+                            started_at=current['started_at'], heartbeat_at=_now(), current=current, stale=False)
+
+        def on_period(tp, state):
+            if state == 'started':
+                current['in_progress'] = tp
+            else:
+                current['in_progress'] = None
+                current['completed' if state == 'done' else 'failed'].append(tp)
+            self._update_status(heartbeat_at=_now(), current=current)
+
+        t0 = time.monotonic()
+        ok = False
+        try:
+            if 'tiers' in queue:
+                ok = bool(runner(queue['periods'], on_period, queue['tiers']))
+            else:
+                ok = bool(runner(queue['periods'], on_period))
+        finally:
+            self._update_status(heartbeat_at=_now(), last_run=dict(
+                current, in_progress=None, success=ok, finished_at=_now(),
+                duration_seconds=round(time.monotonic() - t0, 2)))
+        return ok
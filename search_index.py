@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Prebuilt product search index for the warehouse reports
+
+Built from the report files after each generator run into a small SQLite file
+next to them (warehouse_search.db), so lookups no longer scan every row:
+
+- products       one row per product in any report window, with normalised
+                 name/brand/supplier columns (indexed for prefix lookups) and
+                 the windows it appears in
+- product_fts    FTS5 trigram index over the normalised text and codes,
+                 ranked with bm25 (name weighted over brand, supplier, codes)
+
+Normalisation (lowercase, accents and punctuation stripped) is shared by the
+builder and search(); backend/controllers/warehouseReportController.js applies
+the same rules for the /warehouse-inventory/search endpoint.
+"""
+
+import os
+import re
+import sys
+import json
+import sqlite3
+import logging
+import argparse
+import unicodedata
+from pathlib import Path
+
+logger = logging.getLogger('warehouse_inventory_generator')
+
+SEARCH_DB_NAME = 'warehouse_search.db'
+SCHEMA_VERSION = 1
+MIN_TRIGRAM = 3
+# bm25 column weights: name, brand, supplier, codes
+BM25_WEIGHTS = (10.0, 5.0, 1.0, 2.0)
+
+SCHEMA_SQL = """
+CREATE TABLE products (
+  id INTEGER PRIMARY KEY,
+  nc_code TEXT NOT NULL,
+  plu TEXT,
+  product_name TEXT,
+  brand_name TEXT,
+  supplier TEXT,
+  listing_type TEXT,
+  name_norm TEXT NOT NULL,
+  brand_norm TEXT NOT NULL,
+  periods TEXT NOT NULL
+);
+CREATE UNIQUE INDEX idx_products_nc_code ON products(nc_code);
+CREATE INDEX idx_products_plu ON products(plu);
+CREATE INDEX idx_products_name_norm ON products(name_norm);
+CREATE INDEX idx_products_brand_norm ON products(brand_norm);
+CREATE VIRTUAL TABLE product_fts USING fts5(name, brand, supplier, codes, tokenize='trigram');
+CREATE TABLE search_meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def normalize(text) -> str:
+    """lowercase, strip accents, punctuation -> space, collapse whitespace"""
+    if text is None:
+        return ''
+    s = unicodedata.normalize('NFKD', str(text))
+    s = ''.join(ch for ch in s if not unicodedata.combining(ch)).lower()
+    s = re.sub(r"[^a-z0-9]+", ' ', s)
+    return s.strip()
+
+
+def _load_report_products(output_dir, time_period):
+    path = Path(output_dir) / f"warehouse_inventory_{time_period}.json"
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding='utf-8')).get('products', [])
+
+
+def build_search_index(output_dir, time_periods, file_mode=None):
+    """Rebuild <output_dir>/warehouse_search.db from the report files on disk; returns its path"""
+    output_dir = Path(output_dir)
+    products = {}
+    periods_built = []
+    for tp in time_periods:
+        rows = _load_report_products(output_dir, tp)
+        if rows is None:
+            continue
+        periods_built.append(tp)
+        for p in rows:
+            code = str(p['nc_code'])
+            entry = products.get(code)
+            if entry is None:
+                entry = products[code] = dict(p, periods=[])
+            entry['periods'].append(tp)
+
+    final = output_dir / SEARCH_DB_NAME
+    tmp = output_dir / f"{SEARCH_DB_NAME}.tmp"
+    if tmp.exists():
+        tmp.unlink()
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.executescript("PRAGMA journal_mode = OFF; PRAGMA synchronous = OFF;" + SCHEMA_SQL)
+        for i, (code, p) in enumerate(sorted(products.items()), start=1):
+            plu = '' if p.get('plu') is None else str(p['plu'])
+            name_norm = normalize(p.get('product_name'))
+            brand_norm = normalize(p.get('brand_name'))
+            conn.execute(
+                "INSERT INTO products (id, nc_code, plu, product_name, brand_name, supplier, listing_type, "
+                "name_norm, brand_norm, periods) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [i, code, plu or None, p.get('product_name'), p.get('brand_name'), p.get('supplier'),
+                 p.get('listing_type'), name_norm, brand_norm, ','.join(p['periods'])])
+            conn.execute("INSERT INTO product_fts (rowid, name, brand, supplier, codes) VALUES (?, ?, ?, ?, ?)",
+                         [i, name_norm, brand_norm, normalize(p.get('supplier')), f"{code} {plu}".strip()])
+        conn.executemany("INSERT INTO search_meta (key, value) VALUES (?, ?)",
+                         [('schema_version', str(SCHEMA_VERSION)), ('periods', ','.join(periods_built)),
+                          ('products', str(len(products)))])
+        conn.execute("INSERT INTO product_fts (product_fts) VALUES ('optimize')")
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp, final)
+    if file_mode is not None:
+        os.chmod(final, file_mode)
+    logger.info(f"Wrote {final} ({len(products)} products, periods: {', '.join(periods_built)})")
+    return final
+
+
+def _fts_phrase(word):
+    return '"' + word.replace('"', '""') + '"'
+
+
+def search(db_path, term, limit=20, time_period=None):
+    """
+    Ranked lookup. Exact nc_code/PLU hits first, then name/brand prefix hits,
+    then FTS5 trigram matches by bm25. Words shorter than 3 characters are
+    matched as name/brand prefixes.
+    """
+    norm = normalize(term)
+    if not norm:
+        return []
+    words = norm.split()
+    conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        params = {'t': norm, 'prefix': f"{norm}%", 'limit': int(limit)}
+        long_words = [w for w in words if len(w) >= MIN_TRIGRAM]
+        sql = ("SELECT p.nc_code, p.plu, p.product_name, p.brand_name, p.supplier, p.listing_type, p.periods, "
+               "(p.nc_code = :t OR p.plu = :t) AS exact, "
+               "(p.name_norm LIKE :prefix OR p.brand_norm LIKE :prefix) AS prefix, ")
+        if long_words:
+            sql += (f"bm25(product_fts, {', '.join(map(str, BM25_WEIGHTS))}) AS score "
+                    f"FROM product_fts JOIN products p ON p.id = product_fts.rowid "
+                    f"WHERE product_fts MATCH :match")
+            params['match'] = ' AND '.join(_fts_phrase(w) for w in long_words)
+        else:
+            sql += "0.0 AS score FROM products p WHERE 1"
+        # Too short for a trigram: word-start match on name or brand
+        for i, w in enumerate(w for w in words if len(w) < MIN_TRIGRAM):
+            sql += (f" AND (p.name_norm LIKE :s{i} OR p.brand_norm LIKE :s{i} "
+                    f"OR p.name_norm LIKE :w{i} OR p.brand_norm LIKE :w{i})")
+            params[f"s{i}"], params[f"w{i}"] = f"{w}%", f"% {w}%"
+        if time_period:
+            sql += " AND (',' || p.periods || ',') LIKE :period"
+            params['period'] = f"%,{time_period},%"
+        sql += " ORDER BY exact DESC, prefix DESC, score, p.product_name LIMIT :limit"
+        return [dict(r) for r in conn.execute(sql, params)]
+    finally:
+        conn.close()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stdout)
+    dev_mode = os.getenv('DEV_MODE', 'false').lower() == 'true'
+    default_dir = './warehouse-reports' if dev_mode else '/opt/warehouse-reports'
+    parser = argparse.ArgumentParser(description="Query (or rebuild) the warehouse report search index")
+    parser.add_argument("term", nargs="?", help="Search text, nc_code or PLU")
+    parser.add_argument("--dir", default=default_dir, help=f"Reports directory (default: {default_dir})")
+    parser.add_argument("--period", help="Only products present in this report window")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the index from the report files")
+    args = parser.parse_args()
+    if args.rebuild:
+        build_search_index(args.dir, ('current_month', 'last_30_days', 'last_90_days', 'last_180_days'))
+    if args.term:
+        for r in search(Path(args.dir) / SEARCH_DB_NAME, args.term, args.limit, args.period):
+            print(f"{r['nc_code']:>8} {r['plu'] or '':>8}  {r['product_name']}  [{r['brand_name']}]  ({r['periods']})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Shipment sell-through artifact
+
+Built after each generator run so shipment views and the delivery analysis read
+one file instead of joining shipments_history to boards/alcohol/bourbons per
+request. warehouse_shipments.json (output dir), keyed for direct lookups:
+
+  meta          generated_at, months covered (newest first), board names
+  board_totals  {month: {board_id: {units, products}}}
+  products      {nc_code: {plu, product_name, brand_name, listing_type, retail_price,
+                           bottles_per_case, months: {month: {...}}}}
+
+Per product and month:
+- boards        {board_id: units}. A board's monthly figure is its latest correction: the
+                row with the highest shipment_id in that month, the same rule the delivery
+                analysis used for board 155.
+- shipped       sum over boards
+- warehouse     from warehouse_inventory_history_v2 over the same month:
+                opening (last value before the month, else its first value),
+                received (sum of day-over-day increases), closing, and
+                depleted = opening + received - closing
+- sell_through  shipped / (opening + received), null when nothing was available
+
+Warehouse history is read only for shipped products, in one ordered pass over
+the (nc_code, check_date) index.
+"""
+
+import os
+import sys
+import logging
+import argparse
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from product_dim import PRODUCT_DIM_TABLE, alcohol_select_parts
+from report_writer import write_compact_json_atomic
+
+logger = logging.getLogger('warehouse_inventory_generator')
+
+SHIPMENTS_FILE = 'warehouse_shipments.json'
+SHIPMENT_MONTHS = int(os.getenv('SHIPMENT_MONTHS', '6'))
+OPENING_LOOKBACK_DAYS = 14  # how far before a month to look for its opening value
+
+
+def month_starts(today, n):
+    """First day of this month and the n-1 before it, newest first"""
+    out = []
+    d = today.replace(day=1)
+    for _ in range(max(n, 1)):
+        out.append(d)
+        d = (d - timedelta(days=1)).replace(day=1)
+    return out
+
+
+def latest_monthly_shipments(conn, since):
+    """{(nc_code, board_id, 'YYYY-MM'): units}, one row per month: the highest shipment_id wins"""
+    rows = conn.execute("""
+SELECT nc_code, board_id, month, num_units FROM (
+  SELECT CAST(nc_code AS TEXT) AS nc_code, board_id, substr(ship_date, 1, 7) AS month, num_units,
+         ROW_NUMBER() OVER (PARTITION BY nc_code, board_id, substr(ship_date, 1, 7)
+                            ORDER BY shipment_id DESC) AS rn
+  FROM shipments_history
+  WHERE ship_date >= ?
+) WHERE rn = 1""", [since])
+    return {(str(code).strip(), board_id, month): units or 0 for code, board_id, month, units in rows}
+
+
+def warehouse_month_flows(conn, table, codes, since, months, chunk_size=500):
+    """{nc_code: {month: {opening, received, closing, depleted}}} for the given products"""
+    months = set(months)
+    out = {}
+    codes = sorted(codes)
+    for i in range(0, len(codes), chunk_size):
+        chunk = [int(c) if c.isdigit() else c for c in codes[i:i + chunk_size]]
+        rows = conn.execute(
+            f"SELECT nc_code, check_date, total_available FROM {table} "
+            f"WHERE nc_code IN ({','.join(['?'] * len(chunk))}) AND check_date >= ? "
+            f"ORDER BY nc_code, check_date", chunk + [since])
+        code = previous = None
+        for nc_code, check_date, total in rows:
+            v = total or 0
+            if nc_code != code:
+                code, previous = nc_code, None
+            month = check_date[:7]
+            if month in months:
+                flows = out.setdefault(str(code), {})
+                m = flows.get(month)
+                if m is None:
+                    m = flows[month] = {'opening': v if previous is None else previous,
+                                        'received': 0, 'closing': v}
+                if previous is not None and v > previous:
+                    m['received'] += v - previous
+                m['closing'] = v
+            previous = v
+    for flows in out.values():
+        for m in flows.values():
+            m['depleted'] = m['opening'] + m['received'] - m['closing']
+    return out
+
+
+def _extra_product_columns(gen, codes, chunk_size=500):
+    """bottles_per_case and the bourbons display name, from product_dim or alcohol/bourbons"""
+    table, key, cond = gen._product_source()
+    if table == PRODUCT_DIM_TABLE:
+        select = ("a.bottles_per_case AS bottles_per_case, "
+                  "CASE WHEN a.bourbon_id IS NOT NULL THEN a.display_name END AS display_name")
+        source = f"{table} a"
+    else:
+        has_bourbons = bool(gen._get_table_columns('bourbons'))
+        bpc = alcohol_select_parts(gen._get_table_columns('alcohol'), fields=('bottles_per_case',))[0]
+        select = f"{bpc}, {'b.name' if has_bourbons else 'NULL'} AS display_name"
+        source = "alcohol a LEFT JOIN bourbons b ON b.plu = a.nc_code" if has_bourbons else "alcohol a"
+    out = {}
+    for i in range(0, len(codes), chunk_size):
+        chunk = codes[i:i + chunk_size]
+        for r in gen.execute_query(
+                f"SELECT a.{key} AS nc_code, {select} FROM {source} "
+                f"WHERE a.{key} IN ({','.join(['?'] * len(chunk))}) AND {cond}", chunk):
+            out.setdefault(str(r['nc_code']), r)
+    return out
+
+
+def build_shipments_report(gen, file_mode=None, months=SHIPMENT_MONTHS, today=None):
+    """Write <output_dir>/warehouse_shipments.json; returns its path"""
+    starts = month_starts(today or datetime.now(), months)
+    month_keys = [d.strftime('%Y-%m') for d in starts]
+    since = starts[-1].strftime('%Y-%m-%d')
+    history_since = (starts[-1] - timedelta(days=OPENING_LOOKBACK_DAYS)).strftime('%Y-%m-%d')
+
+    conn = gen._connect()
+    try:
+        shipments = latest_monthly_shipments(conn, since)
+        boards = {str(b): name for b, name in conn.execute("SELECT board_id, board_name FROM boards")}
+    finally:
+        conn.close()
+    codes = sorted({code for code, _, _ in shipments})
+
+    gen._use_archives_for(history_since, (today or datetime.now()).strftime('%Y-%m-%d'))
+    try:
+        conn = gen._connect()
+        try:
+            flows = warehouse_month_flows(conn, gen.history_table, codes, history_since, month_keys)
+        finally:
+            conn.close()
+    finally:
+        gen._reset_history_source()
+
+    metadata = gen._get_product_metadata(codes)
+    extra = _extra_product_columns(gen, codes)
+    products = {}
+    board_totals = {m: {} for m in month_keys}
+    for (code, board_id, month), units in sorted(shipments.items()):
+        if month not in board_totals:
+            continue  # future-dated shipments fall outside the covered months
+        p = products.get(code)
+        if p is None:
+            r = metadata.get(code) or {}
+            x = extra.get(code) or {}
+            p = products[code] = {
+                'nc_code': code,
+                'plu': r.get('plu'),
+                'product_name': x.get('display_name') or r.get('product_name') or r.get('brand_name'),
+                'brand_name': r.get('brand_name'),
+                'listing_type': r.get('listing_type') or 'Unknown',
+                'retail_price': r.get('retail_price'),
+                'bottles_per_case': x.get('bottles_per_case'),
+                'months': {},
+            }
+        m = p['months'].setdefault(month, {'shipped': 0, 'boards': {}})
+        m['boards'][str(board_id)] = units
+        m['shipped'] += units
+        t = board_totals[month].setdefault(str(board_id), {'units': 0, 'products': 0})
+        t['units'] += units
+        t['products'] += 1
+
+    for code, p in products.items():
+        for month, m in p['months'].items():
+            w = flows.get(code, {}).get(month)
+            m['warehouse'] = w
+            available = (w['opening'] + w['received']) if w else 0
+            m['sell_through'] = round(m['shipped'] / available, 4) if available > 0 else None
+
+    path = write_compact_json_atomic(Path(gen.output_dir) / SHIPMENTS_FILE, {
+        'meta': {'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'months': month_keys,
+                 'boards': boards, 'products': len(products)},
+        'board_totals': board_totals,
+        'products': products,
+    }, file_mode)
+    logger.info(f"Wrote {path} ({len(products)} products, {len(shipments)} product/board/months, "
+                f"{month_keys[-1]}..{month_keys[0]})")
+    return path
+
+
+def main():
+    from warehouse_inventory_generator import WarehouseInventoryGenerator
+
+    parser = argparse.ArgumentParser(description="Build the shipment sell-through artifact")
+    parser.add_argument("--months", type=int, default=SHIPMENT_MONTHS,
+                        help=f"Months covered, newest first (default: {SHIPMENT_MONTHS})")
+    args = parser.parse_args()
+    gen = WarehouseInventoryGenerator()
+    try:
+        build_shipments_report(gen, months=args.months)
+    except Exception as e:
+        logger.error(f"Shipments report failed: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
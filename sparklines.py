@@ -0,0 +1,127 @@
+"""
+Downsampled per-product trend series for the warehouse reports
+
+Each window's history is reduced to at most K points per product with
+Largest-Triangle-Three-Buckets (LTTB), which keeps the visual shape (peaks,
+drops) that a naive every-Nth sample loses. Series are stored as delta-encoded
+integer lists in a compact sidecar next to the report:
+
+    warehouse_sparklines_{tp}.json
+    {"meta": {"time_period", "start_date", "end_date", "max_points", "encoding": "delta"},
+     "series": {"<nc_code>": [[day deltas...], [value deltas...]]}}
+
+Days are offsets from meta.start_date. Decoding is a running sum of each list.
+"""
+
+from datetime import datetime
+
+
+def lttb(points, threshold):
+    """Largest-Triangle-Three-Buckets over [(x, y), ...] sorted by x; keeps first and last"""
+    n = len(points)
+    if threshold >= n or n <= 2:
+        return list(points)
+    if threshold < 3:
+        return [points[0], points[-1]]
+    sampled = [points[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third triangle vertex
+        nxt_start = int((i + 1) * every) + 1
+        nxt_end = min(int((i + 2) * every) + 1, n)
+        if nxt_end <= nxt_start:
+            nxt_start, nxt_end = n - 1, n
+        span = nxt_end - nxt_start
+        avg_x = sum(p[0] for p in points[nxt_start:nxt_end]) / span
+        avg_y = sum(p[1] for p in points[nxt_start:nxt_end]) / span
+
+        ax, ay = points[a]
+        best_area, best = -1.0, None
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > best_area:
+                best_area, best = area, j
+        sampled.append(points[best])
+        a = best
+    sampled.append(points[-1])
+    return sampled
+
+
+def delta_encode(values):
+    out, prev = [], 0
+    for v in values:
+        out.append(v - prev)
+        prev = v
+    return out
+
+
+def delta_decode(deltas):
+    out, total = [], 0
+    for d in deltas:
+        total += d
+        out.append(total)
+    return out
+
+
+class SparklineCollector:
+    """
+    Fed (nc_code, check_date, value) in date order per product while the report
+    is folded. Each product's points are downsampled as soon as the next product
+    starts, so only one product's full series is held at a time.
+    """
+
+    def __init__(self, start_date: str, end_date: str, max_points: int = 32):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.max_points = max_points
+        self._epoch = datetime.strptime(start_date[:10], '%Y-%m-%d')
+        self._epoch_day_key = (self._epoch - datetime(1970, 1, 1)).days
+        self._offsets = {}
+        self._series = {}
+        self._code = None
+        self._points = []
+
+    def _offset(self, check_date):
+        if isinstance(check_date, int):  # day key (days since 1970-01-01, see day_keys.py)
+            return check_date - self._epoch_day_key
+        key = str(check_date)[:10]
+        off = self._offsets.get(key)
+        if off is None:
+            off = self._offsets[key] = (datetime.strptime(key, '%Y-%m-%d') - self._epoch).days
+        return off
+
+    def add(self, code, check_date, value):
+        if code != self._code:
+            self._close()
+            self._code = code
+            # A product seen again (input not grouped) continues from its downsampled points
+            self._points = self._series.pop(code, [])
+        self._points.append((self._offset(check_date), int(value or 0)))
+
+    def _close(self):
+        if self._code is not None:
+            self._series[self._code] = lttb(self._points, self.max_points)
+        self._code, self._points = None, []
+
+    def to_sidecar(self, time_period, codes=None):
+        """Sidecar document; `codes` limits it to the products that made it into the report"""
+        self._close()
+        keep = None if codes is None else {str(c) for c in codes}
+        series = {}
+        for code, pts in self._series.items():
+            if keep is not None and str(code) not in keep:
+                continue
+            series[str(code)] = [delta_encode([x for x, _ in pts]), delta_encode([y for _, y in pts])]
+        return {
+            'meta': {
+                'time_period': time_period,
+                'start_date': self.start_date,
+                'end_date': self.end_date,
+                'max_points': self.max_points,
+                'encoding': 'delta',
+                'products': len(series),
+            },
+            'series': series,
+        }
@@ -0,0 +1,113 @@
+"""
+Shared fixtures: a small inventory.db with the backend migrations' schema
+
+warehouse_inventory_history_v2.nc_code is TEXT while alcohol.nc_code is
+INTEGER (backend/migrations), so every path that unions or joins the two is
+exercised with the key types production has.
+
+Run from the repository root: python3 -m pytest tests
+"""
+
+import os
+import sys
+import random
+import sqlite3
+import importlib
+from datetime import date, timedelta
+from pathlib import Path
+
+import pytest
+
+REPO_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_DIR))
+
+SCHEMA_SQL = """
+CREATE TABLE alcohol (alcohol_id INTEGER PRIMARY KEY AUTOINCREMENT, nc_code INTEGER NOT NULL UNIQUE,
+  brand_name TEXT, size_ml INTEGER, cases_per_pallet INTEGER, supplier TEXT, broker_name TEXT,
+  first_seen_date DATE, image_path TEXT, listing_type TEXT, style_tags TEXT, alcohol_type TEXT,
+  alcohol_subtype TEXT, retail_price FLOAT, bottles_per_case INTEGER);
+CREATE TABLE bourbons (bourbon_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL,
+  plu INTEGER NOT NULL UNIQUE, last_seeded_date DATE);
+CREATE TABLE warehouse_inventory_history_v2 (history_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  nc_code TEXT NOT NULL, check_date DATE NOT NULL, total_available INTEGER, listing_type TEXT,
+  supplier_allotment INTEGER, UNIQUE (nc_code, check_date));
+"""
+
+LISTING_TYPES = ('Listed', 'Listed', 'Listed', 'Allocation', 'Limited', 'Barrel', None)
+
+
+def build_inventory_db(path, products=60, days=200, seed=7):
+    """
+    Daily warehouse history ending today for `products` codes. Values come from
+    a small range so peaks and lows repeat (the last occurrence must win);
+    some products skip days, some rows are NULL, and two history codes have
+    no alcohol row (they are not reportable).
+    """
+    rng = random.Random(seed)
+    today = date.today()
+    conn = sqlite3.connect(path)
+    try:
+        conn.executescript(SCHEMA_SQL)
+        history = []
+        for i in range(products + 2):
+            code = 20000 + i
+            listing = rng.choice(LISTING_TYPES)
+            if i < products:
+                conn.execute(
+                    "INSERT INTO alcohol (nc_code, brand_name, size_ml, supplier, listing_type, retail_price, "
+                    "bottles_per_case, image_path) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (code, f"Brand {rng.randint(0, products // 3)}", rng.choice((375, 750, 1750)),
+                     f"Supplier {i % 5}", listing, round(rng.uniform(20, 200), 2), 6, None))
+                if i % 4 == 0:
+                    conn.execute("INSERT INTO bourbons (name, plu) VALUES (?, ?)", (f"Bourbon {i}", code))
+            level = rng.randint(0, 12)
+            sparse = i % 5 == 0
+            for d in range(days - 1, -1, -1):
+                if sparse and rng.random() < 0.3:
+                    continue
+                level = max(0, min(12, level + rng.choice((-2, -1, 0, 0, 1, 2))))
+                value = None if rng.random() < 0.01 else level * 10
+                history.append((str(code), (today - timedelta(days=d)).isoformat(), value, listing))
+        conn.executemany("INSERT INTO warehouse_inventory_history_v2 (nc_code, check_date, total_available, "
+                         "listing_type) VALUES (?, ?, ?, ?)", history)
+        conn.commit()
+    finally:
+        conn.close()
+    return path
+
+
+@pytest.fixture(scope='session')
+def generator_module(tmp_path_factory):
+    """warehouse_inventory_generator imported in DEV_MODE with its ./logs under a temp dir"""
+    os.environ.update(DEV_MODE='true', THUMBNAILS='false', SEARCH_INDEX='false', CHANGE_EVENTS='false',
+                      SHIPMENTS_REPORT='false', HISTORY_SOURCE='daily', READ_SNAPSHOT='off')
+    os.environ.pop('REPORT_TIERS', None)
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('generator'))
+    try:
+        return importlib.import_module('warehouse_inventory_generator')
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture
+def inventory_db(tmp_path):
+    return str(build_inventory_db(tmp_path / 'inventory.db'))
+
+
+@pytest.fixture
+def make_generator(generator_module, tmp_path):
+    def make(db_path, engine='python'):
+        gen = generator_module.WarehouseInventoryGenerator(db_path, tmp_path / 'reports', tmp_path / 'logs')
+        gen.engine = engine
+        return gen
+    return make
+
+
+@pytest.fixture
+def window_products():
+    """gen, periods -> {period: product records} built in memory, as --compare-engines does"""
+    def build(gen, periods):
+        all_periods = gen._get_time_periods()
+        return {tp: gen._build_report_products(tp, all_periods[tp]) for tp in periods}
+    return build
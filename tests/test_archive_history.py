@@ -0,0 +1,60 @@
+"""Archiving moves a period only once the archive holds every hot row unchanged"""
+
+import sqlite3
+
+import archive_history
+
+HISTORY = 'warehouse_inventory_history_v2'
+PERIODS = ('last_90_days', 'last_180_days')
+
+
+def _archive(db_path):
+    return archive_history.archive(db_path, horizon_days=100, granularity='monthly', tables=[HISTORY])
+
+
+def test_archived_windows_read_the_same(inventory_db, make_generator, window_products):
+    before = window_products(make_generator(inventory_db), PERIODS)
+    moved = _archive(inventory_db)[HISTORY]
+    assert moved > 0
+    assert len(archive_history.catalogue(inventory_db)) >= 2
+    assert window_products(make_generator(inventory_db), PERIODS) == before
+
+
+def test_rows_changed_after_the_copy_are_not_lost(inventory_db, monkeypatch, caplog):
+    conn = sqlite3.connect(inventory_db)
+    oldest = conn.execute(f"SELECT MIN(check_date) FROM {HISTORY}").fetchone()[0]
+    conn.close()
+    real_retry = archive_history.run_with_busy_retry
+    writes = []
+
+    def write_between_copy_and_move(fn, *args, **kwargs):
+        if not writes:  # the scraper writes into the period right after the first copy
+            other = sqlite3.connect(inventory_db)
+            other.execute(f"UPDATE {HISTORY} SET total_available = 999 WHERE check_date = ? AND nc_code = '20001'",
+                          [oldest])
+            other.execute(f"INSERT INTO {HISTORY} (nc_code, check_date, total_available) VALUES ('29999', ?, 7)",
+                          [oldest])
+            other.commit()
+            other.close()
+            writes.append(oldest)
+        return real_retry(fn, *args, **kwargs)
+
+    monkeypatch.setattr(archive_history, 'run_with_busy_retry', write_between_copy_and_move)
+    with caplog.at_level('INFO', logger='archive_history'):
+        _archive(inventory_db)
+    assert 'copying again' in caplog.text
+
+    conn = sqlite3.connect(inventory_db)
+    try:
+        entry = next(e for e in archive_history.catalogue(inventory_db) if e['from_date'] <= oldest <= e['to_date'])
+        assert conn.execute(f"SELECT COUNT(*) FROM {HISTORY} WHERE check_date = ?", [oldest]).fetchone()[0] == 0
+        arch, name = archive_history.open_history_connection(inventory_db, HISTORY, oldest, oldest)
+        try:
+            rows = dict(arch.execute(f"SELECT nc_code, total_available FROM {name} WHERE check_date = ?", [oldest]))
+            assert rows['20001'] == 999 and rows['29999'] == 7
+            assert arch.execute(f"SELECT COUNT(*) FROM {name} WHERE check_date >= ? AND check_date <= ?",
+                                [entry['from_date'], entry['to_date']]).fetchone()[0] == entry['row_count']
+        finally:
+            arch.close()
+    finally:
+        conn.close()
@@ -0,0 +1,75 @@
+"""Change-event polling: index seeks only, and the same events as a full diff of the two dates"""
+
+import sqlite3
+from datetime import date, timedelta
+
+import change_events
+
+HISTORY = 'warehouse_inventory_history_v2'
+
+
+def _naive_events(conn, previous_date, check_date):
+    values = {}
+    for code, d, total in conn.execute(f"SELECT nc_code, check_date, total_available FROM {HISTORY} "
+                                       f"WHERE check_date IN (?, ?)", [previous_date, check_date]):
+        values.setdefault(code, {})[d] = total or 0
+    out = []
+    for code in sorted(values):
+        if check_date not in values[code]:
+            continue
+        previous = values[code].get(previous_date)
+        if previous is None:
+            row = conn.execute(f"SELECT total_available FROM {HISTORY} WHERE nc_code = ? AND check_date < ? "
+                               f"ORDER BY check_date DESC LIMIT 1", [code, previous_date]).fetchone()
+            previous = None if row is None else (row[0] or 0)
+        kind = change_events.classify(previous, values[code][check_date])
+        if kind:
+            out.append((kind, code, previous, values[code][check_date]))
+    return out
+
+
+def test_polling_only_seeks_the_index(inventory_db):
+    conn = sqlite3.connect(inventory_db)
+    try:
+        for through in (None, date.today().isoformat()):
+            sql, params = change_events.recent_rows_sql(HISTORY, through)
+            plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+            details = [r[3] for r in plan]
+            assert not any(d.startswith(f'SCAN {HISTORY}') or 'TEMP B-TREE' in d for d in details), details
+    finally:
+        conn.close()
+
+
+def test_events_match_a_full_diff(inventory_db, make_generator):
+    gen = make_generator(inventory_db)
+    conn = sqlite3.connect(inventory_db)
+    dates = [r[0] for r in conn.execute(f"SELECT DISTINCT check_date FROM {HISTORY} ORDER BY check_date")]
+    expected = _naive_events(conn, dates[-2], dates[-1])
+
+    rows = change_events.recent_rows(conn, HISTORY)
+    assert change_events.check_dates_to_process(rows) == dates[-2:]
+    assert change_events.diff_check_dates(conn, HISTORY, rows, dates[-2], dates[-1]) == expected
+    conn.close()
+    assert change_events.update_event_feed(gen) == len(expected)
+
+    # two more check_dates after missed runs: a sell-out, a restock and a brand-new product
+    conn = sqlite3.connect(inventory_db)
+    later = [(date.fromisoformat(dates[-1]) + timedelta(days=i)).isoformat() for i in (1, 2)]
+    for d in later:
+        conn.execute(f"INSERT INTO {HISTORY} (nc_code, check_date, total_available) "
+                     f"SELECT nc_code, ?, total_available FROM {HISTORY} WHERE check_date = ?", [d, dates[-1]])
+    conn.execute(f"UPDATE {HISTORY} SET total_available = 0 WHERE check_date = ? AND nc_code = '20001'", [later[1]])
+    conn.execute(f"UPDATE {HISTORY} SET total_available = total_available + 50 "
+                 f"WHERE check_date = ? AND nc_code = '20002'", [later[1]])
+    conn.execute(f"INSERT INTO {HISTORY} (nc_code, check_date, total_available) VALUES ('29999', ?, 5)", [later[1]])
+    conn.commit()
+    expected = [_naive_events(conn, dates[-1], later[0]), _naive_events(conn, later[0], later[1])]
+    conn.close()
+    assert not expected[0] and {e[1] for e in expected[1]} >= {'20002', '29999'}
+
+    added = change_events.update_event_feed(gen)
+    assert added == len(expected[1])
+    feed = change_events.EventFeed(gen.output_dir)
+    assert feed.load_state()['through_check_date'] == later[1]
+    assert [(e['type'], e['nc_code']) for e in feed.read(since=0)][-added:] == \
+        [(kind, code) for kind, code, _, _ in expected[1]]
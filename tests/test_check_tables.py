@@ -0,0 +1,46 @@
+"""Capacity profile with and without the dbstat virtual table"""
+
+import sqlite3
+
+import check_tables
+
+HISTORY = 'warehouse_inventory_history_v2'
+
+
+class _NoDbstat(sqlite3.Connection):
+    """A connection behaving like a SQLite build without SQLITE_ENABLE_DBSTAT_VTAB"""
+
+    def cursor(self, *args, **kwargs):
+        return super().cursor(_NoDbstatCursor)
+
+
+class _NoDbstatCursor(sqlite3.Cursor):
+    def execute(self, sql, *args):
+        if 'dbstat' in sql:
+            raise sqlite3.OperationalError('no such table: dbstat')
+        return super().execute(sql, *args)
+
+
+def test_profile_reads_dbstat(inventory_db):
+    conn = sqlite3.connect(inventory_db)
+    try:
+        profile = check_tables.profile_database(conn, inventory_db)
+    finally:
+        conn.close()
+    history = profile['tables'][HISTORY]
+    assert profile['page_stats'] and history['total_bytes'] > 0 and history['indexes']
+    assert history['growth']['projected_bytes']
+
+
+def test_profile_falls_back_to_row_counts(inventory_db):
+    conn = sqlite3.connect(inventory_db, factory=_NoDbstat)
+    try:
+        expected = conn.execute(f"SELECT COUNT(*) FROM {HISTORY}").fetchone()[0]
+        profile = check_tables.profile_database(conn, inventory_db)
+    finally:
+        conn.close()
+    history = profile['tables'][HISTORY]
+    assert not profile['page_stats'] and profile['projected_db_bytes'] is None
+    assert history['rows'] == expected and 'total_bytes' not in history
+    assert history['growth']['rows_per_day'] > 0 and 'projected_bytes' not in history['growth']
+    check_tables.print_summary(profile)
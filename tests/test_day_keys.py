@@ -0,0 +1,45 @@
+"""day_key backfill on the migrations' schema"""
+
+import sqlite3
+
+import day_keys
+from database_safety import get_database_manager
+
+HISTORY = 'warehouse_inventory_history_v2'
+
+
+def test_backfill_finishes_past_unparseable_dates(inventory_db, caplog):
+    conn = sqlite3.connect(inventory_db)
+    conn.executemany(f"INSERT INTO {HISTORY} (nc_code, check_date, total_available) VALUES (?, ?, ?)",
+                     [('20000', f'not a date {i}', 10) for i in range(25)])
+    conn.commit()
+    rows = conn.execute(f"SELECT COUNT(*) FROM {HISTORY}").fetchone()[0]
+    conn.close()
+
+    spec = day_keys.DAY_KEY_TABLES[HISTORY]
+    with caplog.at_level('WARNING', logger='day_keys'):
+        total = day_keys.migrate_table(get_database_manager(inventory_db), HISTORY, spec, batch=10)
+
+    assert total == rows - 25
+    assert '25 warehouse_inventory_history_v2 rows' in caplog.text
+    assert day_keys.verify(inventory_db)[HISTORY] == 25
+
+
+def test_readers_wait_for_the_backfill(inventory_db, make_generator, window_products):
+    before = window_products(make_generator(inventory_db), ('last_30_days',))
+
+    conn = sqlite3.connect(inventory_db)
+    conn.execute(f"ALTER TABLE {HISTORY} ADD COLUMN {day_keys.DAY_KEY_COLUMN} INTEGER")
+    conn.execute(f"UPDATE {HISTORY} SET {day_keys.DAY_KEY_COLUMN} = {day_keys.day_key_sql('check_date')} "
+                 f"WHERE rowid % 2 = 0")
+    conn.commit()
+    assert day_keys.has_day_key(conn, HISTORY) and not day_keys.day_key_ready(conn, HISTORY)
+    conn.close()
+    gen = make_generator(inventory_db)
+    assert not gen._has_day_key()
+    assert window_products(gen, ('last_30_days',)) == before
+
+    day_keys.migrate(inventory_db, archives=False)
+    gen = make_generator(inventory_db)
+    assert gen._has_day_key()
+    assert window_products(gen, ('last_30_days',)) == before
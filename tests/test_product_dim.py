@@ -0,0 +1,56 @@
+"""product_dim freshness: readers fall back to alcohol while it is older than its sources"""
+
+import sqlite3
+
+import product_dim
+
+
+def _current(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return product_dim.is_current(conn)
+    finally:
+        conn.close()
+
+
+def _brand(gen, code):
+    products = gen._build_report_products('last_30_days', gen._get_time_periods()['last_30_days'])
+    return next(p['brand_name'] for p in products if p['nc_code'] == code)
+
+
+def test_stale_product_dim_falls_back_to_alcohol(inventory_db, make_generator):
+    assert not _current(inventory_db)
+    product_dim.refresh(inventory_db)
+    assert _current(inventory_db)
+    gen = make_generator(inventory_db)
+    assert gen._product_source()[0] == product_dim.PRODUCT_DIM_TABLE
+    assert _brand(gen, '20003') != 'Renamed'
+
+    conn = sqlite3.connect(inventory_db)
+    conn.execute("UPDATE alcohol SET brand_name = 'Renamed' WHERE nc_code = 20003")
+    conn.commit()
+    conn.close()
+    assert not _current(inventory_db)
+
+    gen = make_generator(inventory_db)
+    assert gen._product_source()[0] == 'alcohol'
+    assert _brand(gen, '20003') == 'Renamed'
+    assert gen.generate_all_reports(['last_30_days'])
+    assert not _current(inventory_db)  # report runs never refresh it
+
+    counts = product_dim.refresh(inventory_db)
+    assert counts['updated'] == 1 and _current(inventory_db)
+    gen = make_generator(inventory_db)
+    assert gen._product_source()[0] == product_dim.PRODUCT_DIM_TABLE
+    assert _brand(gen, '20003') == 'Renamed'
+
+
+def test_refresh_without_changes_marks_current(inventory_db):
+    product_dim.refresh(inventory_db)
+    conn = sqlite3.connect(inventory_db)
+    conn.execute("UPDATE alcohol SET brand_name = brand_name WHERE nc_code = 20000")
+    conn.commit()
+    conn.close()
+    assert not _current(inventory_db)
+    counts = product_dim.refresh(inventory_db)
+    assert counts['updated'] == 0 and _current(inventory_db)
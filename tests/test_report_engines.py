@@ -0,0 +1,55 @@
+"""The SQL window-function engine must build the same records as the python fold"""
+
+import json
+
+import pytest
+
+import day_keys
+import rollup_warehouse_history as rollups
+
+
+@pytest.mark.parametrize('with_day_key', [False, True], ids=['check_date', 'day_key'])
+@pytest.mark.parametrize('with_rollups', [False, True], ids=['daily', 'rollups'])
+def test_engines_agree(inventory_db, make_generator, window_products, generator_module, with_rollups, with_day_key):
+    if with_day_key:
+        day_keys.migrate(inventory_db, archives=False)
+    if with_rollups:
+        rollups.refresh(inventory_db)
+        assert rollups.verify(inventory_db)['ok']
+    periods = generator_module.TIME_PERIODS
+
+    python = window_products(make_generator(inventory_db, 'python'), periods)
+    sql_gen = make_generator(inventory_db, 'sql')
+    sql = window_products(sql_gen, periods)
+
+    for tp in periods:
+        assert len(python[tp]) == 60, tp
+        assert sql[tp] == python[tp], tp
+    if with_rollups:
+        dr = sql_gen._get_time_periods()['last_180_days']
+        assert sql_gen._rollup_plan(dr['start'].strftime('%Y-%m-%d'), dr['end'].strftime('%Y-%m-%d')) is not None
+
+
+def test_compare_engines_cli_mode(inventory_db, make_generator):
+    rollups.refresh(inventory_db)
+    gen = make_generator(inventory_db)
+    assert gen.compare_engines() is True
+    assert gen.engine == 'python'
+    calibration = json.loads((gen.log_dir / 'engine_calibration.json').read_text())
+    assert all({'python', 'sql', 'python_sparklines', 'sql_sparklines'} <= set(t) for t in calibration.values())
+
+
+def test_auto_engine_weighs_the_sparkline_scan(inventory_db, make_generator, generator_module):
+    gen = make_generator(inventory_db, 'auto')
+    gen.log_dir.mkdir(parents=True, exist_ok=True)
+    (gen.log_dir / generator_module.ENGINE_CALIBRATION_FILE).write_text(json.dumps({
+        'last_30_days': {'days': 30, 'python': 2.0, 'sql': 1.0, 'python_sparklines': 2.2, 'sql_sparklines': 3.0},
+    }))
+    assert gen._select_engine('2026-01-01', '2026-01-31') == 'sql'
+    assert gen._select_engine('2026-01-01', '2026-01-31', sparklines=True) == 'python'
+
+    # calibrated before sparkline timings were recorded: keep the python fold
+    (gen.log_dir / generator_module.ENGINE_CALIBRATION_FILE).write_text(json.dumps({
+        'last_30_days': {'days': 30, 'python': 2.0, 'sql': 1.0},
+    }))
+    assert gen._select_engine('2026-01-01', '2026-01-31', sparklines=True) == 'python'
@@ -0,0 +1,62 @@
+"""Rollup-backed windows against the daily rows they stand in for, on the migrations' schema"""
+
+import sqlite3
+
+import rollup_warehouse_history as rollups
+
+LONG_PERIODS = ('last_90_days', 'last_180_days')
+
+
+def test_rollup_windows_match_daily_rows(inventory_db, make_generator, window_products, generator_module,
+                                         monkeypatch):
+    monkeypatch.setattr(generator_module, 'ROLLUP_MIN_DAYS', 0)
+    daily = window_products(make_generator(inventory_db), LONG_PERIODS)
+
+    result = rollups.refresh(inventory_db)
+    assert result['month']['buckets'] and result['week']['buckets']
+    assert rollups.verify(inventory_db)['ok']
+
+    monkeypatch.setattr(generator_module, 'ROLLUP_MIN_DAYS', 60)
+    gen = make_generator(inventory_db)
+    assert gen._rollup_plan(*(gen._get_time_periods()['last_180_days'][k].strftime('%Y-%m-%d')
+                              for k in ('start', 'end'))) is not None
+    rolled = window_products(gen, LONG_PERIODS)
+    for tp in LONG_PERIODS:
+        codes = [p['nc_code'] for p in rolled[tp]]
+        assert len(codes) == len(set(codes)) == 60, tp
+        assert all(isinstance(c, str) for c in codes), tp
+        assert rolled[tp] == daily[tp], tp
+
+
+def test_integer_rollups_are_ignored_then_rebuilt(inventory_db):
+    conn = sqlite3.connect(inventory_db)
+    conn.executescript(rollups.SCHEMA_SQL.format(code_type='INTEGER'))
+    conn.execute(f"INSERT INTO {rollups.ROLLUP_STATE_TABLE} VALUES ('month', '2000-01-31')")
+    conn.commit()
+    conn.close()
+
+    conn = sqlite3.connect(inventory_db)
+    try:
+        assert rollups.get_rolled_through(conn) == {}
+    finally:
+        conn.close()
+    assert not rollups.verify(inventory_db)['ok']
+
+    rollups.refresh(inventory_db)
+    conn = sqlite3.connect(inventory_db)
+    try:
+        assert rollups._code_type(conn, rollups.ROLLUP_TABLE) == 'TEXT'
+        assert rollups.get_rolled_through(conn)
+    finally:
+        conn.close()
+    assert rollups.verify(inventory_db)['ok']
+
+
+def test_verify_reports_mismatched_buckets(inventory_db):
+    rollups.refresh(inventory_db)
+    conn = sqlite3.connect(inventory_db)
+    conn.execute(f"UPDATE {rollups.ROLLUP_TABLE} SET max_value = max_value + 1 WHERE nc_code = '20001'")
+    conn.commit()
+    conn.close()
+    check = rollups.verify(inventory_db)
+    assert not check['ok'] and check['mismatches'] > 0
@@ -2,18 +2,84 @@
 """
 Warehouse Inventory Report Generator (schema-aware)
 
-- Auto-detects alcohol table columns (brand/product/listing_type/retail_price/supplier/broker_name/image_path/plu)
+- Product metadata comes from product_dim while it is current (refreshed on its own schedule, see
+  product_dim.py); when it is missing or older than alcohol/bourbons,
+  alcohol's columns are resolved through the same mapping (brand/product/listing_type/price/supplier/broker/image/plu)
 - Computes "low" as the last occurrence of the minimum value AT/AFTER the most recent peak within the window
+- HISTORY_SOURCE=runs reads run-length compacted history (see compact_warehouse_history.py)
+- Windows reaching past the hot DB ATTACH only the overlapping archives (see archive_history.py)
+- Once day_keys.py has migrated the DB, windows filter on the integer day_key through covering indexes
+- Report files are serialised product by product (see report_writer.py); the sorted product list itself is
+  still built in memory first. REPORT_FORMATS=json,ndjson adds NDJSON
+- REPORT_ENGINE=python|sql|auto: fold rows in Python, or compute peak/low in SQLite with window functions
+  (with sparklines on, the sql engine scans the window a second time for the series; auto weighs that in)
+- SPARKLINE_POINTS=K (default 32, 0 = off) writes LTTB-downsampled trend series per product (see sparklines.py)
+- THUMBNAILS (default on) renders report thumbnails and image_manifest.json (see image_thumbnails.py)
+- SHIPMENTS_REPORT (default on) writes warehouse_shipments.json, monthly shipments and sell-through (see shipments_report.py)
+- REPORT_TIERS refreshes listing-type slices on their own cadence (--tier, --due) and assembles the reports from them
+  (see report_tiers.py)
+- --sources <config.json> runs several inventory DBs (boards, shards) concurrently, see run_sources()
 """
 
 import sqlite3
 import json
 import os
+import argparse
 import sys
 from datetime import datetime, timedelta
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 import logging
+import time
 import re
+from bisect import bisect_left, bisect_right
+
+from report_writer import ReportMetaAccumulator, StreamingReportWriter, write_json_atomic, write_compact_json_atomic
+from sparklines import SparklineCollector
+from db_snapshot import ReadSnapshot, SNAPSHOT_TARGETS
+from run_coordinator import RunCoordinator
+from product_dim import (PRODUCT_DIM_TABLE, REPORT_FIELDS, alcohol_select_parts, has_product_dim,
+                         is_current as product_dim_is_current, resolve_alcohol_columns)
+
+try:
+    from archive_history import list_archives, attach_archives
+except ImportError:  # archive support not deployed alongside the generator
+    list_archives = attach_archives = None
+
+try:
+    from rollup_warehouse_history import get_rolled_through, plan_window, rollup_points_sql
+except ImportError:  # rollups not deployed alongside the generator
+    get_rolled_through = plan_window = rollup_points_sql = None
+
+try:
+    from day_keys import day_key, day_key_to_date, date_from_key_sql, day_key_ready
+except ImportError:  # day_key migration not deployed alongside the generator
+    day_key = day_key_to_date = date_from_key_sql = day_key_ready = None
+
+try:
+    from search_index import build_search_index
+except ImportError:  # search index is optional
+    build_search_index = None
+
+try:
+    from change_events import update_event_feed
+except ImportError:  # event feed is optional
+    update_event_feed = None
+
+try:
+    from image_thumbnails import build_thumbnails, load_manifest, thumbnail_urls
+except ImportError:  # thumbnails are optional
+    build_thumbnails = load_manifest = thumbnail_urls = None
+
+try:
+    from shipments_report import build_shipments_report
+except ImportError:  # shipments artifact is optional
+    build_shipments_report = None
+
+try:
+    from report_tiers import parse_tiers, select_tiers, due_tiers, refresh_tier_window
+except ImportError:  # tiered refresh not deployed alongside the generator
+    parse_tiers = select_tiers = due_tiers = refresh_tier_window = None
 
 # ------------------ Config ------------------
 DEV_MODE = os.getenv('DEV_MODE', 'false').lower() == 'true'  # default to production
@@ -21,6 +87,33 @@ DB_PATH = './BourbonDatabase/inventory.db' if DEV_MODE else '/opt/BourbonDatabas
 OUTPUT_DIR = './warehouse-reports' if DEV_MODE else '/opt/warehouse-reports'
 LOG_DIR = './logs' if DEV_MODE else '/opt/logs'
 FILE_MODE = 0o644  # prod file permissions
+# 'daily' scans warehouse_inventory_history_v2; 'runs' uses compacted change runs when present
+HISTORY_SOURCE = os.getenv('HISTORY_SOURCE', 'daily').lower()
+HISTORY_TABLE = 'warehouse_inventory_history_v2'
+TIME_PERIODS = ('current_month', 'last_30_days', 'last_90_days', 'last_180_days')
+# Windows at least this long read weekly/monthly rollups for their complete middle buckets when present
+# (see rollup_warehouse_history.py); 0 disables
+ROLLUP_MIN_DAYS = int(os.getenv('ROLLUP_MIN_DAYS', '60'))
+# 'auto' picks the engine --compare-engines measured faster for the nearest window size, timed with or
+# without the sparkline sidecar as the run needs it (python if unmeasured)
+REPORT_ENGINE = os.getenv('REPORT_ENGINE', 'auto').lower()
+ENGINE_CALIBRATION_FILE = 'engine_calibration.json'
+# 'file' or 'memory': run every window against a backup-API copy of the DB (see db_snapshot.py)
+READ_SNAPSHOT = os.getenv('READ_SNAPSHOT', 'off').lower()
+SPARKLINE_POINTS = int(os.getenv('SPARKLINE_POINTS', '32'))
+# Rebuild warehouse_search.db next to the reports after each run (set to false to skip)
+SEARCH_INDEX = os.getenv('SEARCH_INDEX', 'true').lower() == 'true'
+# Append what changed between the newest check_dates to warehouse_events.ndjson (see change_events.py)
+CHANGE_EVENTS = os.getenv('CHANGE_EVENTS', 'true').lower() == 'true'
+# Render thumbnails for alcohol images before the reports and add thumbnail_url (see image_thumbnails.py)
+THUMBNAILS = os.getenv('THUMBNAILS', 'true').lower() == 'true'
+# Write warehouse_shipments.json (monthly shipments per board, sell-through) after each run
+SHIPMENTS_REPORT = os.getenv('SHIPMENTS_REPORT', 'true').lower() == 'true'
+# Read metadata from product_dim (alcohol ∪ bourbons) while it is current; refreshed by product_dim.py, not here
+PRODUCT_DIM = os.getenv('PRODUCT_DIM', 'true').lower() == 'true'
+REPORT_FORMATS = {f.strip() for f in os.getenv('REPORT_FORMATS', 'json').lower().split(',') if f.strip()}
+# Tiered refresh, "name:Type|Type:minutes,..." with one '*' (catalogue) tier; empty = every run rebuilds everything
+REPORT_TIERS = os.getenv('REPORT_TIERS', '')
 
 # ------------------ Logging ------------------
 logger = logging.getLogger('warehouse_inventory_generator')
@@ -38,16 +131,6 @@ if not logger.handlers:
     logger.addHandler(ch)
 
 # ------------------ Helpers ------------------
-def _safe_iso_parse(val: str) -> datetime:
-    s = str(val)
-    try:
-        return datetime.fromisoformat(s.replace('Z', '+00:00'))
-    except Exception:
-        try:
-            return datetime.strptime(s[:10], '%Y-%m-%d')
-        except Exception:
-            return datetime.min
-
 def _needs_quoting(identifier: str) -> bool:
     return not re.match(r'^[A-Za-z_][A-Za-z0-9_]*$', identifier or '')
 
@@ -56,15 +139,27 @@ def _quote_ident(identifier: str) -> str:
         return ''
     return f'"{identifier}"' if _needs_quoting(identifier) else identifier
 
-def _normalize(name: str) -> str:
-    """normalize col name: lower + remove spaces/underscores"""
-    return re.sub(r'[\s_]+', '', (name or '').lower())
-
 class WarehouseInventoryGenerator:
-    def __init__(self):
-        self.db_path = DB_PATH
-        self.output_dir = Path(OUTPUT_DIR)
-        self.log_dir = Path(LOG_DIR)
+    def __init__(self, db_path=None, output_dir=None, log_dir=None):
+        self.db_path = db_path or DB_PATH
+        self.output_dir = Path(output_dir or OUTPUT_DIR)
+        self.log_dir = Path(log_dir or LOG_DIR)
+        # Name queried for daily history; a TEMP union view while archives are attached
+        self.history_table = HISTORY_TABLE
+        self._archives = []
+        self._day_key = None  # whether history's day_key is backfilled, checked once per window
+        self.engine = REPORT_ENGINE
+        self.snapshot_mode = READ_SNAPSHOT
+        self.snapshot = None
+        self._thumbnails = None  # nc_code -> {size: url}, read from image_manifest.json on first use
+        self._products = None  # (table, key column, row filter) for product metadata, see _product_source
+        self.listing_types = None  # limit history scans to these listing types (a tier slice); None = all
+        self.tiers = None  # parsed REPORT_TIERS, see report_tiers.py
+        if parse_tiers and REPORT_TIERS:
+            try:
+                self.tiers = parse_tiers(REPORT_TIERS)
+            except ValueError as e:
+                logger.error(f"Ignoring bad REPORT_TIERS: {e}")
         self.output_dir.mkdir(parents=True, exist_ok=True)
         self.log_dir.mkdir(parents=True, exist_ok=True)
         if not DEV_MODE:
@@ -76,7 +171,53 @@ class WarehouseInventoryGenerator:
 
     # ---------- DB utilities ----------
     def _connect(self):
-        return sqlite3.connect(self.db_path, timeout=30)
+        if self.snapshot is not None:
+            conn = self.snapshot.connect()
+        else:
+            conn = sqlite3.connect(self.db_path, timeout=30, uri=True)
+        if self._archives:
+            attach_archives(conn, self.db_path, HISTORY_TABLE, self._archives)
+        return conn
+
+    def _open_snapshot(self):
+        """Point reads at a fresh snapshot when enabled; falls back to the live DB if the copy fails"""
+        if self.snapshot_mode not in ('file', 'memory'):
+            return
+        try:
+            if self.snapshot is None or self.snapshot.target != self.snapshot_mode:
+                self.close_snapshot()
+                self.snapshot = ReadSnapshot(self.db_path, self.snapshot_mode, self.log_dir / 'snapshot')
+            self.snapshot.refresh()
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"Snapshot failed ({e}); reading the live database.")
+            self.close_snapshot()
+
+    def close_snapshot(self):
+        if self.snapshot is not None:
+            self.snapshot.close()
+            self.snapshot = None
+
+    def _reset_history_source(self):
+        self._archives = []
+        self._day_key = None
+        self.history_table = HISTORY_TABLE
+
+    def _use_archives_for(self, start_date: str, end_date: str):
+        """Point history queries at hot + overlapping archives for this window (or just hot)"""
+        self._archives = []
+        self._day_key = None
+        if list_archives is not None:
+            conn = self._connect()
+            try:
+                self._archives = list_archives(conn, HISTORY_TABLE, start_date, end_date)
+            finally:
+                conn.close()
+        if self._archives:
+            self.history_table = f"temp.{HISTORY_TABLE}_with_archives"
+            logger.info(f"Window {start_date}..{end_date} reads {len(self._archives)} archive(s): "
+                        f"{', '.join(p for p, _ in self._archives)}")
+        else:
+            self.history_table = HISTORY_TABLE
 
     def execute_query(self, query, params=None):
         try:
@@ -115,103 +256,378 @@ class WarehouseInventoryGenerator:
             logger.error(f"Failed to read schema for {table}: {e}")
             return []
 
-    def _pick(self, cols, candidates):
-        """Pick first matching column name from candidates, case/format-insensitive."""
-        norm_map = { _normalize(c): c for c in cols }
-        for cand in candidates:
-            key = _normalize(cand)
-            if key in norm_map:
-                return norm_map[key]
-        return None
+    def _product_source(self):
+        """
+        (table, key column, row filter) for product metadata under alias `a`:
+        product_dim when it is current, else alcohol. Only products with an
+        alcohol row are reportable either way.
+        """
+        if self._products is None:
+            conn = self._connect()
+            try:
+                dim = PRODUCT_DIM and product_dim_is_current(conn)
+                if PRODUCT_DIM and not dim and has_product_dim(conn):
+                    logger.info("product_dim is older than alcohol/bourbons; reading metadata from alcohol. "
+                                "Refresh it with: python3 product_dim.py")
+            finally:
+                conn.close()
+            self._products = ((PRODUCT_DIM_TABLE, 'product_code', 'a.alcohol_id IS NOT NULL') if dim
+                              else ('alcohol', 'nc_code', '1'))
+        return self._products
+
+    def _alcohol_select_parts(self):
+        """
+        Metadata SELECT expressions (alias `a` = _product_source()) in report order:
+        brand_name, product_name, listing_type, retail_price, supplier, broker, plu, has_image, image_path, image_url.
+        Straight product_dim columns, or alcohol's columns resolved by product_dim.alcohol_select_parts.
+        """
+        table, _, _ = self._product_source()
+        if table == PRODUCT_DIM_TABLE:
+            return [f"a.{field} AS {field}" for field in REPORT_FIELDS]
+        return alcohol_select_parts(self._get_table_columns('alcohol'))
 
-    def _build_raw_query(self, start_date: str, end_date: str):
+    def _listing_filter_sql(self, column='nc_code'):
         """
-        Build a SELECT that only references columns that truly exist in `alcohol`.
-        Fallbacks to NULL for any missing metadata columns.
+        (sql, params) appending `AND column IN (<codes of self.listing_types>)` to
+        a history scan, so a tier slice reads only its products through the
+        (nc_code, ...) indexes; ('', []) when every product is wanted.
+        'Unknown' also matches a missing listing type, as reports label it.
         """
-        a_cols = self._get_table_columns('alcohol')
-
-        brand_col   = self._pick(a_cols, ['brand_name','Brand_Name','brand','Brand'])
-        prod_col    = self._pick(a_cols, ['product_name','Product_Name','name','ProductName','Product'])
-        list_col    = self._pick(a_cols, ['listing_type','Listing_Type','listing','type','Type'])
-        retail_col  = self._pick(a_cols, ['retail_price','Retail_Price','price','Price'])
-        supplier_col= self._pick(a_cols, ['supplier','Supplier','supplier_name','Supplier_Name'])
-        broker_col  = self._pick(a_cols, ['broker_name','Broker_Name','broker','Broker'])
-        image_col   = self._pick(a_cols, ['image_path','Image_Path','image','Image','ImagePath'])
-        plu_col     = self._pick(a_cols, ['plu','PLU','Plu','product_number','Product_Number','item_number','Item_Number','sku','SKU'])
-
-        # Helpers to inject columns or NULL safely
-        def col_or_null(col, alias_as):
-            return f'a.{_quote_ident(col)} AS {alias_as}' if col else f'NULL AS {alias_as}'
-
-        # image helpers
-        if image_col:
-            image_expr = f"a.{_quote_ident(image_col)}"
-            has_image = f"""CASE 
-  WHEN {image_expr} IS NOT NULL AND {image_expr} != '' AND {image_expr} != 'no image available' THEN 1
-  ELSE 0 END AS has_image"""
-            image_path = f"""CASE 
-  WHEN {image_expr} IS NOT NULL AND {image_expr} != '' AND {image_expr} != 'no image available' THEN {image_expr}
-  ELSE NULL END AS image_path"""
-            image_url = f"""CASE 
-  WHEN {image_expr} IS NOT NULL AND {image_expr} != '' AND {image_expr} != 'no image available'
-  THEN '/api/images/' || REPLACE(REPLACE({image_expr}, 'alcohol_images\\', ''), 'alcohol_images/', '')
-  ELSE NULL END AS image_url"""
+        if not self.listing_types:
+            return '', []
+        table, key, cond = self._product_source()
+        if table == PRODUCT_DIM_TABLE:
+            expr = 'a.listing_type'
         else:
-            has_image = "0 AS has_image"
-            image_path = "NULL AS image_path"
-            image_url = "NULL AS image_url"
-
-        select_parts = [
-            "h.nc_code",
-            col_or_null(brand_col,   "brand_name"),
-            col_or_null(prod_col,    "product_name"),
-            col_or_null(list_col,    "listing_type"),
-            "h.check_date",
-            "h.total_available",
-            col_or_null(retail_col,  "retail_price"),
-            col_or_null(supplier_col,"supplier"),
-            col_or_null(broker_col,  "broker"),
-            col_or_null(plu_col,     "plu"),
-            has_image,
-            image_path,
-            image_url,
-        ]
+            col = resolve_alcohol_columns(self._get_table_columns('alcohol'))['listing_type']
+            expr = f"a.{_quote_ident(col)}" if col else 'NULL'
+        types = list(self.listing_types)
+        match = f"{expr} IN ({','.join(['?'] * len(types))})"
+        if 'Unknown' in types:
+            match = f"({match} OR COALESCE({expr}, '') = '')"
+        return f" AND {column} IN (SELECT a.{key} FROM {table} a WHERE {cond} AND {match})", types
+
+    def _rollup_plan(self, start_date: str, end_date: str):
+        """Segments covering the window if rollups replace any of it, else None"""
+        if plan_window is None or not ROLLUP_MIN_DAYS or self._window_days(start_date, end_date) < ROLLUP_MIN_DAYS:
+            return None
+        conn = self._connect()
+        try:
+            rolled = get_rolled_through(conn)
+        finally:
+            conn.close()
+        plan = plan_window(start_date, end_date, rolled) if rolled else None
+        if not plan or all(grain == 'day' for grain, _, _ in plan):
+            return None
+        return plan
 
+    def _has_day_key(self):
+        """
+        True once day_keys.py has finished backfilling the history table, not
+        merely added the column (archives are covered by the view)
+        """
+        if day_key_ready is None:
+            return False
+        if self._day_key is None:
+            conn = self._connect()
+            try:
+                self._day_key = day_key_ready(conn, HISTORY_TABLE)
+            finally:
+                conn.close()
+        return self._day_key
+
+    def _daily_rows_sql(self, start_date: str, end_date: str, day_keys=None):
+        """
+        (sql, params) for (nc_code, check_date, total_available) rows of a date
+        range: an index-only range scan on day_key when the column exists,
+        with the dates given back as text
+        """
+        if day_keys is None:
+            day_keys = self._has_day_key()
+        only, only_params = self._listing_filter_sql()
+        if day_keys:
+            return (f"SELECT nc_code, {date_from_key_sql('day_key')} AS check_date, total_available "
+                    f"FROM {self.history_table} WHERE day_key >= ? AND day_key <= ?{only}",
+                    [day_key(start_date), day_key(end_date), *only_params])
+        return (f"SELECT nc_code, check_date, total_available FROM {self.history_table} "
+                f"WHERE check_date >= ? AND check_date <= ?{only}", [start_date, end_date, *only_params])
+
+    def _rollup_rows_sql(self, plan):
+        """
+        (sql, params) yielding (nc_code, check_date, total_available) for a
+        planned window: daily rows for 'day' segments, rollup points standing in
+        for the complete weeks/months (they fold to the same peak/low/dates)
+        """
+        parts, params = [], []
+        day_keys = self._has_day_key()
+        for grain, lo, hi in plan:
+            if grain == 'day':
+                sql, p = self._daily_rows_sql(lo, hi, day_keys)
+                parts.append(sql)
+                params += p
+            else:
+                sql, p = rollup_points_sql(grain, lo, hi)
+                only, only_params = self._listing_filter_sql()
+                if only:
+                    sql = f"SELECT * FROM (\n{sql}\n) WHERE 1{only}"
+                parts.append(sql)
+                params += p + only_params
+        logger.info("Window reads " + ', '.join(f"{g} {lo}..{hi}" for g, lo, hi in plan))
+        return "\nUNION ALL\n".join(parts), params
+
+    def _build_history_query(self, start_date: str, end_date: str):
+        """
+        Narrow window scan in (nc_code, check_date) index order; metadata is
+        fetched separately, once per product (see _get_product_metadata).
+        With day_key the scan reads only the (nc_code, day_key, total_available)
+        index and rows carry integer day keys instead of date strings.
+        """
+        plan = self._rollup_plan(start_date, end_date)
+        if plan is not None:
+            rows_sql, params = self._rollup_rows_sql(plan)
+            return f"SELECT nc_code, check_date, total_available FROM (\n{rows_sql}\n) ORDER BY nc_code, check_date", params
+        only, only_params = self._listing_filter_sql('h.nc_code')
+        if self._has_day_key():
+            query = f"""
+SELECT h.nc_code, h.day_key, h.total_available
+FROM {self.history_table} h
+WHERE h.day_key >= ? AND h.day_key <= ?{only}
+ORDER BY h.nc_code, h.day_key
+"""
+            return query, [day_key(start_date), day_key(end_date), *only_params]
+        query = f"""
+SELECT h.nc_code, h.check_date, h.total_available
+FROM {self.history_table} h
+WHERE h.check_date >= ? AND h.check_date <= ?{only}
+ORDER BY h.nc_code, h.check_date
+"""
+        return query, [start_date, end_date, *only_params]
+
+    def _get_product_metadata(self, nc_codes, chunk_size=500):
+        """alcohol metadata per product, keyed by str(nc_code); products without a row are absent"""
+        meta_parts = self._alcohol_select_parts()
+        table, key, cond = self._product_source()
+        out = {}
+        for i in range(0, len(nc_codes), chunk_size):
+            chunk = nc_codes[i:i + chunk_size]
+            query = (f"SELECT a.{key} AS nc_code, {', '.join(meta_parts)} FROM {table} a "
+                     f"WHERE a.{key} IN ({','.join(['?'] * len(chunk))}) AND {cond}")
+            for r in self.execute_query(query, chunk):
+                out.setdefault(str(r['nc_code']), r)
+        return out
+
+    def _build_pushdown_query(self, start_date: str, end_date: str):
+        """
+        Report semantics computed inside SQLite, one row per product: one window
+        pass gives the partition max and each row's suffix minimum; the last
+        peak row's suffix minimum is the low, and its last occurrence after the
+        peak is the low date. current = latest value in the DB (index seek per
+        product), plus alcohol metadata.
+        """
+        meta_parts = self._alcohol_select_parts()
+        table, key, cond = self._product_source()
+        plan = self._rollup_plan(start_date, end_date)
+        if plan is not None:
+            rows_sql, params = self._rollup_rows_sql(plan)
+        else:
+            rows_sql, params = self._daily_rows_sql(start_date, end_date)
+        latest = 'c.day_key' if self._has_day_key() else 'c.check_date'
+        query = f"""
+WITH w AS (
+  SELECT h.nc_code, h.check_date, COALESCE(h.total_available, 0) AS v
+  FROM ({rows_sql}) h
+),
+s AS (
+  SELECT nc_code, check_date, v,
+         MAX(v) OVER p AS peak,
+         MIN(v) OVER (p ORDER BY check_date ROWS BETWEEN CURRENT ROW AND UNBOUNDED FOLLOWING) AS suffix_min,
+         MAX(check_date) OVER p AS last_date
+  FROM w
+  WINDOW p AS (PARTITION BY nc_code)
+),
+-- bare columns come from the MAX(check_date) row, i.e. the last peak; its suffix_min is the low
+peaks AS (
+  SELECT nc_code, peak, MAX(check_date) AS peak_date, suffix_min AS low, last_date
+  FROM s WHERE v = peak GROUP BY nc_code
+),
+stats AS (
+  SELECT pk.nc_code, pk.peak, pk.peak_date, pk.low, MAX(s.check_date) AS low_date, pk.last_date
+  FROM peaks pk
+  JOIN s ON s.nc_code = pk.nc_code AND s.check_date >= pk.peak_date AND s.v = pk.low
+  GROUP BY pk.nc_code
+)
+SELECT
+  st.nc_code, {", ".join(meta_parts)},
+  st.peak, st.peak_date, st.low, st.low_date, st.last_date,
+  (SELECT COALESCE(c.total_available, 0) FROM {self.history_table} c
+   WHERE c.nc_code = st.nc_code ORDER BY {latest} DESC LIMIT 1) AS current_inventory
+FROM stats st
+JOIN {table} a ON a.{key} = st.nc_code AND {cond}
+"""
+        return query, params
+
+    def _process_pushdown_rows(self, rows):
+        out = []
+        seen = set()
+        for r in rows:
+            code = r['nc_code']
+            if code in seen:
+                continue  # duplicate alcohol rows: first wins, as in _get_product_metadata
+            seen.add(code)
+            pd = self._product_meta(r)
+            pd['last_updated'] = r['last_date']
+            out.append(self._product_record(pd, code, r['current_inventory'] or 0,
+                                            r['peak'], r['peak_date'], r['low'], r['low_date']))
+        return self._sort_products(out)
+
+    def _window_days(self, start_date: str, end_date: str):
+        return (datetime.strptime(end_date, '%Y-%m-%d') - datetime.strptime(start_date, '%Y-%m-%d')).days
+
+    def _load_engine_calibration(self):
+        try:
+            return json.loads((self.log_dir / ENGINE_CALIBRATION_FILE).read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return {}
+
+    def _select_engine(self, start_date: str, end_date: str, sparklines=False):
+        if self.engine in ('python', 'sql'):
+            return self.engine
+        # Feeding a sparkline collector costs the sql engine a second window scan: compare like with like
+        python_key, sql_key = ('python_sparklines', 'sql_sparklines') if sparklines else ('python', 'sql')
+        timings = [t for t in self._load_engine_calibration().values() if sql_key in t and python_key in t]
+        if not timings:
+            return 'python'
+        days = self._window_days(start_date, end_date)
+        nearest = min(timings, key=lambda t: abs(t['days'] - days))
+        return 'sql' if nearest[sql_key] < nearest[python_key] else 'python'
+
+    def _get_compacted_through(self):
+        """compacted_through marker if run-length compacted history exists, else None"""
+        try:
+            rows = self.execute_query(
+                "SELECT value FROM warehouse_compaction_state WHERE key = 'compacted_through'")
+            return rows[0]['value'] if rows else None
+        except sqlite3.OperationalError:
+            return None
+
+    def _build_runs_query(self, start_date: str, end_date: str, compacted_through: str):
+        """
+        Change runs overlapping the window, plus raw daily rows newer than the
+        compaction marker as single-day runs, with alcohol metadata per run.
+        """
+        meta_parts = self._alcohol_select_parts()
+        table, key, cond = self._product_source()
+        select_parts = ["s.nc_code", *meta_parts, "s.from_date", "s.to_date", "s.total_available", "s.is_run"]
+        runs_only, only_params = self._listing_filter_sql('r.nc_code')
+        rows_only, _ = self._listing_filter_sql('h.nc_code')
         query = f"""
+WITH segs AS (
+  SELECT r.nc_code, r.from_date, r.to_date, r.total_available, 1 AS is_run
+  FROM warehouse_inventory_runs r
+  WHERE r.from_date <= ? AND r.to_date >= ?{runs_only}
+  UNION ALL
+  SELECT h.nc_code, h.check_date, h.check_date, h.total_available, 0
+  FROM warehouse_inventory_history_v2 h
+  WHERE h.check_date > ? AND h.check_date >= ? AND h.check_date <= ?{rows_only}
+)
 SELECT
   {", ".join(select_parts)}
-FROM warehouse_inventory_history_v2 h
-JOIN alcohol a ON h.nc_code = a.nc_code
-WHERE h.check_date >= ? AND h.check_date <= ?
-ORDER BY brand_name, h.nc_code, h.check_date
+FROM segs s
+JOIN {table} a ON s.nc_code = a.{key} AND {cond}
+ORDER BY brand_name, s.nc_code, s.from_date
 """
-        return query, [start_date, end_date]
+        return query, [end_date, start_date, *only_params, compacted_through, start_date, end_date, *only_params]
+
+    def _get_current_inventory_from_runs(self, nc_codes, compacted_through):
+        """Latest value per product: newest raw row after the marker, else the newest run"""
+        wanted = set(nc_codes)
+        current = {}
+        try:
+            for r in self.execute_query(
+                    "SELECT nc_code, total_available, MAX(to_date) AS d FROM warehouse_inventory_runs GROUP BY nc_code"):
+                if r['nc_code'] in wanted:
+                    current[r['nc_code']] = r['total_available'] or 0
+            for r in self.execute_query(
+                    "SELECT nc_code, total_available, MAX(check_date) AS d "
+                    "FROM warehouse_inventory_history_v2 WHERE check_date > ? GROUP BY nc_code", [compacted_through]):
+                if r['nc_code'] in wanted:
+                    current[r['nc_code']] = r['total_available'] or 0
+        except Exception as e:
+            logger.error(f"Error retrieving current inventory from runs: {e}")
+            return {code: 0 for code in nc_codes}
+        return current
+
+    def _process_run_data(self, raw_runs, window_dates, compacted_through, sparklines=None):
+        """
+        Same semantics as _process_inventory_data, computed from change runs:
+        runs are clipped to the check_dates inside the window, peak is the run
+        holding the last occurrence of the max, low the last min at/after it.
+        """
+        products = {}
+        for r in raw_runs:
+            code = r['nc_code']
+            p = products.get(code)
+            if p is None:
+                p = products[code] = self._product_meta(r)
+                p['segments'] = []
+            lo, hi = r['from_date'], r['to_date']
+            if r['is_run']:
+                # Clip to the compacted check_dates actually inside the window
+                i = bisect_left(window_dates, lo)
+                j = bisect_right(window_dates, hi) - 1
+                if i > j:
+                    continue
+                lo, hi = window_dates[i], window_dates[j]
+            p['segments'].append((lo, hi, r['total_available'] or 0))
+            if sparklines is not None:
+                # A run is flat, so its end points carry its whole shape
+                sparklines.add(code, lo, r['total_available'] or 0)
+                if hi != lo:
+                    sparklines.add(code, hi, r['total_available'] or 0)
+
+        current_map = self._get_current_inventory_from_runs(list(products.keys()), compacted_through)
+
+        out = []
+        for code, pd in products.items():
+            segs = pd.pop('segments')
+            if not segs:
+                continue
+            peak_inventory = max(v for _, _, v in segs)
+            peak_date = max(hi for _, hi, v in segs if v == peak_inventory)
+            after_peak = [(lo, hi, v) for lo, hi, v in segs if hi >= peak_date]
+            low_inventory = min(v for _, _, v in after_peak)
+            low_date = max(hi for _, hi, v in after_peak if v == low_inventory)
+            pd['last_updated'] = max(hi for _, hi, _ in segs)
+            out.append(self._product_record(pd, code, current_map.get(code, 0),
+                                            peak_inventory, peak_date, low_inventory, low_date))
+        return self._sort_products(out)
 
     # ---------- Report generation ----------
-    def _get_time_periods(self):
-        today = datetime.now()
+    def _get_time_periods(self, as_of=None):
+        today = as_of or datetime.now()
         start_of_month = today.replace(day=1)
         end_of_today = today.replace(hour=23, minute=59, second=59, microsecond=999999)
         return {
             'current_month': {'start': start_of_month,           'end': end_of_today, 'description': 'Current month'},
             'last_30_days':  {'start': today - timedelta(days=30),'end': end_of_today, 'description': 'Last 30 days'},
             'last_90_days':  {'start': today - timedelta(days=90),'end': end_of_today, 'description': 'Last 90 days'},
+            'last_180_days': {'start': today - timedelta(days=180),'end': end_of_today, 'description': 'Last 180 days'},
         }
 
     def _get_current_inventory_for_products(self, nc_codes):
         if not nc_codes:
             return {}
         placeholders = ','.join(['?'] * len(nc_codes))
+        date_col = 'day_key' if self._has_day_key() else 'check_date'
         query = f"""
-SELECT w1.nc_code, w1.total_available, w1.check_date
-FROM warehouse_inventory_history_v2 w1
+SELECT w1.nc_code, w1.total_available, w1.{date_col}
+FROM {self.history_table} w1
 JOIN (
-  SELECT nc_code, MAX(check_date) AS max_date
-  FROM warehouse_inventory_history_v2
+  SELECT nc_code, MAX({date_col}) AS max_date
+  FROM {self.history_table}
   WHERE nc_code IN ({placeholders})
   GROUP BY nc_code
-) r ON r.nc_code = w1.nc_code AND r.max_date = w1.check_date
+) r ON r.nc_code = w1.nc_code AND r.max_date = w1.{date_col}
 """
         try:
             rows = self.execute_query(query, nc_codes)
@@ -220,197 +636,528 @@ JOIN (
             logger.error(f"Error retrieving current inventory: {e}")
             return {code: 0 for code in nc_codes}
 
-    def _process_inventory_data(self, raw_data):
-        # Group rows by nc_code
-        products = {}
-        for r in raw_data:
-            code = r['nc_code']
-            p = products.setdefault(code, {
-                'nc_code': code,
-                'brand_name': r.get('brand_name'),
-                'product_name': r.get('product_name'),
-                'listing_type': r.get('listing_type') or 'Unknown',
-                'retail_price': r.get('retail_price'),
-                'supplier': r.get('supplier'),
-                'broker': r.get('broker'),
-                'plu': r.get('plu'),
-                'has_image': bool(r.get('has_image')),
-                'image_path': r.get('image_path'),
-                'image_url': r.get('image_url'),
-                'inventory_records': [],
-                'last_updated': None,
-            })
-            p['inventory_records'].append({
-                'check_date': r['check_date'],
-                'total_available': r['total_available'] or 0
-            })
-            if p['last_updated'] is None or r['check_date'] > p['last_updated']:
-                p['last_updated'] = r['check_date']
+    def _product_meta(self, r):
+        return {
+            'nc_code': r['nc_code'],
+            'brand_name': r.get('brand_name'),
+            'product_name': r.get('product_name'),
+            'listing_type': r.get('listing_type') or 'Unknown',
+            'retail_price': r.get('retail_price'),
+            'supplier': r.get('supplier'),
+            'broker': r.get('broker'),
+            'plu': r.get('plu'),
+            'has_image': bool(r.get('has_image')),
+            'image_path': r.get('image_path'),
+            'image_url': r.get('image_url'),
+            'last_updated': None,
+        }
 
-        # absolute current inventory (latest in DB, not window-bounded)
-        current_map = self._get_current_inventory_for_products(list(products.keys()))
+    def _thumbnail_urls(self, code):
+        if self._thumbnails is None:
+            self._thumbnails = thumbnail_urls(load_manifest(self.output_dir)) if thumbnail_urls else {}
+        return self._thumbnails.get(str(code))
 
-        out = []
-        for code, pd in products.items():
-            recs = sorted(pd['inventory_records'], key=lambda x: x['check_date'])
-            current_inventory = current_map.get(code, 0)
-
-            if recs:
-                # Peak = most recent occurrence of the maximum value
-                peak_inventory = max(rec['total_available'] for rec in recs)
-                peak_candidates = [rec for rec in recs if rec['total_available'] == peak_inventory]
-                peak_row = max(peak_candidates, key=lambda rec: _safe_iso_parse(rec['check_date']))
-                peak_date = peak_row['check_date']
-
-                # Low = last occurrence of the minimum at/after the chosen peak date
-                after_peak = [rec for rec in recs if _safe_iso_parse(rec['check_date']) >= _safe_iso_parse(peak_date)]
-                if after_peak:
-                    low_inventory_val = min(rec['total_available'] for rec in after_peak)
-                    low_candidates = [rec for rec in after_peak if rec['total_available'] == low_inventory_val]
-                    low_row = max(low_candidates, key=lambda rec: _safe_iso_parse(rec['check_date']))
-                    low_inventory = low_inventory_val
-                    low_date = low_row['check_date']
-                else:
-                    # fallback to global last minimum
-                    low_inventory_val = min(rec['total_available'] for rec in recs)
-                    low_candidates = [rec for rec in recs if rec['total_available'] == low_inventory_val]
-                    low_row = max(low_candidates, key=lambda rec: _safe_iso_parse(rec['check_date']))
-                    low_inventory = low_inventory_val
-                    low_date = low_row['check_date']
-            else:
-                peak_inventory = low_inventory = current_inventory = 0
-                peak_date = low_date = None
-
-            out.append({
-                'plu': pd.get('plu'),
-                'nc_code': code,
-                'product_name': pd['product_name'] or pd['brand_name'] or 'Unknown Product',
-                'brand_name': pd['brand_name'],
-                'listing_type': pd['listing_type'],
-                'retail_price': pd['retail_price'],
-                'supplier': pd['supplier'],
-                'broker': pd['broker'],
-                'current_inventory': current_inventory,
-                'peak_inventory': peak_inventory,
-                'peak_inventory_date': peak_date,
-                'low_inventory': low_inventory,
-                'low_inventory_date': low_date,
-                'last_updated': pd['last_updated'],
-                'has_image': pd['has_image'],
-                'image_path': pd['image_path'],
-                'image_url': pd['image_url'],
-            })
-
-        # sort products by product_name then brand (null-safe)
+    def _product_record(self, pd, code, current_inventory, peak_inventory, peak_date, low_inventory, low_date):
+        thumbs = self._thumbnail_urls(code)
+        return {
+            'plu': pd.get('plu'),
+            'nc_code': code,
+            'product_name': pd['product_name'] or pd['brand_name'] or 'Unknown Product',
+            'brand_name': pd['brand_name'],
+            'listing_type': pd['listing_type'],
+            'retail_price': pd['retail_price'],
+            'supplier': pd['supplier'],
+            'broker': pd['broker'],
+            'current_inventory': current_inventory,
+            'peak_inventory': peak_inventory,
+            'peak_inventory_date': peak_date,
+            'low_inventory': low_inventory,
+            'low_inventory_date': low_date,
+            'last_updated': pd['last_updated'],
+            'has_image': pd['has_image'],
+            'image_path': pd['image_path'],
+            'image_url': pd['image_url'],
+            'thumbnail_url': thumbs[min(thumbs, key=int)] if thumbs else None,
+            'thumbnails': thumbs,
+        }
+
+    def _sort_products(self, out):
+        # sort products by product_name then brand (null-safe); exact brand ties keep nc_code order
         out.sort(key=lambda p: ((p.get('product_name') or p.get('brand_name') or '').lower(),
-                                (p.get('brand_name') or '').lower()))
+                                (p.get('brand_name') or '').lower(),
+                                p.get('brand_name') is not None, p.get('brand_name') or ''))
         return out
 
-    def generate_warehouse_report(self, time_period, date_range):
+    def _process_inventory_data(self, rows, sparklines=None):
+        """
+        rows: (nc_code, check_date, total_available) ordered by nc_code, check_date;
+        check_date may be an integer day key (only the reported dates are converted).
+        One pass per product: peak = last occurrence of the max, low = last
+        occurrence of the min at/after that peak.
+        """
+        windows = {}  # nc_code -> [peak, peak_date, low, low_date, last_date]
+        for code, check_date, total in rows:
+            v = total or 0
+            if sparklines is not None:
+                sparklines.add(code, check_date, v)
+            w = windows.get(code)
+            if w is None:
+                windows[code] = [v, check_date, v, check_date, check_date]
+                continue
+            if v >= w[0]:
+                w[0] = w[2] = v
+                w[1] = w[3] = check_date
+            elif v <= w[2]:
+                w[2] = v
+                w[3] = check_date
+            w[4] = check_date
+
+        codes = list(windows.keys())
+        metadata = self._get_product_metadata(codes)
+        # absolute current inventory (latest in DB, not window-bounded)
+        current_map = self._get_current_inventory_for_products(codes)
+
+        out = []
+        for code, (peak_inventory, peak_date, low_inventory, low_date, last_date) in windows.items():
+            r = metadata.get(str(code))
+            if r is None:
+                continue  # no alcohol row: not reportable
+            if isinstance(last_date, int):
+                peak_date, low_date, last_date = (day_key_to_date(peak_date), day_key_to_date(low_date),
+                                                  day_key_to_date(last_date))
+            pd = self._product_meta(r)
+            pd['last_updated'] = last_date
+            out.append(self._product_record(pd, code, current_map.get(code, 0),
+                                            peak_inventory, peak_date, low_inventory, low_date))
+
+        return self._sort_products(out)
+
+    def _build_report_products(self, time_period, date_range, sparklines=None):
+        """Sorted product records for one window; optionally feeds a SparklineCollector"""
         logger.info(f"Generating report for {time_period} ({date_range['description']})")
         start_date = date_range['start'].strftime('%Y-%m-%d')
         end_date = date_range['end'].strftime('%Y-%m-%d')
 
-        query, params = self._build_raw_query(start_date, end_date)
-        raw = self.execute_query(query, params)
-        logger.info(f"Retrieved {len(raw)} rows from {start_date}..{end_date}")
+        compacted_through = self._get_compacted_through() if HISTORY_SOURCE == 'runs' else None
+        if HISTORY_SOURCE == 'runs' and not compacted_through:
+            logger.warning("HISTORY_SOURCE=runs but no compacted history found; scanning daily rows.")
 
-        products = self._process_inventory_data(raw)
-        logger.info(f"Processed {len(products)} products")
+        if compacted_through:
+            window_dates = [r['check_date'] for r in self.execute_query(
+                "SELECT check_date FROM warehouse_check_dates WHERE check_date >= ? AND check_date <= ? "
+                "ORDER BY check_date", [start_date, end_date])]
+            query, params = self._build_runs_query(start_date, end_date, compacted_through)
+            raw = self.execute_query(query, params)
+            logger.info(f"Retrieved {len(raw)} runs from {start_date}..{end_date}")
+            products = self._process_run_data(raw, window_dates, compacted_through, sparklines)
+            engine = 'runs'
+        else:
+            self._use_archives_for(start_date, end_date)
+            engine = self._select_engine(start_date, end_date, sparklines is not None)
+            try:
+                if engine == 'sql':
+                    query, params = self._build_pushdown_query(start_date, end_date)
+                    products = self._process_pushdown_rows(self.execute_query(query, params))
+                    if sparklines is not None:
+                        # Only aggregates crossed over; series need their own narrow scan
+                        query, params = self._build_history_query(start_date, end_date)
+                        conn = self._connect()
+                        try:
+                            for code, check_date, total in conn.execute(query, params):
+                                sparklines.add(code, check_date, total)
+                        finally:
+                            conn.close()
+                else:
+                    query, params = self._build_history_query(start_date, end_date)
+                    conn = self._connect()
+                    try:
+                        products = self._process_inventory_data(conn.execute(query, params), sparklines)
+                    finally:
+                        conn.close()
+            finally:
+                self._reset_history_source()
+        logger.info(f"Processed {len(products)} products ({engine} engine)")
+        return products
 
-        meta = {
+    def _report_meta(self, time_period, date_range, totals: ReportMetaAccumulator):
+        return {
             'time_period': time_period,
             'description': date_range['description'],
             'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'start_date': start_date,
-            'end_date': end_date,
-            'total_products': len(products),
-            'products_with_inventory': sum(1 for p in products if (p['current_inventory'] or 0) > 0),
-            'products_with_images': sum(1 for p in products if p['has_image']),
-            'total_inventory': sum(p['current_inventory'] or 0 for p in products),
-            'listing_type_counts': self._count_by_listing_type(products),
+            'start_date': date_range['start'].strftime('%Y-%m-%d'),
+            'end_date': date_range['end'].strftime('%Y-%m-%d'),
+            **totals.fields(),
             'file_modified': int(datetime.now().timestamp()),
         }
-        return {'meta': meta, 'products': products}
 
-    def _count_by_listing_type(self, products):
-        out = {}
+    def generate_warehouse_report(self, time_period, date_range):
+        """In-memory {'meta', 'products'} report"""
+        products = self._build_report_products(time_period, date_range)
+        totals = ReportMetaAccumulator()
         for p in products:
-            lt = p['listing_type'] or 'Unknown'
-            d = out.setdefault(lt, {'count': 0, 'inventory': 0})
-            d['count'] += 1
-            d['inventory'] += p['current_inventory'] or 0
-        return out
+            totals.add(p)
+        return {'meta': self._report_meta(time_period, date_range, totals), 'products': products}
+
+    def _sparkline_collector(self, date_range):
+        """SparklineCollector for a window, or None when SPARKLINE_POINTS=0"""
+        if SPARKLINE_POINTS <= 0:
+            return None
+        return SparklineCollector(date_range['start'].strftime('%Y-%m-%d'),
+                                  date_range['end'].strftime('%Y-%m-%d'), SPARKLINE_POINTS)
+
+    def publish_report(self, time_period, date_range, products, sparkline_sidecar=None, **meta_fields):
+        """Stream sorted products (and their sparkline sidecar) to the live files; returns the meta block"""
+        totals = ReportMetaAccumulator()
+        with self._report_writer(time_period) as writer:
+            for p in products:
+                totals.add(p)
+                writer.write_product(p)
+            meta = self._report_meta(time_period, date_range, totals)
+            meta.update(meta_fields)
+            writer.set_meta(meta)
+        if sparkline_sidecar is not None:
+            path = write_compact_json_atomic(self.output_dir / f"warehouse_sparklines_{time_period}.json",
+                                             sparkline_sidecar, None if DEV_MODE else FILE_MODE)
+            logger.info(f"Wrote {path}")
+        return meta
+
+    def stream_warehouse_report(self, time_period, date_range):
+        """Build one window and stream it (and its sparkline sidecar) to disk; returns the meta block"""
+        sparklines = self._sparkline_collector(date_range)
+        products = self._build_report_products(time_period, date_range, sparklines)
+        sidecar = None
+        if sparklines is not None:
+            sidecar = sparklines.to_sidecar(time_period, [p['nc_code'] for p in products])
+        return self.publish_report(time_period, date_range, products, sidecar)
 
     # ---------- Writing ----------
+    def _report_writer(self, time_period):
+        return StreamingReportWriter(self.output_dir, time_period,
+                                     json_output='json' in REPORT_FORMATS, ndjson='ndjson' in REPORT_FORMATS,
+                                     file_mode=None if DEV_MODE else FILE_MODE)
+
     def write_report_files(self, report, time_period):
         try:
-            self.output_dir.mkdir(parents=True, exist_ok=True)
-            # main
-            name = f"warehouse_inventory_{time_period}.json"
-            tmp = self.output_dir / f"{name}.tmp"
-            final = self.output_dir / name
-            with open(tmp, 'w', encoding='utf-8') as f:
-                json.dump(report, f, indent=2, ensure_ascii=False)
-            os.replace(tmp, final)
-            if not DEV_MODE:
-                os.chmod(final, FILE_MODE)
-            logger.info(f"Wrote {final}")
-            # metadata
-            meta_name = f"{time_period}_metadata.json"
-            meta_tmp = self.output_dir / f"{meta_name}.tmp"
-            meta_final = self.output_dir / meta_name
-            with open(meta_tmp, 'w', encoding='utf-8') as f:
-                json.dump(report['meta'], f, indent=2, ensure_ascii=False)
-            os.replace(meta_tmp, meta_final)
-            if not DEV_MODE:
-                os.chmod(meta_final, FILE_MODE)
-            logger.info(f"Wrote {meta_final}")
+            with self._report_writer(time_period) as writer:
+                for p in report['products']:
+                    writer.write_product(p)
+                writer.set_meta(report['meta'])
             return True
         except Exception as e:
             logger.error(f"Write failed for {time_period}: {e}")
             return False
 
-    def generate_all_reports(self):
+    def compare_engines(self, periods=None):
+        """
+        Build each daily-history window with both engines and log any difference.
+        With SPARKLINE_POINTS on, each engine is also timed feeding the sidecar
+        (and the series compared). Writes no reports; the timings are saved as
+        the calibration 'auto' uses.
+        """
+        self._open_snapshot()
+        all_periods = self._get_time_periods()
+        saved_engine, ok = self.engine, True
+        calibration = self._load_engine_calibration()
+        try:
+            for tp in periods or all_periods:
+                dr = all_periods[tp]
+                built, sidecars, timing = {}, {}, {}
+                for engine in ('python', 'sql'):
+                    self.engine = engine
+                    t0 = datetime.now()
+                    built[engine] = self._build_report_products(tp, dr)
+                    timing[engine] = (datetime.now() - t0).total_seconds()
+                    logger.info(f"{tp}: {engine} engine {timing[engine]:.2f}s")
+                    sparklines = self._sparkline_collector(dr)
+                    if sparklines is not None:
+                        t0 = datetime.now()
+                        products = self._build_report_products(tp, dr, sparklines)
+                        sidecars[engine] = sparklines.to_sidecar(tp, [p['nc_code'] for p in products])
+                        key = f"{engine}_sparklines"
+                        timing[key] = (datetime.now() - t0).total_seconds()
+                        logger.info(f"{tp}: {engine} engine with sparklines {timing[key]:.2f}s")
+                calibration[tp] = dict(timing, days=self._window_days(dr['start'].strftime('%Y-%m-%d'),
+                                                                      dr['end'].strftime('%Y-%m-%d')),
+                                       measured_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+                if sidecars and sidecars['python'] != sidecars['sql']:
+                    ok = False
+                    logger.error(f"{tp}: engines build different sparkline series")
+                py, sql = built['python'], built['sql']
+                if py == sql:
+                    logger.info(f"{tp}: engines agree on {len(py)} products")
+                    continue
+                ok = False
+                py_by, sql_by = {p['nc_code']: p for p in py}, {p['nc_code']: p for p in sql}
+                diff = [c for c in py_by.keys() | sql_by.keys() if py_by.get(c) != sql_by.get(c)]
+                logger.error(f"{tp}: engines differ on {len(diff)} products "
+                             f"(python {len(py)}, sql {len(sql)}), e.g. {sorted(map(str, diff))[:5]}")
+                if not diff:
+                    logger.error(f"{tp}: same products, different order")
+        finally:
+            self.engine = saved_engine
+        write_json_atomic(self.log_dir / ENGINE_CALIBRATION_FILE, calibration)
+        return ok
+
+    def generate_all_reports(self, only=None, on_period=None, tiers=None):
+        """
+        Build and publish every window (or `only` these). With REPORT_TIERS set,
+        each window is reassembled from tier slices: `tiers` names the slices to
+        refresh, None the catalogue (every product).
+        """
+        if self.tiers is None:
+            if tiers:
+                logger.error(f"Tiers {', '.join(tiers)} requested but REPORT_TIERS is not set.")
+                return False
+            run_tiers = None
+        else:
+            try:
+                run_tiers = select_tiers(self.tiers, tiers)
+            except ValueError as e:
+                logger.error(str(e))
+                return False
+            logger.info(f"Refreshing tier(s) {', '.join(t['name'] for t in run_tiers)}")
+        # thumbnails and shipments change with the catalogue, not with a hot slice
+        full_run = run_tiers is None or any(t['listing_types'] is None for t in run_tiers)
+
+        self._products = None
+        # The snapshot (if any) stays open so a later run in this process can reuse it
+        self._open_snapshot()
         if not self.test_database_connection():
             logger.error("Aborting due to DB failure.")
             return False
 
+        if full_run and THUMBNAILS and build_thumbnails is not None:
+            try:
+                build_thumbnails(self, None if DEV_MODE else FILE_MODE)
+            except Exception as e:
+                logger.error(f"Thumbnail build failed: {e}")
+            self._thumbnails = None
+
         periods = self._get_time_periods()
+        if only:
+            periods = {tp: dr for tp, dr in periods.items() if tp in only}
         results = {}
         ok_count = 0
         for tp, dr in periods.items():
+            if on_period:
+                on_period(tp, 'started')
             try:
-                report = self.generate_warehouse_report(tp, dr)
-                ok = self.write_report_files(report, tp)
-                results[tp] = {'success': ok, 'meta': report['meta'] if ok else None, 'error': None if ok else 'Write failed'}
-                if ok: ok_count += 1
+                if run_tiers is None:
+                    meta = self.stream_warehouse_report(tp, dr)
+                else:
+                    meta = refresh_tier_window(self, run_tiers, tp, dr, None if DEV_MODE else FILE_MODE)
+                results[tp] = {'success': True, 'meta': meta, 'error': None}
+                ok_count += 1
             except Exception as e:
                 logger.error(f"Failed for {tp}: {e}")
                 results[tp] = {'success': False, 'meta': None, 'error': str(e)}
+            if on_period:
+                on_period(tp, 'done' if results[tp]['success'] else 'failed')
 
-        # index
+        # index (a partial run keeps the other periods' entries)
         try:
-            idx = self.output_dir / 'reports_index.json'
-            tmp = self.output_dir / 'reports_index.json.tmp'
-            with open(tmp, 'w', encoding='utf-8') as f:
-                json.dump({'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                           'dev_mode': DEV_MODE, 'reports': results}, f, indent=2, ensure_ascii=False)
-            os.replace(tmp, idx)
-            if not DEV_MODE:
-                os.chmod(idx, FILE_MODE)
+            idx_path = self.output_dir / 'reports_index.json'
+            reports = {}
+            if only and idx_path.exists():
+                try:
+                    reports = json.loads(idx_path.read_text(encoding='utf-8')).get('reports', {})
+                except ValueError:
+                    logger.warning(f"Ignoring unreadable {idx_path}")
+            reports.update(results)
+            idx = write_json_atomic(idx_path,
+                                    {'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                                     'dev_mode': DEV_MODE, 'reports': reports},
+                                    None if DEV_MODE else FILE_MODE)
             logger.info(f"Wrote index {idx}")
         except Exception as e:
             logger.error(f"Index write failed: {e}")
 
+        # search index over every window on disk (a partial run reuses the others' files)
+        if SEARCH_INDEX and build_search_index is not None and ok_count:
+            try:
+                build_search_index(self.output_dir, TIME_PERIODS, None if DEV_MODE else FILE_MODE)
+            except Exception as e:
+                logger.error(f"Search index build failed: {e}")
+
+        if CHANGE_EVENTS and update_event_feed is not None:
+            try:
+                update_event_feed(self, None if DEV_MODE else FILE_MODE)
+            except Exception as e:
+                logger.error(f"Event feed update failed: {e}")
+
+        if full_run and SHIPMENTS_REPORT and build_shipments_report is not None:
+            try:
+                build_shipments_report(self, None if DEV_MODE else FILE_MODE)
+            except Exception as e:
+                logger.error(f"Shipments report failed: {e}")
+
         logger.info(f"Done: {ok_count}/{len(periods)} succeeded")
         return ok_count == len(periods)
 
+# ------------------ Multiple sources ------------------
+def _isolate_source_logging(name, log_dir):
+    """In a source worker: log to <log_dir>/warehouse_generator.log only, tagged with the source name"""
+    fmt = logging.Formatter(f'%(asctime)s - %(levelname)s - [{name}] %(message)s')
+    for h in list(logger.handlers):
+        if isinstance(h, logging.FileHandler):
+            logger.removeHandler(h)
+            h.close()
+        else:
+            h.setFormatter(fmt)
+    Path(log_dir).mkdir(parents=True, exist_ok=True)
+    sfh = logging.FileHandler(Path(log_dir) / 'warehouse_generator.log')
+    sfh.setFormatter(fmt)
+    sfh.setLevel(logging.INFO)
+    logger.addHandler(sfh)
+
+
+def _run_source(source, periods=None, engine=None, snapshot=None):
+    """Worker: generate one source's reports; never raises, failures are reported in the result"""
+    name = source['name']
+    started = time.monotonic()
+    result = {'success': False, 'error': None, 'db_path': source['db_path'],
+              'output_dir': source['output_dir'], 'reports': None}
+    try:
+        _isolate_source_logging(name, source['log_dir'])
+        if not Path(source['db_path']).is_file():
+            raise FileNotFoundError(f"Database not found: {source['db_path']}")
+        gen = WarehouseInventoryGenerator(source['db_path'], source['output_dir'], source['log_dir'])
+        if engine:
+            gen.engine = engine
+        if snapshot:
+            gen.snapshot_mode = snapshot
+        result['success'] = gen.generate_all_reports(periods)
+        if not result['success']:
+            result['error'] = 'One or more reports failed'
+        idx = gen.output_dir / 'reports_index.json'
+        if idx.exists():
+            result['reports'] = json.loads(idx.read_text(encoding='utf-8')).get('reports')
+    except Exception as e:
+        logger.error(f"Source {name} failed: {e}")
+        result['error'] = str(e)
+    result['duration_seconds'] = round(time.monotonic() - started, 2)
+    return name, result
+
+
+def load_sources(config_path):
+    """
+    JSON config:
+      {"workers": 4,
+       "combined_index": "/opt/warehouse-reports/sources_index.json",
+       "sources": [{"name": "nc", "db_path": "...", "output_dir": "...", "log_dir": "..."}]}
+    log_dir defaults to <LOG_DIR>/<name>.
+    """
+    config = json.loads(Path(config_path).read_text(encoding='utf-8'))
+    sources = config.get('sources') or []
+    names = [s.get('name') for s in sources]
+    if not sources or not all(names) or len(set(names)) != len(names):
+        raise ValueError(f"{config_path}: 'sources' needs entries with unique names")
+    for s in sources:
+        missing = [k for k in ('db_path', 'output_dir') if not s.get(k)]
+        if missing:
+            raise ValueError(f"{config_path}: source {s['name']} is missing {', '.join(missing)}")
+        s.setdefault('log_dir', str(Path(LOG_DIR) / s['name']))
+    return config
+
+
+def run_sources(config, periods=None, engine=None, snapshot=None):
+    """
+    Generate every source in its own process (one per source up to `workers`), so
+    wall time tracks the slowest source. Each source keeps its own log, index and
+    failure; a combined index lists them all.
+    """
+    sources = config['sources']
+    workers = max(1, min(int(config.get('workers', len(sources))), len(sources)))
+    logger.info(f"Generating {len(sources)} sources with {workers} worker(s)")
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_run_source, s, periods, engine, snapshot) for s in sources]
+        for f, s in zip(futures, sources):
+            try:
+                name, result = f.result()
+            except Exception as e:  # worker process died
+                name, result = s['name'], {'success': False, 'error': f"Worker crashed: {e}",
+                                           'db_path': s['db_path'], 'output_dir': s['output_dir'], 'reports': None}
+            results[name] = result
+            status = 'ok' if result['success'] else f"FAILED ({result['error']})"
+            logger.info(f"Source {name}: {status} in {result.get('duration_seconds', '?')}s")
+
+    combined = Path(config.get('combined_index') or Path(OUTPUT_DIR) / 'sources_index.json')
+    combined.parent.mkdir(parents=True, exist_ok=True)
+    write_json_atomic(combined, {'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                                 'dev_mode': DEV_MODE, 'sources': results},
+                      None if DEV_MODE else FILE_MODE)
+    logger.info(f"Wrote combined index {combined}")
+    return all(r['success'] for r in results.values())
+
 # ------------------ Entrypoint ------------------
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate the warehouse inventory JSON reports")
+    parser.add_argument("periods", nargs="*", help="Time periods to generate (default: all)")
+    parser.add_argument("--engine", choices=["python", "sql", "auto"], default=REPORT_ENGINE,
+                        help=f"Peak/low engine for daily history (default: {REPORT_ENGINE})")
+    parser.add_argument("--sources", default=os.getenv('WAREHOUSE_SOURCES_CONFIG'),
+                        help="JSON config listing several inventory DBs to generate concurrently")
+    parser.add_argument("--snapshot", choices=SNAPSHOT_TARGETS, default=READ_SNAPSHOT,
+                        help=f"Read from a backup-API copy of the DB: file, memory or off (default: {READ_SNAPSHOT})")
+    parser.add_argument("--compare-engines", action="store_true",
+                        help="Build each window with both engines, report differences and timings, write nothing")
+    parser.add_argument("--tier", action="append", metavar="NAME",
+                        help="Refresh only this REPORT_TIERS slice (repeatable); default is the catalogue")
+    parser.add_argument("--due", action="store_true",
+                        help="Refresh whichever REPORT_TIERS slices are past their interval (for a frequent cron)")
+    parser.add_argument("--requested-by", default="command line",
+                        help="Who asked for this run (shown in generation_status.json)")
+    return parser.parse_args()
+
 def main():
-    logger.info("Starting Warehouse Inventory Report Generator")
+    args = parse_args()
+    unknown = [p for p in args.periods if p not in TIME_PERIODS]
+    if unknown:
+        # The backend may accept report types this generator does not build
+        logger.warning(f"Ignoring unknown time period(s): {', '.join(unknown)}")
+        args.periods = [p for p in args.periods if p in TIME_PERIODS]
+        if not args.periods:
+            logger.error("No known time periods requested.")
+            sys.exit(2)
+    if REPORT_TIERS:
+        try:
+            if parse_tiers is None:
+                raise ValueError("report_tiers.py is not deployed")
+            parse_tiers(REPORT_TIERS)
+        except ValueError as e:
+            logger.error(f"Bad REPORT_TIERS: {e}")
+            sys.exit(2)
+    if (args.tier or args.due) and (not REPORT_TIERS or args.sources):
+        logger.error("--tier/--due need REPORT_TIERS and a single source.")
+        sys.exit(2)
+    # One run at a time; requests arriving meanwhile are merged into a single follow-up run
+    coordinator = RunCoordinator(OUTPUT_DIR, TIME_PERIODS, None if DEV_MODE else FILE_MODE)
+    if args.sources:
+        try:
+            config = load_sources(args.sources)
+        except (OSError, ValueError) as e:
+            logger.error(f"Bad sources config: {e}")
+            sys.exit(2)
+        _, ok = coordinator.run(args.periods, args.requested_by,
+                                lambda periods, on_period: run_sources(config, periods, args.engine, args.snapshot))
+        sys.exit(0 if ok else 1)
     gen = WarehouseInventoryGenerator()
-    ok = gen.generate_all_reports()
+    gen.engine = args.engine
+    gen.snapshot_mode = args.snapshot
+    if args.compare_engines:
+        ok = gen.compare_engines(args.periods)
+        sys.exit(0 if ok else 1)
+    tiers = args.tier
+    if args.due:
+        tiers = due_tiers(gen.output_dir, gen.tiers, TIME_PERIODS)
+        if not tiers:
+            logger.info("No report tier is due.")
+            return
+    logger.info("Starting Warehouse Inventory Report Generator")
+    ran, ok = coordinator.run(args.periods, args.requested_by, gen.generate_all_reports, tiers)
+    if not ran:
+        return
     if not ok:
         logger.error("One or more reports failed.")
         sys.exit(1)